@@ -0,0 +1,165 @@
+"""Compare gunicorn sync workers with uvicorn on a slow query endpoint.
+
+Starts each server in turn against a generated input file, fires the same
+number of requests at several concurrency levels and prints the throughput
+and latency percentiles as JSON. Run from the repository root:
+
+    python benchmarks/asgi_vs_wsgi.py --lines 2000000 --concurrency 1 10 100
+
+The sync server answers ``/files/...`` and the ASGI server the equivalent
+``/async/files/...`` URL; both run the shell script backend by default, so
+every request forks a script that scans the whole file.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.generate_input import write_input  # noqa: E402
+
+SERVERS = {
+    "gunicorn-sync": (
+        [
+            "gunicorn",
+            "core.wsgi:application",
+            "--workers",
+            "{workers}",
+            "--bind",
+            "127.0.0.1:{port}",
+        ],
+        "/files/{query}",
+    ),
+    "uvicorn": (
+        [
+            "uvicorn",
+            "core.asgi:application",
+            "--workers",
+            "{workers}",
+            "--port",
+            "{port}",
+            "--log-level",
+            "warning",
+        ],
+        "/async/files/{query}",
+    ),
+}
+
+
+def wait_until_up(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server did not start: {url}")
+
+
+def fetch(url):
+    start = time.perf_counter()
+    with urllib.request.urlopen(url, timeout=600) as response:
+        response.read()
+    return time.perf_counter() - start
+
+
+def run_level(url, concurrency, requests):
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        start = time.perf_counter()
+        latencies = sorted(executor.map(fetch, [url] * requests))
+        elapsed = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "requests_per_second": round(requests / elapsed, 2),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1),
+        "max_ms": round(latencies[-1] * 1000, 1),
+    }
+
+
+def benchmark(name, args, media_root):
+    command, url_path = SERVERS[name]
+    command = [
+        part.format(workers=args.workers, port=args.port) for part in command
+    ]
+    env = dict(
+        os.environ,
+        MEDIA_ROOT=media_root,
+        DEBUG="False",
+        ALLOWED_HOSTS="127.0.0.1",
+        # Measure the query itself, not the result cache.
+        FILES_RESULT_CACHE_MAX_BYTES="0",
+    )
+    server = subprocess.Popen(
+        command, cwd=ROOT, env=env, stderr=subprocess.DEVNULL
+    )
+    base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        wait_until_up(f"{base_url}/files/")
+        url = base_url + url_path.format(query=args.query)
+        fetch(url)  # warm-up
+        return [
+            run_level(url, concurrency, max(args.requests, concurrency))
+            for concurrency in args.concurrency
+        ]
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--lines", type=int, default=500_000)
+    parser.add_argument(
+        "--concurrency", type=int, nargs="+", default=[1, 10, 50, 200]
+    )
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument(
+        "--query", default="users_range_messages/benchmark/0/500000000/"
+    )
+    parser.add_argument(
+        "--servers", nargs="+", choices=SERVERS, default=list(SERVERS)
+    )
+    parser.add_argument("--output", help="also write the results here")
+    args = parser.parse_args()
+
+    media_root = tempfile.mkdtemp()
+    try:
+        upload_dir = os.path.join(media_root, "uploaded_files")
+        os.makedirs(upload_dir)
+        # Copied straight into the upload dir, so no index is built and
+        # every request runs the script.
+        write_input(
+            os.path.join(upload_dir, "benchmark"),
+            args.lines,
+            domains={"uol.com.br": 1},
+        )
+        results = {
+            name: benchmark(name, args, media_root) for name in args.servers
+        }
+    finally:
+        shutil.rmtree(media_root)
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
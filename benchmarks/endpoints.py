@@ -0,0 +1,458 @@
+"""Latency, throughput and peak memory of the file endpoints by file size.
+
+For every ``--lines`` size a file is generated with
+``benchmarks/generate_input.py`` and handed to a gunicorn server with one
+sync worker, in two ways:
+
+- ``indexed``: uploaded through ``PUT /upload/``, which queues the build
+  of its index, summary and rollups; queries start once it is ready.
+- ``raw``: copied straight into the upload directory, so every query
+  runs on the file itself (with the ``--backend`` configured).
+
+Each query scenario is requested once cold, then ``--requests`` times.
+Results are printed as JSON, tagged with the git commit, and can be
+compared between commits:
+
+    python benchmarks/endpoints.py --lines 1000000 10000000 \\
+        --output before.json
+    git checkout my-branch
+    python benchmarks/endpoints.py --lines 1000000 10000000 \\
+        --compare before.json
+
+With ``--compare`` the exit status is 1 if any median got slower by more
+than ``--threshold`` percent. Peak RSS is that of the worker and the
+scripts it forks while the scenario runs. It is read from /proc, so it is
+only reported on Linux. Generated files are written to ``--data-dir``
+(default: a temporary directory) and reused from there by later runs, as
+generating 100M lines takes a few minutes.
+"""
+
+import argparse
+import datetime
+import http.client
+import json
+import os
+import platform
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.generate_input import MAX_VALUE, write_input  # noqa: E402
+
+PAGE_SIZE = 100
+UPLOAD_BLOCK_SIZE = 1024 * 1024
+RSS_SAMPLE_INTERVAL = 0.02
+
+
+def scenarios(file_name, lines):
+    """URLs of the query scenarios for a file of ``lines`` lines."""
+    last_page = max(1, -(-lines // PAGE_SIZE))
+    # About 1% of the records with uniform values (--skew 0).
+    low, high = 0, MAX_VALUE // 100
+    return {
+        "max_size": f"/files/user_max_size/{file_name}/",
+        "min_size": f"/files/user_min_size/{file_name}/",
+        "users_first_page": (
+            f"/files/users/{file_name}/?page_size={PAGE_SIZE}"
+        ),
+        "users_deep_page": (
+            f"/files/users/{file_name}/"
+            f"?page={last_page}&page_size={PAGE_SIZE}"
+        ),
+        "range_messages": (
+            f"/files/users_range_messages/{file_name}/{low}/{high}/"
+            f"?page_size={PAGE_SIZE}"
+        ),
+        "range_size": (
+            f"/files/users_range_size/{file_name}/{low}/{high}/"
+            f"?page_size={PAGE_SIZE}"
+        ),
+    }
+
+
+def read_status(pid, field):
+    """Return a ``VmRSS``-style field of /proc/<pid>/status in bytes."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(f"{field}:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def process_tree(pid):
+    pids = [pid]
+    for pid in pids:
+        try:
+            for task in os.listdir(f"/proc/{pid}/task"):
+                with open(f"/proc/{pid}/task/{task}/children") as f:
+                    pids.extend(int(child) for child in f.read().split())
+        except OSError:
+            pass
+    return pids
+
+
+class PeakRss:
+    """Track the peak RSS of a process and its children (Linux only).
+
+    Children, like the query scripts, are sampled while they run; the
+    process's own peak comes from the kernel's high-water mark, which is
+    reset when tracking starts.
+    """
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while not self._stop.is_set():
+            sizes = [
+                read_status(pid, "VmRSS") for pid in process_tree(self.pid)
+            ]
+            total = sum(size for size in sizes if size is not None)
+            if sizes[0] is not None:
+                self.peak = max(self.peak or 0, total)
+            self._stop.wait(RSS_SAMPLE_INTERVAL)
+
+    def __enter__(self):
+        try:
+            # "5" resets the process's peak RSS (VmHWM).
+            with open(f"/proc/{self.pid}/clear_refs", "w") as f:
+                f.write("5")
+        except OSError:
+            pass
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        high_water_mark = read_status(self.pid, "VmHWM")
+        if high_water_mark is not None:
+            self.peak = max(self.peak or 0, high_water_mark)
+
+    def megabytes(self):
+        if self.peak is None:
+            return None
+        return round(self.peak / 1024 / 1024, 1)
+
+
+def fetch(base_url, path):
+    start = time.perf_counter()
+    with urllib.request.urlopen(base_url + path, timeout=None) as response:
+        body = response.read()
+    return time.perf_counter() - start, len(body)
+
+
+def upload(port, file_path, file_name):
+    """Stream a file to ``PUT /upload/`` as multipart form data."""
+    boundary = uuid.uuid4().hex
+    head = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="file"; '
+        f'filename="{file_name}"\r\n'
+        "Content-Type: application/octet-stream\r\n\r\n"
+    ).encode()
+    tail = f"\r\n--{boundary}--\r\n".encode()
+    size = os.path.getsize(file_path)
+
+    def body():
+        yield head
+        with open(file_path, "rb") as f:
+            while block := f.read(UPLOAD_BLOCK_SIZE):
+                yield block
+        yield tail
+
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=None)
+    start = time.perf_counter()
+    connection.request(
+        "PUT",
+        "/upload/",
+        body=body(),
+        headers={
+            "Content-Type": f"multipart/form-data; boundary={boundary}",
+            "Content-Length": str(len(head) + size + len(tail)),
+        },
+    )
+    response = connection.getresponse()
+    response.read()
+    elapsed = time.perf_counter() - start
+    connection.close()
+    if response.status not in (201, 204):
+        raise RuntimeError(f"upload failed with status {response.status}")
+    return {
+        "seconds": round(elapsed, 3),
+        "mb_per_second": round(size / elapsed / 1024 / 1024, 1),
+    }
+
+
+def wait_until_indexed(base_url, file_name):
+    """Wait for a file's background index build; return its seconds."""
+    start = time.perf_counter()
+    while True:
+        with urllib.request.urlopen(
+            f"{base_url}/files/index_status/{file_name}/"
+        ) as response:
+            state = json.load(response)["state"]
+        if state == "ready":
+            return round(time.perf_counter() - start, 3)
+        if state == "failed":
+            raise RuntimeError(f"indexing {file_name} failed")
+        time.sleep(0.1)
+
+
+def measure(base_url, path, requests):
+    first, response_bytes = fetch(base_url, path)
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(requests):
+        latency, response_bytes = fetch(base_url, path)
+        latencies.append(latency)
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": requests,
+        "first_ms": round(first * 1000, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "p95_ms": round(
+            latencies[max(int(len(latencies) * 0.95) - 1, 0)] * 1000, 1
+        ),
+        "max_ms": round(latencies[-1] * 1000, 1),
+        "requests_per_second": round(requests / elapsed, 2),
+        "response_bytes": response_bytes,
+    }
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(url, server, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError("server exited during startup")
+        try:
+            urllib.request.urlopen(url, timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server did not start: {url}")
+
+
+def start_server(work_dir, port, backend):
+    env = dict(
+        os.environ,
+        MEDIA_ROOT=os.path.join(work_dir, "media"),
+        DATABASE_PATH=os.path.join(work_dir, "db.sqlite3"),
+        DEBUG="False",
+        ALLOWED_HOSTS="127.0.0.1",
+        FILES_QUERY_BACKEND=backend,
+        # Measure the queries themselves, not the result cache.
+        FILES_RESULT_CACHE_MAX_BYTES="0",
+    )
+    subprocess.run(
+        [sys.executable, "manage.py", "migrate", "--verbosity", "0"],
+        cwd=ROOT,
+        env=env,
+        check=True,
+    )
+    server = subprocess.Popen(
+        [
+            "gunicorn",
+            "core.wsgi:application",
+            "--workers",
+            "1",
+            "--timeout",
+            "0",
+            "--bind",
+            f"127.0.0.1:{port}",
+        ],
+        cwd=ROOT,
+        env=env,
+        stderr=subprocess.DEVNULL,
+    )
+    wait_until_up(f"http://127.0.0.1:{port}/files/", server)
+    return server
+
+
+def worker_pid(server):
+    workers = process_tree(server.pid)[1:]
+    return workers[0] if workers else server.pid
+
+
+def input_path(data_dir, lines, args):
+    path = os.path.join(
+        data_dir, f"input-{lines}-skew{args.skew:g}-seed{args.seed}"
+    )
+    if not os.path.exists(path):
+        tmp_path = f"{path}.tmp"
+        write_input(tmp_path, lines, skew=args.skew, seed=args.seed)
+        os.replace(tmp_path, path)
+    return path
+
+
+def benchmark_size(lines, args, data_dir):
+    source = input_path(data_dir, lines, args)
+    work_dir = tempfile.mkdtemp()
+    port = free_port()
+    server = start_server(work_dir, port, args.backend)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        pid = worker_pid(server)
+        results = {"file_bytes": os.path.getsize(source)}
+
+        indexed, raw = f"bench-{lines}", f"bench-{lines}-raw"
+        with PeakRss(pid) as rss:
+            results["upload"] = upload(port, source, indexed)
+            results["upload"]["index_seconds"] = wait_until_indexed(
+                base_url, indexed
+            )
+        results["upload"]["peak_rss_mb"] = rss.megabytes()
+        shutil.copy(
+            source, os.path.join(work_dir, "media", "uploaded_files", raw)
+        )
+
+        with PeakRss(pid) as rss:
+            results["list"] = measure(base_url, "/files/", args.requests)
+        results["list"]["peak_rss_mb"] = rss.megabytes()
+
+        for variant, file_name in (("indexed", indexed), ("raw", raw)):
+            results[variant] = {}
+            for name, path in scenarios(file_name, lines).items():
+                with PeakRss(pid) as rss:
+                    metrics = measure(base_url, path, args.requests)
+                metrics["peak_rss_mb"] = rss.megabytes()
+                results[variant][name] = metrics
+                print(lines, variant, name, metrics, file=sys.stderr)
+        return results
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(work_dir)
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return f"{commit}-dirty" if dirty else commit
+
+
+def iter_metrics(results):
+    """Yield ``(name, metrics)`` for every measurement in a results file."""
+    for lines, size_results in results["sizes"].items():
+        for key in ("upload", "list"):
+            yield f"{lines} {key}", size_results[key]
+        for variant in ("indexed", "raw"):
+            for scenario, metrics in size_results[variant].items():
+                yield f"{lines} {variant} {scenario}", metrics
+
+
+def compare(baseline, results, threshold):
+    """Print how each median changed; return the number of regressions."""
+    old = dict(iter_metrics(baseline))
+    regressions = 0
+    for name, metrics in iter_metrics(results):
+        key = "seconds" if "seconds" in metrics else "p50_ms"
+        if name not in old:
+            continue
+        before, after = old[name][key], metrics[key]
+        change = (after - before) / before * 100 if before else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        print(
+            f"{name} {key}: {before} -> {after} ({change:+.1f}%){flag}",
+            file=sys.stderr,
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--lines", type=int, nargs="+", default=[100_000, 1_000_000]
+    )
+    parser.add_argument("--requests", type=int, default=5)
+    parser.add_argument(
+        "--backend", choices=["script", "python"], default="script"
+    )
+    parser.add_argument("--skew", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", help="keep generated files here")
+    parser.add_argument("--output", help="also write the results here")
+    parser.add_argument("--compare", help="results of an earlier run")
+    parser.add_argument("--threshold", type=float, default=10.0)
+    args = parser.parse_args()
+
+    data_dir = args.data_dir or tempfile.mkdtemp()
+    os.makedirs(data_dir, exist_ok=True)
+    try:
+        results = {
+            "commit": git_commit(),
+            "date": datetime.datetime.now(datetime.timezone.utc).isoformat(
+                timespec="seconds"
+            ),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "options": {
+                key: value
+                for key, value in vars(args).items()
+                if key not in ("output", "compare", "threshold", "data_dir")
+            },
+            "sizes": {
+                str(lines): benchmark_size(lines, args, data_dir)
+                for lines in args.lines
+            },
+        }
+    finally:
+        if not args.data_dir:
+            shutil.rmtree(data_dir)
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(baseline, results, args.threshold):
+            return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
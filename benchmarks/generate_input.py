@@ -0,0 +1,142 @@
+"""Generate mailbox files in the "user@domain inbox N size N" format.
+
+Writes ``--lines`` lines of synthetic records, with inbox counts and
+sizes zero-padded to nine digits like ``scripts/input``. Run from the
+repository root:
+
+    python benchmarks/generate_input.py /tmp/input --lines 10000000 \\
+        --skew 2 --domains uol.com.br=70 bol.com.br=20 gmail.com=10
+
+- ``--users`` is the size of the pool of usernames that lines draw
+  from. Names repeat across lines, more often the smaller the pool.
+- ``--domains`` weighs the domains each line picks from.
+- ``--skew`` shapes the inbox counts and sizes. With 0 they are uniform
+  up to the maximum. Larger values pile them towards zero and leave a
+  long tail, like real mailboxes.
+
+The same ``--seed`` always produces the same file.
+"""
+
+import argparse
+import sys
+
+import numpy as np
+
+MAX_VALUE = 10**9 - 1
+
+DEFAULT_DOMAINS = {
+    "uol.com.br": 60,
+    "bol.com.br": 25,
+    "gmail.com": 10,
+    "hotmail.com": 5,
+}
+
+# Usernames start with a letter and may contain "." and "_" afterwards,
+# like those in scripts/input.
+FIRST_CHARS = np.frombuffer(b"abcdefghijklmnopqrstuvwxyz", dtype=np.uint8)
+NAME_CHARS = np.frombuffer(b"abcdefghijklmnopqrstuvwxyz._", dtype=np.uint8)
+MIN_NAME_LENGTH = 4
+MAX_NAME_LENGTH = 12
+
+# Lines generated and written at a time.
+BLOCK_LINES = 100_000
+
+
+def usernames(user_ids):
+    """Return a deterministic username for each user id, as bytes."""
+    # A multiplicative hash spreads consecutive ids over the name space.
+    hashed = (user_ids.astype(np.uint64) + np.uint64(1)) * np.uint64(
+        0x9E3779B97F4A7C15
+    )
+    lengths = MIN_NAME_LENGTH + (
+        hashed % np.uint64(MAX_NAME_LENGTH - MIN_NAME_LENGTH + 1)
+    ).astype(np.int64)
+    chars = np.zeros((len(user_ids), MAX_NAME_LENGTH), dtype=np.uint8)
+    state = hashed
+    for position in range(MAX_NAME_LENGTH):
+        alphabet = FIRST_CHARS if position == 0 else NAME_CHARS
+        state = state * np.uint64(6364136223846793005) + np.uint64(
+            1442695040888963407
+        )
+        codes = (state >> np.uint64(33)) % np.uint64(len(alphabet))
+        chars[:, position] = np.where(
+            position < lengths, alphabet[codes.astype(np.int64)], 0
+        )
+    # Fixed-width byte strings drop their trailing NUL padding.
+    return chars.view(f"S{MAX_NAME_LENGTH}").ravel().tolist()
+
+
+def skewed(rng, size, skew, maximum=MAX_VALUE):
+    return (maximum * rng.random(size) ** (1 + skew)).astype(np.int64)
+
+
+def generate_blocks(
+    lines, users=None, domains=None, skew=0.0, seed=0, block=BLOCK_LINES
+):
+    """Yield the file's lines as blocks of bytes."""
+    rng = np.random.default_rng(seed)
+    users = users or lines
+    domains = domains or DEFAULT_DOMAINS
+    names = [domain.encode() for domain in domains]
+    weights = np.array(list(domains.values()), dtype=np.float64)
+    weights /= weights.sum()
+
+    for start in range(0, lines, block):
+        count = min(block, lines - start)
+        user_ids = rng.integers(0, users, count)
+        domain_ids = rng.choice(len(names), count, p=weights).tolist()
+        messages = skewed(rng, count, skew).tolist()
+        sizes = skewed(rng, count, skew).tolist()
+        yield b"".join(
+            b"%s@%s inbox %09d size %09d\n"
+            % (username, names[domain_id], inbox, size)
+            for username, domain_id, inbox, size in zip(
+                usernames(user_ids), domain_ids, messages, sizes
+            )
+        )
+
+
+def write_input(path, lines, **kwargs):
+    """Write a generated file; see ``generate_blocks`` for the options."""
+    with open(path, "wb") as f:
+        for block in generate_blocks(lines, **kwargs):
+            f.write(block)
+
+
+def parse_domain(value):
+    domain, _, weight = value.partition("=")
+    try:
+        return domain, float(weight or 1)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid domain weight: {value}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("path")
+    parser.add_argument("--lines", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, help="default: --lines")
+    parser.add_argument(
+        "--domains",
+        type=parse_domain,
+        nargs="+",
+        metavar="DOMAIN=WEIGHT",
+        help="default: "
+        + " ".join(f"{d}={w}" for d, w in DEFAULT_DOMAINS.items()),
+    )
+    parser.add_argument("--skew", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    write_input(
+        args.path,
+        args.lines,
+        users=args.users,
+        domains=dict(args.domains) if args.domains else None,
+        skew=args.skew,
+        seed=args.seed,
+    )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+"""Disk footprint and throughput of each FILES_STORAGE_CODEC.
+
+Stores scripts/input (repeated ``--repeat`` times) with every codec and
+reports the stored size, the write throughput, and how long a full
+streaming read and a max-size query take through ``files.storage``. Run
+from the repository root:
+
+    python benchmarks/storage_codecs.py
+
+Repeating the input makes it easier to time, but lzma's large window then
+finds the copies, so its ratio is only realistic with ``--repeat 1``.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from files import engine, storage  # noqa: E402
+
+CODECS = ["", "gzip", "lzma"]
+CHUNK_SIZE = 64 * 1024
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def write(path, data, codec):
+    with open(path, "wb") as f:
+        writer = storage.compressing_writer(f, codec)
+        for start in range(0, len(data), CHUNK_SIZE):
+            writer.write(data[start : start + CHUNK_SIZE])
+        if writer is not f:
+            writer.close()
+
+
+def read(path):
+    with storage.open_upload(path) as f:
+        while f.read(1024 * 1024):
+            pass
+
+
+def megabytes_per_second(size, seconds):
+    return round(size / seconds / 1024 / 1024, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--output", help="also write the results here")
+    args = parser.parse_args()
+
+    with open(os.path.join(ROOT, "scripts", "input"), "rb") as f:
+        data = f.read() * args.repeat
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for codec in CODECS:
+            path = os.path.join(tmp_dir, codec or "plain")
+            _, write_time = timed(write, path, data, codec)
+            _, read_time = timed(read, path)
+            _, query_time = timed(engine.max_size_line, path)
+            stored_size = os.path.getsize(path)
+            results[codec or "none"] = {
+                "size": len(data),
+                "stored_size": stored_size,
+                "ratio": round(len(data) / stored_size, 2),
+                "write_mb_s": megabytes_per_second(len(data), write_time),
+                "read_mb_s": megabytes_per_second(len(data), read_time),
+                "max_size_query_s": round(query_time, 3),
+            }
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
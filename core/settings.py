@@ -41,6 +41,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "files.metrics.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -48,6 +49,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "files.profiling.ProfilingMiddleware",
 ]
 
 ROOT_URLCONF = "core.urls"
@@ -70,6 +72,13 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "core.wsgi.application"
 
+REST_FRAMEWORK = {
+    "DEFAULT_RENDERER_CLASSES": [
+        "files.metrics.TimedJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+}
+
 
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
@@ -77,7 +86,7 @@ WSGI_APPLICATION = "core.wsgi.application"
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+        "NAME": os.getenv("DATABASE_PATH", BASE_DIR / "db.sqlite3"),
     }
 }
 
@@ -118,9 +127,80 @@ USE_TZ = True
 
 STATIC_URL = "static/"
 
-MEDIA_ROOT = os.path.join(BASE_DIR, "media")
+MEDIA_ROOT = os.getenv("MEDIA_ROOT", os.path.join(BASE_DIR, "media"))
 MEDIA_URL = "/media/"
 
+# Backend used to answer the file query endpoints: "script" runs the shell
+# scripts in scripts/, "python" uses the in-process engine in files.engine.
+# Both give the answers of the index for lines in the record format, with
+# or without zero-padded numbers; see the README for lines outside it.
+FILES_QUERY_BACKEND = os.getenv("FILES_QUERY_BACKEND", "script")
+
+# Directory where each server process keeps its metrics, so /metrics can
+# report the totals of every gunicorn worker. Empty keeps them in memory,
+# per process.
+FILES_METRICS_DIR = os.getenv("FILES_METRICS_DIR", "")
+
+# Lets staff users profile single requests to the file endpoints (see
+# files.profiling), and the directory where the profiles are stored.
+FILES_PROFILING = os.getenv("FILES_PROFILING", "False") == "True"
+FILES_PROFILES_DIR = os.getenv(
+    "FILES_PROFILES_DIR", os.path.join(MEDIA_ROOT, "profiles")
+)
+
+# max-age, in seconds, of the Cache-Control header on query results. With
+# 0 a reverse proxy may keep them but must revalidate each one (answered
+# with 304 Not Modified while the file is unchanged).
+FILES_QUERY_CACHE_MAX_AGE = int(os.getenv("FILES_QUERY_CACHE_MAX_AGE", "0"))
+
+# Memory budget, per worker process, for cached query results.
+FILES_RESULT_CACHE_MAX_BYTES = int(
+    os.getenv("FILES_RESULT_CACHE_MAX_BYTES", 64 * 1024 * 1024)
+)
+
+# Memory ceiling for sorting a file's records, beyond which sorted runs are
+# spilled to temporary files and merged.
+FILES_SORT_MEMORY_LIMIT = int(
+    os.getenv("FILES_SORT_MEMORY_LIMIT", 256 * 1024 * 1024)
+)
+
+# Largest file the "script" backend lists by username with
+# order-by-username.sh, whose whole output is loaded at once; larger files
+# without an index are listed from an external merge sort run on disk.
+FILES_SCRIPT_SORT_MAX_BYTES = int(
+    os.getenv("FILES_SCRIPT_SORT_MAX_BYTES", 64 * 1024 * 1024)
+)
+
+# Worker processes used to scan a single large file in parallel when it has
+# no index (1 disables parallel scans), and the smallest file size for which
+# the process pool is worth it.
+FILES_SCAN_WORKERS = int(os.getenv("FILES_SCAN_WORKERS", 1))
+FILES_PARALLEL_SCAN_MIN_BYTES = int(
+    os.getenv("FILES_PARALLEL_SCAN_MIN_BYTES", 64 * 1024 * 1024)
+)
+
+# Worker processes that build the index, summary and rollups of uploaded
+# files in the background. 0 builds them before the upload returns.
+FILES_INDEX_WORKERS = int(os.getenv("FILES_INDEX_WORKERS", 1))
+
+# Compression applied to uploaded files as they are stored: "" (store them
+# as sent), "gzip" or "lzma". Reads detect the codec of each file.
+FILES_STORAGE_CODEC = os.getenv("FILES_STORAGE_CODEC", "")
+
+# Chunk size of resumable uploads when the client doesn't choose one, and
+# the largest chunk size a client may choose.
+FILES_UPLOAD_CHUNK_SIZE = int(
+    os.getenv("FILES_UPLOAD_CHUNK_SIZE", 8 * 1024 * 1024)
+)
+FILES_UPLOAD_MAX_CHUNK_SIZE = int(
+    os.getenv("FILES_UPLOAD_MAX_CHUNK_SIZE", 64 * 1024 * 1024)
+)
+# Seconds without new chunks after which reconcile_catalog deletes an
+# unfinished resumable upload.
+FILES_UPLOAD_SESSION_TTL = int(
+    os.getenv("FILES_UPLOAD_SESSION_TTL", 7 * 24 * 60 * 60)
+)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
@@ -131,7 +211,7 @@ LOGGING = {
     "disable_existing_loggers": False,
     "handlers": {
         "console": {
-            "class": "logging.StreamHandler",
+            "class": "files.metrics.TimedStreamHandler",
         },
     },
     "root": {
@@ -2,3 +2,6 @@ from .settings import *
 
 # Override the MEDIA_ROOT for tests
 MEDIA_ROOT = os.path.join(BASE_DIR, "files", "tests")
+
+# Uploads are indexed before they return, so tests can query them at once.
+FILES_INDEX_WORKERS = 0
@@ -0,0 +1,268 @@
+"""Async versions of the file endpoints, served under ``/async/`` via ASGI.
+
+Shell scripts run as asyncio subprocesses, and blocking work (parsing the
+upload, writing files, reading indexes) is offloaded to threads, so one
+worker process can keep many slow queries in flight at once.
+"""
+
+import asyncio
+import logging
+import os
+import subprocess
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, JsonResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.parsers import FormParser, MultiPartParser
+from rest_framework.request import Request
+
+from . import engine
+from .conditional import conditional_query
+from .metrics import BYTES_READ, SUBPROCESSES, timed
+from .pagination import CustomPagination, UsernameCursorPagination
+from .serializers import (
+    FileListQuerySerializer,
+    FileListSerializer,
+    FileUploadSerializer,
+)
+from .utils import (
+    cache_script_output,
+    find_records,
+    index_file,
+    is_valid_file_name,
+    list_uploaded_files,
+    setup_file_paths,
+    store_file,
+    update_catalog,
+)
+
+
+def to_thread(func):
+    return sync_to_async(func, thread_sensitive=False)
+
+
+def json_response(response):
+    """Convert a DRF response returned by the shared helpers."""
+    if response.data is None:
+        return HttpResponse(status=response.status_code)
+    with timed("render"):
+        return JsonResponse(response.data, status=response.status_code)
+
+
+async def async_run_script(script_path, file_path, *args):
+    SUBPROCESSES.inc(script=os.path.basename(script_path))
+    with timed("run_script"):
+        process = await asyncio.create_subprocess_exec(
+            script_path,
+            file_path,
+            *args,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        stdout, _ = await process.communicate()
+    BYTES_READ.inc(len(stdout), source="script")
+    if process.returncode != 0:
+        error = subprocess.CalledProcessError(
+            process.returncode, [script_path, file_path, *args]
+        )
+        logging.error("Error running script: %s", str(error))
+        return None, JsonResponse(
+            {"error": str(error)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        )
+    return stdout.decode().strip(), None
+
+
+async def async_run_operation(
+    file_path, operation, params, script_path=None, script_args=()
+):
+    """Async counterpart of ``files.utils.run_operation``."""
+    try:
+        records, cache_key = await to_thread(find_records)(
+            file_path, operation, params, script_path
+        )
+        if records is None:
+            output, error_response = await async_run_script(
+                script_path, file_path, *script_args
+            )
+            if error_response:
+                return None, error_response
+            records = await to_thread(cache_script_output)(cache_key, output)
+    except (OSError, ValueError) as e:
+        logging.error("Error running query engine: %s", str(e))
+        return None, JsonResponse(
+            {"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+    return records, None
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class AsyncFileUploadView(View):
+    async def put(self, request):
+        request = Request(request, parsers=[MultiPartParser(), FormParser()])
+        serializer = FileUploadSerializer(
+            data=await to_thread(lambda: request.data)()
+        )
+        if serializer.is_valid():
+            file = serializer.validated_data["file"]
+            file_name = file.name
+
+            # Validate file name
+            if not is_valid_file_name(file_name):
+                return JsonResponse(
+                    {"error": "File name has invalid characters."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+            status_code, catalog_entry = await to_thread(store_file)(
+                file, file_name
+            )
+            await sync_to_async(update_catalog)(file_name, catalog_entry)
+            await sync_to_async(index_file)(file_name)
+
+            return HttpResponse(status=status_code)
+
+        return JsonResponse(
+            serializer.errors, status=status.HTTP_400_BAD_REQUEST
+        )
+
+
+class AsyncFileListView(View):
+    async def get(self, request):
+        request = Request(request)
+        query = FileListQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return JsonResponse(
+                query.errors, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        def list_page():
+            files = list_uploaded_files(**query.validated_data)
+            paginator = CustomPagination()
+            paginated_files = paginator.paginate_queryset(files, request)
+            serializer = FileListSerializer(paginated_files, many=True)
+            return paginator.get_paginated_response(serializer.data)
+
+        # The catalog is queried through the ORM, which is sync-only.
+        return json_response(await sync_to_async(list_page)())
+
+
+class AsyncQueryView(View):
+    """Base for the async query endpoints.
+
+    Subclasses name the script they replace, if any, and build its
+    arguments from the URL; ``paginated`` views page through the records
+    like the sync listing views, the others return the first record.
+    """
+
+    script_name = None
+    paginated = True
+    descending = False
+
+    def get_script_args(self, **kwargs):
+        return ()
+
+    def get_operation(self, request, script_args):
+        return engine.parse_command(self.script_name, *script_args)
+
+    def get_paginator(self, request):
+        return CustomPagination()
+
+    @conditional_query
+    async def get(self, request, file_name, **kwargs):
+        file_path, script_path = await to_thread(setup_file_paths)(
+            file_name, self.script_name
+        )
+        if file_path is None:
+            return json_response(script_path)
+
+        script_args = self.get_script_args(**kwargs)
+        try:
+            operation, params = self.get_operation(request, script_args)
+        except ValueError as e:
+            return JsonResponse(
+                {"error": str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+        if operation not in engine.OPERATIONS:
+            # Index-only operations have no script to fall back on.
+            script_path = None
+        records, error_response = await async_run_operation(
+            file_path, operation, params, script_path, script_args
+        )
+        if error_response:
+            return error_response
+
+        if not records:
+            logging.error("No data found in file: %s", file_path)
+            return JsonResponse(
+                {"error": "No data found in file."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+
+        if not self.paginated:
+            data = records[0]
+            logging.info("Successfully parsed line: %s", data)
+            return JsonResponse(data, status=status.HTTP_200_OK)
+
+        request = Request(request)
+        paginator = self.get_paginator(request)
+        paginated_data = await to_thread(paginator.paginate_queryset)(
+            records, request
+        )
+        logging.info("Successfully parsed lines: %s", paginated_data)
+        return json_response(paginator.get_paginated_response(paginated_data))
+
+
+class AsyncUserMaxSizeView(AsyncQueryView):
+    script_name = "max-min-size.sh"
+    paginated = False
+
+
+class AsyncUserMinSizeView(AsyncQueryView):
+    script_name = "max-min-size.sh"
+    paginated = False
+
+    def get_script_args(self, **kwargs):
+        return ("-min",)
+
+
+class AsyncUserListView(AsyncQueryView):
+    script_name = "order-by-username.sh"
+
+    def get_script_args(self, **kwargs):
+        return ("-desc",) if self.descending else ()
+
+    def get_operation(self, request, script_args):
+        prefix = request.GET.get("prefix")
+        if prefix:
+            return "username_prefix", (prefix, self.descending)
+        return super().get_operation(request, script_args)
+
+    def get_paginator(self, request):
+        if UsernameCursorPagination.is_requested(request):
+            return UsernameCursorPagination(descending=self.descending)
+        return CustomPagination()
+
+
+class AsyncUserListDescView(AsyncUserListView):
+    descending = True
+
+
+class AsyncUserRangeMessagesView(AsyncQueryView):
+    script_name = "between-msgs.sh"
+
+    def get_script_args(self, min_msgs, max_msgs):
+        return str(min_msgs), str(max_msgs)
+
+
+class AsyncUserRangeSizeView(AsyncQueryView):
+    # No script filters by size, so the engine always answers it.
+    def get_script_args(self, min_size, max_size):
+        return min_size, max_size
+
+    def get_operation(self, request, script_args):
+        return "between_size", script_args
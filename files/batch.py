@@ -0,0 +1,179 @@
+"""Answer several queries about one file in a single request.
+
+Queries the columnar index and ingest summary can answer are read from
+them directly. The rest are registered as accumulators from
+``files.engine`` and ``files.stats`` and fed the same batches of lines, so
+the file is read once however many of them are asked for. Every result is
+cached under the key the single-query endpoints use, and the time spent on
+each operation is reported alongside it.
+"""
+
+import logging
+import os
+from itertools import islice
+from time import perf_counter
+
+from rest_framework import status
+from rest_framework.response import Response
+
+from . import engine
+from .cache import result_cache
+from .metrics import BYTES_READ, RECORDS_PARSED
+from .stats import ColumnCollector, file_stats, summarize
+from .utils import find_records, get_summary, open_index, parse_line
+
+# Lines handed to the accumulators at a time.
+SCAN_BATCH_LINES = 4096
+
+# Operations answered from the sorted run even without an index.
+SORTED_OPERATIONS = ("order_by_username", "username_prefix")
+
+
+def to_operation(spec):
+    """Map a validated batch entry to an ``(operation, params)`` pair."""
+    op = spec["op"]
+    if op in ("max_size", "min_size"):
+        return op, ()
+    if op == "users":
+        if spec.get("prefix"):
+            return "username_prefix", (spec["prefix"], spec["desc"])
+        return "order_by_username", (spec["desc"],)
+    if op == "range_messages":
+        return "between_msgs", (spec["min"], spec["max"])
+    if op == "range_size":
+        return "between_size", (spec["min"], spec["max"])
+    if op == "top":
+        field = "messages" if spec["by"] == "inbox" else "size"
+        return "top", (field, spec["k"], spec["order"] == "desc")
+    if op == "stats":
+        return "stats", (spec["bins"],)
+    raise ValueError(f"Unknown operation: {op}")
+
+
+def make_accumulator(operation, params):
+    if operation in ("max_size", "min_size"):
+        return engine.SizeSelector(smallest=operation == "min_size")
+    if operation == "between_msgs":
+        return engine.LineFilter(engine.INBOX_PATTERN, *params)
+    if operation == "between_size":
+        return engine.LineFilter(engine.SIZE_PATTERN, *params)
+    if operation == "top":
+        return engine.TopSelector(*params)
+    return ColumnCollector()
+
+
+def format_result(spec, value):
+    """Shape an operation's records the way its own endpoint does."""
+    op = spec["op"]
+    if op in ("max_size", "min_size"):
+        return value[0] if value else None
+    if op in ("users", "range_messages", "range_size"):
+        start = (spec["page"] - 1) * spec["page_size"]
+        return {
+            "count": len(value),
+            "results": value[start : start + spec["page_size"]],
+        }
+    if op == "top":
+        return value[:]
+    return value
+
+
+def answer_batch(file_path, operations):
+    started = perf_counter()
+    stat = os.stat(file_path)
+    index = open_index(file_path)
+    has_summary = get_summary(file_path) is not None
+
+    values = {}
+    timings = {}
+    cache_keys = {}
+    pending = {}
+    entries = [to_operation(spec) for spec in operations]
+    for operation, params in dict.fromkeys(entries):
+        t0 = perf_counter()
+        cache_key = (
+            os.path.basename(file_path),
+            stat.st_size,
+            stat.st_mtime_ns,
+            operation,
+            params,
+        )
+        cache_keys[operation, params] = cache_key
+        if operation == "stats":
+            value = result_cache.get(cache_key)
+            if value is None and index is not None:
+                value = file_stats(file_path, *params, index)
+        elif (
+            index is not None
+            or operation in SORTED_OPERATIONS
+            or (operation in ("max_size", "min_size") and has_summary)
+        ):
+            value, _ = find_records(file_path, operation, params)
+        else:
+            value = result_cache.get(cache_key)
+
+        if value is None:
+            pending[operation, params] = make_accumulator(operation, params)
+        else:
+            values[operation, params] = value
+        timings[operation, params] = perf_counter() - t0
+
+    scan_time = 0
+    if pending:
+        t0 = perf_counter()
+        lines = engine.iter_lines(file_path)
+        while chunk := list(islice(lines, SCAN_BATCH_LINES)):
+            for key, accumulator in pending.items():
+                t1 = perf_counter()
+                accumulator.add_lines(chunk)
+                elapsed = perf_counter() - t1
+                timings[key] += elapsed
+                # What is left is the time spent reading and splitting the
+                # file, shared by every accumulator.
+                scan_time -= elapsed
+        scan_time += perf_counter() - t0
+        BYTES_READ.inc(stat.st_size, source="scan")
+
+        for (operation, params), accumulator in pending.items():
+            t1 = perf_counter()
+            if operation == "stats":
+                value = summarize(*accumulator.columns(), *params)
+            else:
+                value = [
+                    parse_line(line)
+                    for line in accumulator.lines()
+                    if line.strip()
+                ]
+                RECORDS_PARSED.inc(len(value))
+            if value is not None:
+                result_cache.set(cache_keys[operation, params], value)
+            values[operation, params] = value
+            timings[operation, params] += perf_counter() - t1
+
+    return {
+        "results": [
+            {
+                "op": spec["op"],
+                "result": format_result(spec, values[key]),
+                "time_ms": round(timings[key] * 1000, 3),
+            }
+            for spec, key in zip(operations, entries)
+        ],
+        "scan_ms": round(scan_time * 1000, 3),
+        "total_ms": round((perf_counter() - started) * 1000, 3),
+    }
+
+
+def run_batch(file_path, operations):
+    """Run the validated ``operations`` over a file.
+
+    Returns ``(answers, error_response)`` like the other query helpers.
+    """
+    try:
+        answers = answer_batch(file_path, operations)
+    except (OSError, ValueError) as e:
+        logging.error("Error running batch query: %s", str(e))
+        return None, Response(
+            {"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+    return answers, None
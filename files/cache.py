@@ -0,0 +1,104 @@
+"""In-process LRU cache for query results.
+
+Results are keyed by file name, the file's size and mtime, the operation
+and its parameters, so a replaced file never serves stale results. The
+cache evicts least recently used entries to stay under
+``FILES_RESULT_CACHE_MAX_BYTES``; each worker process has its own cache.
+"""
+
+import array
+import json
+import sys
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+def estimate_size(value):
+    """Roughly estimate the memory held by a cached result.
+
+    Results are lists of record dicts, arrays of record numbers or JSON
+    documents such as the file statistics.
+    """
+    if isinstance(value, array.array):
+        return sys.getsizeof(value)
+    if isinstance(value, dict):
+        return sys.getsizeof(json.dumps(value))
+    size = sys.getsizeof(value)
+    for record in value:
+        size += sys.getsizeof(record)
+        for item in record.values():
+            size += sys.getsizeof(item)
+    return size
+
+
+class ResultCache:
+    def __init__(self, max_bytes=None):
+        self._max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def max_bytes(self):
+        if self._max_bytes is not None:
+            return self._max_bytes
+        return settings.FILES_RESULT_CACHE_MAX_BYTES
+
+    def get(self, key):
+        """Return the cached value for ``key``, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        nbytes = estimate_size(value)
+        with self._lock:
+            if nbytes > self.max_bytes:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, nbytes)
+            self.current_bytes += nbytes
+            while self.current_bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, nbytes = self._entries.pop(key)
+        self.current_bytes -= nbytes
+
+    def invalidate(self, file_name):
+        """Drop every entry computed from ``file_name``."""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == file_name]:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+result_cache = ResultCache()
@@ -0,0 +1,102 @@
+"""Conditional GET support for the file query endpoints.
+
+A query's result depends only on the uploaded file and the request, so
+its ETag is a hash of the file's size and mtime and of the request path,
+query parameters and accepted media types, and its Last-Modified is the
+file's mtime. Both come from a single ``os.stat``, so a matching
+If-None-Match or If-Modified-Since is answered with 304 Not Modified
+before the view reads the file, its index or the result cache.
+"""
+
+import hashlib
+import os
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+)
+from django.utils.http import http_date, quote_etag
+
+
+def get_validators(request, file_name):
+    """Return ``(etag, last_modified)`` for a query, or None.
+
+    None means the file doesn't exist, and the view answers as usual.
+    """
+    file_path = os.path.join(settings.MEDIA_ROOT, "uploaded_files", file_name)
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    digest = hashlib.sha256()
+    for part in (
+        file_name,
+        str(stat.st_size),
+        str(stat.st_mtime_ns),
+        request.path,
+        repr(sorted(request.GET.lists())),
+        request.META.get("HTTP_ACCEPT", ""),
+    ):
+        digest.update(part.encode())
+        digest.update(b"\0")
+    return quote_etag(digest.hexdigest()), int(stat.st_mtime)
+
+
+def _check(request, file_name):
+    validators = get_validators(request, file_name)
+    if validators is None:
+        return None, None
+    etag, last_modified = validators
+    return (
+        get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        ),
+        validators,
+    )
+
+
+def _add_headers(response, validators):
+    if validators is None or response.status_code not in (200, 304):
+        return response
+    etag, last_modified = validators
+    response.headers.setdefault("ETag", etag)
+    response.headers.setdefault("Last-Modified", http_date(last_modified))
+    # Lets a reverse proxy keep the result and revalidate it with the ETag.
+    patch_cache_control(
+        response, public=True, max_age=settings.FILES_QUERY_CACHE_MAX_AGE
+    )
+    patch_vary_headers(response, ("Accept",))
+    return response
+
+
+def conditional_query(method):
+    """Add ETag, Last-Modified and Cache-Control to a query view's ``get``.
+
+    ``method`` takes the file name as its first URL argument; it can be a
+    sync (DRF) or async view method.
+    """
+    if iscoroutinefunction(method):
+
+        @wraps(method)
+        async def get(self, request, file_name, *args, **kwargs):
+            response, validators = _check(request, file_name)
+            if response is None:
+                response = await method(
+                    self, request, file_name, *args, **kwargs
+                )
+            return _add_headers(response, validators)
+
+    else:
+
+        @wraps(method)
+        def get(self, request, file_name, *args, **kwargs):
+            response, validators = _check(request, file_name)
+            if response is None:
+                response = method(self, request, file_name, *args, **kwargs)
+            return _add_headers(response, validators)
+
+    return get
@@ -0,0 +1,205 @@
+"""In-process equivalents of the shell scripts in ``scripts/``.
+
+Each query reads the uploaded file in a single streaming pass and returns
+the lines the matching script would print, so ``run_query`` can answer
+without forking bash, awk or sort.
+"""
+
+import heapq
+import re
+
+from .records import sort_key
+from .storage import open_upload
+
+SIZE_PATTERN = re.compile(r"size ([0-9]+)")
+INBOX_PATTERN = re.compile(r"inbox ([0-9]+)")
+
+
+def iter_lines(file_path):
+    # newline="\n" keeps "\r" and other separators inside the line, the same
+    # way awk and sort split records.
+    with open_upload(file_path, "rt", encoding="utf-8", newline="\n") as f:
+        for line in f:
+            yield line.rstrip("\n")
+
+
+class SizeSelector:
+    """Track the line with the largest or smallest size.
+
+    Lines can be fed in batches with ``add_lines``, so several selectors
+    can share one pass over a file.
+    """
+
+    def __init__(self, smallest):
+        self.smallest = smallest
+        self.best = None
+
+    def add_lines(self, lines):
+        best = self.best
+        smallest = self.smallest
+        for line in lines:
+            match = SIZE_PATTERN.search(line)
+            if match is None:
+                continue
+            size = int(match.group(1))
+            # Strict comparison keeps the first line on ties, like the awk
+            # script.
+            if best is None or (
+                size < best[0] if smallest else size > best[0]
+            ):
+                best = size, line
+        self.best = best
+
+    def lines(self):
+        return [] if self.best is None else [self.best[1]]
+
+
+def select_size_line(lines, smallest):
+    """Return ``(size, line)`` for the largest or smallest size, or None."""
+    selector = SizeSelector(smallest)
+    selector.add_lines(lines)
+    return selector.best
+
+
+def max_size_line(file_path):
+    best = select_size_line(iter_lines(file_path), smallest=False)
+    return [] if best is None else [best[1]]
+
+
+def min_size_line(file_path):
+    best = select_size_line(iter_lines(file_path), smallest=True)
+    return [] if best is None else [best[1]]
+
+
+def order_by_username(file_path, desc=False):
+    # Python compares strings by code point, which matches `sort` under the
+    # C/C.UTF-8 locale used by the production image.
+    return sorted(iter_lines(file_path), key=sort_key, reverse=desc)
+
+
+class LineFilter:
+    """Collect the lines whose ``pattern`` number is within low..high."""
+
+    def __init__(self, pattern, low, high):
+        self.pattern = pattern
+        self.low = low
+        self.high = high
+        self.matching = []
+
+    def add_lines(self, lines):
+        search = self.pattern.search
+        low, high = self.low, self.high
+        append = self.matching.append
+        for line in lines:
+            match = search(line)
+            if match and low <= int(match.group(1)) <= high:
+                append(line)
+
+    def lines(self):
+        return self.matching
+
+
+def filter_lines(lines, pattern, low, high):
+    """Return the lines whose ``pattern`` number is within low..high."""
+    line_filter = LineFilter(pattern, low, high)
+    line_filter.add_lines(lines)
+    return line_filter.matching
+
+
+def between_msgs(file_path, min_msgs, max_msgs):
+    return filter_lines(
+        iter_lines(file_path), INBOX_PATTERN, min_msgs, max_msgs
+    )
+
+
+def between_size(file_path, min_size, max_size):
+    return filter_lines(
+        iter_lines(file_path), SIZE_PATTERN, min_size, max_size
+    )
+
+
+# Field positions of the top-K columns, as the index and parse_line read them.
+TOP_FIELDS = {"messages": 2, "size": 4}
+
+
+class TopSelector:
+    """Keep the ``k`` lines with the largest (or smallest) ``field``.
+
+    A bounded heap holds only ``k`` lines while the file streams past, so
+    this is O(n log k) time and O(k) memory. Ties keep file order: heap
+    keys carry the negated line number, so a later line never displaces
+    an earlier one with the same value.
+    """
+
+    def __init__(self, field, k, desc=True):
+        self.position = TOP_FIELDS[field]
+        self.k = k
+        self.sign = 1 if desc else -1
+        self.heap = []
+        self.seen = 0
+
+    def add_lines(self, lines):
+        heap, k, sign, position = self.heap, self.k, self.sign, self.position
+        seen = self.seen
+        for line in lines:
+            parts = line.split()
+            if len(parts) < 5 or not parts[2].isdigit():
+                continue
+            if not parts[4].isdigit():
+                continue
+            seen += 1
+            item = (sign * int(parts[position]), -seen, line)
+            if len(heap) < k:
+                heapq.heappush(heap, item)
+            elif item > heap[0]:
+                heapq.heapreplace(heap, item)
+        self.seen = seen
+
+    def lines(self):
+        return [line for _, _, line in sorted(self.heap, reverse=True)]
+
+
+def top(file_path, field, k, desc=True):
+    """Return the ``k`` lines with the largest (or smallest) ``field``."""
+    selector = TopSelector(field, k, desc)
+    selector.add_lines(iter_lines(file_path))
+    return selector.lines()
+
+
+OPERATIONS = {
+    "max_size": max_size_line,
+    "min_size": min_size_line,
+    "order_by_username": order_by_username,
+    "between_msgs": between_msgs,
+    "between_size": between_size,
+    "top": top,
+}
+
+
+def parse_command(script_name, *args):
+    """Map a script invocation to an ``(operation, params)`` pair.
+
+    Raises ValueError for the same invalid arguments the scripts reject.
+    """
+    if script_name == "max-min-size.sh":
+        if not args:
+            return "max_size", ()
+        if args == ("-min",):
+            return "min_size", ()
+    elif script_name == "order-by-username.sh":
+        if not args:
+            return "order_by_username", ()
+        if args == ("-desc",):
+            return "order_by_username", (True,)
+    elif script_name == "between-msgs.sh":
+        if len(args) == 2 and all(arg.isdigit() for arg in args):
+            return "between_msgs", (int(args[0]), int(args[1]))
+    else:
+        raise ValueError(f"Unknown script: {script_name}")
+    raise ValueError(f"Invalid parameters for {script_name}: {args}")
+
+
+def run_command(script_name, file_path, *args):
+    """Run the query implemented by ``script_name`` with the script's args."""
+    operation, params = parse_command(script_name, *args)
+    return OPERATIONS[operation](file_path, *params)
@@ -0,0 +1,130 @@
+"""Stream every record of a file as NDJSON or CSV.
+
+Records come, in username order, from the file's columnar index or from
+its on-disk sorted run, are filtered by inbox count as they go past and
+are encoded in blocks, so a response of any length is produced with a
+constant amount of memory. Records travel as
+``(username, folder, numberMessages, size)`` tuples and are formatted
+directly, without building a dict and calling ``json.dumps`` per record.
+"""
+
+import csv
+import io
+from itertools import islice
+from json.encoder import encode_basestring_ascii
+
+from rest_framework.negotiation import BaseContentNegotiation
+
+from .records import parse_record
+from .utils import get_sorted_run, open_index
+
+# Records encoded into each chunk of the response.
+CHUNK_RECORDS = 1000
+
+CSV_FIELDS = ("username", "folder", "numberMessages", "size")
+
+# Same output as json.dumps() of the record dicts the other endpoints use.
+NDJSON_LINE = (
+    '{"username": %s, "folder": %s, "numberMessages": %d, "size": %d}\n'
+)
+
+CONTENT_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+class IgnoreClientContentNegotiation(BaseContentNegotiation):
+    """Render with the view's first renderer.
+
+    The export's ``format`` parameter picks the export encoding, not a DRF
+    renderer, so it must not go through the URL format override.
+    """
+
+    def select_parser(self, request, parsers):
+        return parsers[0]
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+def parse_fields(line):
+    """Parse a run line into a record tuple, or None if it is malformed.
+
+    Malformed lines are skipped like the index builder skips them, so both
+    sources export the same records.
+    """
+    record = parse_record(line)
+    if record is None:
+        return None
+    username, folder, messages, size = record
+    return (
+        username.decode("utf-8", "replace"),
+        folder.decode("utf-8", "replace"),
+        messages,
+        size,
+    )
+
+
+def iter_index_records(index, desc, min_msgs, max_msgs):
+    order = index.order[::-1] if desc else index.order
+    messages, size = index.messages, index.size
+    folders, folder_codes = index.folders, index.folder_codes
+    for i in order:
+        if min_msgs <= messages[i] <= max_msgs:
+            yield (
+                index.username(i),
+                folders[folder_codes[i]],
+                messages[i],
+                size[i],
+            )
+
+
+def iter_records(file_path, desc=False, min_msgs=None, max_msgs=None):
+    """Yield the records of a file in username order, as tuples.
+
+    Only records with ``min_msgs`` to ``max_msgs`` messages are yielded;
+    either bound may be None. The index or sorted run is opened (and the
+    run built, if needed) before this returns.
+    """
+    low = 0 if min_msgs is None else min_msgs
+    high = float("inf") if max_msgs is None else max_msgs
+    index = open_index(file_path)
+    if index is not None:
+        return iter_index_records(index, desc, low, high)
+    return (
+        record
+        for record in get_sorted_run(file_path, desc, parse=parse_fields)
+        if record is not None and low <= record[2] <= high
+    )
+
+
+def encode_ndjson(records):
+    while chunk := list(islice(records, CHUNK_RECORDS)):
+        yield "".join(
+            NDJSON_LINE
+            % (
+                encode_basestring_ascii(username),
+                encode_basestring_ascii(folder),
+                messages,
+                size,
+            )
+            for username, folder, messages, size in chunk
+        ).encode()
+
+
+def encode_csv(records):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(CSV_FIELDS)
+    while chunk := list(islice(records, CHUNK_RECORDS)):
+        writer.writerows(chunk)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        # The header of an export without records.
+        yield buffer.getvalue().encode()
+
+
+ENCODERS = {"ndjson": encode_ndjson, "csv": encode_csv}
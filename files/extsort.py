@@ -0,0 +1,235 @@
+"""Bounded-memory external merge sort.
+
+Items are buffered until the memory ceiling is reached, then each sorted
+buffer is spilled to a temporary run file and the runs are combined with a
+heap-based k-way merge (``heapq.merge``). Used to order files that don't
+fit in memory, both when building the columnar index and when the
+username listing has to be produced without one.
+"""
+
+import array
+import copy
+import heapq
+import marshal
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from bisect import bisect_left, bisect_right
+from collections.abc import Sequence
+
+from .records import sort_key
+from .storage import open_upload
+
+
+def _item_size(item):
+    size = sys.getsizeof(item)
+    if isinstance(item, tuple):
+        size += sum(sys.getsizeof(value) for value in item)
+    return size
+
+
+def _spill(buffer, tmp_dir):
+    buffer.sort()
+    run = tempfile.TemporaryFile(dir=tmp_dir)
+    for item in buffer:
+        marshal.dump(item, run)
+    run.seek(0)
+    buffer.clear()
+    return run
+
+
+def _read_run(run):
+    with run:
+        while True:
+            try:
+                yield marshal.load(run)
+            except EOFError:
+                return
+
+
+def external_sort(items, memory_limit, tmp_dir=None):
+    """Yield ``items`` in ascending order using about ``memory_limit`` bytes.
+
+    Items must be tuples of bytes/ints (or bytes), which are what the run
+    files can hold. Nothing is spilled when everything fits in memory.
+    """
+    buffer = []
+    used = 0
+    runs = []
+    for item in items:
+        buffer.append(item)
+        used += _item_size(item)
+        if used >= memory_limit:
+            runs.append(_spill(buffer, tmp_dir))
+            used = 0
+
+    if not runs:
+        buffer.sort()
+        yield from buffer
+        return
+    if buffer:
+        runs.append(_spill(buffer, tmp_dir))
+    yield from heapq.merge(*(_read_run(run) for run in runs))
+
+
+RUN_MAGIC = b"MBXRUN01"
+# magic, source size, source mtime_ns, line count
+RUN_TRAILER = struct.Struct("=8sQqQ")
+
+# Lines read at a time when iterating over a whole run.
+ITER_BLOCK_LINES = 4096
+
+
+def write_sorted_run(source_path, run_path, memory_limit):
+    """Write the non-blank lines of ``source_path`` in username order.
+
+    Lines are ordered by ``records.sort_key``, like the columnar index.
+    The run is a single file: the lines, then the byte offset of every
+    line, so pages can be read with a single seek, then ``RUN_TRAILER``.
+    It is renamed into place once complete, so a reader never sees the
+    lines of one version of the source with the offsets of another.
+    """
+    tmp_dir = os.path.dirname(run_path)
+    offsets = array.array("Q", [0])
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+    try:
+        with open_upload(source_path) as f, os.fdopen(fd, "wb") as run:
+            stat = os.fstat(f.fileno())
+
+            def lines():
+                for line in f:
+                    line = line.rstrip(b"\n")
+                    if line.strip():
+                        yield sort_key(line)
+
+            for *_, line in external_sort(lines(), memory_limit, tmp_dir):
+                run.write(line + b"\n")
+                offsets.append(offsets[-1] + len(line) + 1)
+            # Aligned, so the offsets can be read in place.
+            run.write(b"\0" * (-offsets[-1] % offsets.itemsize))
+            run.write(offsets)
+            run.write(
+                RUN_TRAILER.pack(
+                    RUN_MAGIC,
+                    stat.st_size,
+                    stat.st_mtime_ns,
+                    len(offsets) - 1,
+                )
+            )
+        os.replace(tmp_path, run_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+class SortedRun(Sequence):
+    """Lines of a sorted run, read from disk only when accessed.
+
+    The run is memory-mapped, so it stays readable if it is replaced or
+    removed. Lines are passed through ``parse`` before being returned.
+    Raises ValueError or ``struct.error`` if the file is not a sorted run.
+    """
+
+    def __init__(self, run_path, parse=bytes.decode):
+        self.run_path = run_path
+        self._parse = parse
+        self._reverse = False
+        with open(run_path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        trailer_start = len(self._mmap) - RUN_TRAILER.size
+        (
+            magic,
+            self.source_size,
+            self.source_mtime_ns,
+            self._count,
+        ) = RUN_TRAILER.unpack_from(self._mmap, trailer_start)
+        offsets_start = trailer_start - 8 * (self._count + 1)
+        if magic != RUN_MAGIC or offsets_start < 0:
+            self._mmap.close()
+            raise ValueError(f"Not a sorted run: {run_path}")
+        self._offsets = memoryview(self._mmap)[
+            offsets_start:trailer_start
+        ].cast("Q")
+        self._start = 0
+        self._stop = self._count
+
+    def is_current(self, source_path):
+        stat = os.stat(source_path)
+        return (stat.st_size, stat.st_mtime_ns) == (
+            self.source_size,
+            self.source_mtime_ns,
+        )
+
+    def _window(self, reverse, start, stop):
+        """Return a view of lines ``start:stop`` of the same mapping."""
+        run = copy.copy(self)
+        run._reverse = reverse
+        run._start = start
+        run._stop = stop
+        return run
+
+    def reversed(self):
+        return self._window(not self._reverse, self._start, self._stop)
+
+    def username_lines(self, username, prefix=False):
+        """Return the lines of a username, or of a prefix of one.
+
+        Lines are sorted by username first, so matches are contiguous and
+        two binary searches over the offsets find them, reading O(log n)
+        lines. Usernames are the first field of ``records.sort_key``, like
+        the columnar index's, whatever whitespace surrounds them.
+        """
+        username = username.encode()
+        length = len(username) if prefix else None
+
+        def key(i):
+            line = self._mmap[self._offsets[i] : self._offsets[i + 1]]
+            return sort_key(line)[0][:length]
+
+        lines = range(self._start, self._stop)
+        start = bisect_left(lines, username, key=key)
+        end = bisect_right(lines, username, key=key, lo=start)
+        return self._window(
+            self._reverse, start + self._start, end + self._start
+        )
+
+    def __len__(self):
+        return self._stop - self._start
+
+    def __iter__(self):
+        # One read per block of lines instead of one per line.
+        for start in range(0, len(self), ITER_BLOCK_LINES):
+            yield from self[start : start + ITER_BLOCK_LINES]
+
+    def _read(self, start, end):
+        """Return the parsed lines ``start:end`` in ascending order."""
+        if start >= end:
+            return []
+        start += self._start
+        end += self._start
+        block = self._mmap[self._offsets[start] : self._offsets[end]]
+        return [self._parse(line) for line in block.split(b"\n")[:-1]]
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            start, stop, step = item.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            if not self._reverse:
+                return self._read(start, stop)
+            count = len(self)
+            lines = self._read(count - max(stop, start), count - start)
+            lines.reverse()
+            return lines
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError("line index out of range")
+        if self._reverse:
+            item = len(self) - 1 - item
+        return self._read(item, item + 1)[0]
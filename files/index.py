@@ -0,0 +1,491 @@
+"""Columnar sidecar index for uploaded files.
+
+The index is written once a file is uploaded, merged with the records
+of each append, and memory-mapped by the query views, so they work on
+fixed-width arrays instead of re-reading and re-tokenizing the text file
+on every request.
+
+Layout (native byte order, every section 8-byte aligned)::
+
+    header            HEADER
+    messages          Q * count   inbox message count per record
+    size              Q * count   size per record
+    order             Q * count   record numbers sorted like `sort`
+    by_messages       Q * count   record numbers sorted by message count
+    by_size           Q * count   record numbers sorted by size
+    username_offsets  Q * (count + 1)
+    folder_codes      I * count   positions in the folder table
+    usernames         UTF-8 bytes, sliced by username_offsets
+    folders           JSON list of folder names
+"""
+
+import array
+import json
+import mmap
+import os
+import struct
+from bisect import bisect_left, bisect_right
+from collections.abc import Sequence
+
+from .extsort import external_sort
+
+MAGIC = b"MBXIDX02"
+# magic, record count, source size, source mtime_ns, usernames length,
+# folders length
+HEADER = struct.Struct("=8sQQqQQ")
+DEFAULT_SORT_MEMORY_LIMIT = 256 * 1024 * 1024
+
+
+def _aligned(length):
+    return (length + 7) & ~7
+
+
+class IndexBuilder:
+    """Accumulate parsed records and write them as a columnar index."""
+
+    def __init__(self, sort_memory_limit=DEFAULT_SORT_MEMORY_LIMIT):
+        self.messages = array.array("Q")
+        self.size = array.array("Q")
+        self.username_offsets = array.array("Q", [0])
+        self.usernames = bytearray()
+        self.folder_codes = array.array("I")
+        self.folders = {}
+        self.sort_memory_limit = sort_memory_limit
+
+    def __len__(self):
+        return len(self.size)
+
+    def add(self, record):
+        username, folder, messages, size = record
+        self.messages.append(messages)
+        self.size.append(size)
+        self.usernames += username
+        self.username_offsets.append(len(self.usernames))
+        self.folder_codes.append(
+            self.folders.setdefault(folder, len(self.folders))
+        )
+
+    def _sort(self, items, tmp_dir):
+        # Record numbers come last in every item, so ties stay in file order.
+        return array.array(
+            "Q",
+            (
+                item[-1]
+                for item in external_sort(
+                    items, self.sort_memory_limit, tmp_dir
+                )
+            ),
+        )
+
+    def _order(self, tmp_dir):
+        # Usernames are compared as UTF-8 bytes, the order `sort` uses under
+        # the C locale; this is the order of ``records.sort_key``.
+        folders = list(self.folders)
+        items = ((*self._key(i, folders), i) for i in range(len(self)))
+        return self._sort(items, tmp_dir)
+
+    def _sorted_by(self, column, tmp_dir):
+        return self._sort(
+            ((value, i) for i, value in enumerate(column)), tmp_dir
+        )
+
+    def write(self, index_path, source_path, stat=None):
+        """Atomically write the index for the file at ``source_path``.
+
+        ``stat`` is the ``os.stat`` of the file the index was built from,
+        if it may have changed since.
+        """
+        stat = stat or os.stat(source_path)
+        tmp_dir = os.path.dirname(index_path)
+        _write_index(
+            index_path,
+            stat,
+            len(self),
+            [str(folder, "utf-8", "replace") for folder in self.folders],
+            [
+                [self.messages],
+                [self.size],
+                [self._order(tmp_dir)],
+                [self._sorted_by(self.messages, tmp_dir)],
+                [self._sorted_by(self.size, tmp_dir)],
+                [self.username_offsets],
+                [self.folder_codes],
+                [self.usernames],
+            ],
+        )
+
+    def _key(self, i, folders):
+        return (
+            bytes(
+                self.usernames[
+                    self.username_offsets[i] : self.username_offsets[i + 1]
+                ]
+            ),
+            folders[self.folder_codes[i]],
+            self.messages[i],
+            self.size[i],
+        )
+
+
+def _write_index(index_path, stat, count, folder_names, sections):
+    """Atomically write an index.
+
+    ``sections`` holds, in layout order from ``messages`` to ``usernames``,
+    the list of buffers each section is made of.
+    """
+    folders = json.dumps(folder_names).encode()
+    header = HEADER.pack(
+        MAGIC,
+        count,
+        stat.st_size,
+        stat.st_mtime_ns,
+        sum(memoryview(buffer).nbytes for buffer in sections[-1]),
+        len(folders),
+    )
+    tmp_path = f"{index_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        for buffers in ([header], *sections, [folders]):
+            length = 0
+            for buffer in buffers:
+                data = memoryview(buffer).cast("B")
+                f.write(data)
+                length += len(data)
+            f.write(b"\0" * (_aligned(length) - length))
+    os.replace(tmp_path, index_path)
+
+
+def _merge(permutation, delta_permutation, base, key, delta_key):
+    """Merge the delta's sorted record numbers into a sorted permutation.
+
+    Delta records come after every record of the index, so on equal keys
+    they go last, as a full sort would put them. Returns the buffers of
+    the merged permutation: slices of ``permutation`` between runs of
+    delta records.
+    """
+    buffers = []
+    run = array.array("Q")
+    start = 0
+    for j in delta_permutation:
+        position = bisect_right(permutation, delta_key(j), lo=start, key=key)
+        if position > start:
+            buffers += [run, permutation[start:position]]
+            run = array.array("Q")
+            start = position
+        run.append(base + j)
+    buffers += [run, permutation[start:]]
+    return buffers
+
+
+def merge_index(index, delta, index_path, source_path, stat=None):
+    """Write ``index`` with the records of ``delta``, an IndexBuilder, added.
+
+    Only the delta is sorted; each of its records is placed in the sorted
+    permutations of ``index`` with a binary search, and the columns are
+    copied from the mapped index in blocks. The Python-level work grows
+    with the delta (times the log of the record count), not with the file.
+    ``index`` must stay open until this returns.
+    """
+    stat = stat or os.stat(source_path)
+    tmp_dir = os.path.dirname(index_path)
+    base = index.count
+
+    folder_names = list(index.folders)
+    codes = {name: code for code, name in enumerate(folder_names)}
+    folder_map = []
+    for folder in delta.folders:
+        name = str(folder, "utf-8", "replace")
+        if name not in codes:
+            codes[name] = len(folder_names)
+            folder_names.append(name)
+        folder_map.append(codes[name])
+    folder_codes = array.array(
+        "I", (folder_map[c] for c in delta.folder_codes)
+    )
+    username_offsets = array.array(
+        "Q",
+        (
+            len(index.usernames) + offset
+            for offset in delta.username_offsets[1:]
+        ),
+    )
+
+    index_folders = [name.encode() for name in index.folders]
+    delta_folders = list(delta.folders)
+
+    def key(i):
+        return (
+            index._username_bytes(i),
+            index_folders[index.folder_codes[i]],
+            index.messages[i],
+            index.size[i],
+        )
+
+    _write_index(
+        index_path,
+        stat,
+        base + len(delta),
+        folder_names,
+        [
+            [index.messages, delta.messages],
+            [index.size, delta.size],
+            _merge(
+                index.order,
+                delta._order(tmp_dir),
+                base,
+                key,
+                lambda j: delta._key(j, delta_folders),
+            ),
+            _merge(
+                index.by_messages,
+                delta._sorted_by(delta.messages, tmp_dir),
+                base,
+                index.messages.__getitem__,
+                delta.messages.__getitem__,
+            ),
+            _merge(
+                index.by_size,
+                delta._sorted_by(delta.size, tmp_dir),
+                base,
+                index.size.__getitem__,
+                delta.size.__getitem__,
+            ),
+            [index.username_offsets, username_offsets],
+            [index.folder_codes, folder_codes],
+            [index.usernames, delta.usernames],
+        ],
+    )
+
+
+class ColumnarIndex:
+    """Read-only, memory-mapped view of an index written by IndexBuilder.
+
+    Columns are exposed as memoryviews over the mapping, so no data is
+    copied until records are materialized for a response. Raises
+    ValueError or ``struct.error`` if the file is not a complete index.
+    """
+
+    def __init__(self, index_path):
+        with open(index_path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._views = []
+        try:
+            self._map_columns(index_path)
+        except BaseException:
+            self.close()
+            raise
+
+    def _map_columns(self, index_path):
+        (
+            magic,
+            self.count,
+            self.source_size,
+            self.source_mtime_ns,
+            usernames_length,
+            folders_length,
+        ) = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            raise ValueError(f"Not a columnar index: {index_path}")
+
+        self._offset = _aligned(HEADER.size)
+        self._offsets = {}
+        self.messages = self._column("messages", "Q", self.count)
+        self.size = self._column("size", "Q", self.count)
+        self.order = self._column("order", "Q", self.count)
+        self.by_messages = self._column("by_messages", "Q", self.count)
+        self.by_size = self._column("by_size", "Q", self.count)
+        self.username_offsets = self._column(
+            "username_offsets", "Q", self.count + 1
+        )
+        self.folder_codes = self._column("folder_codes", "I", self.count)
+        self.usernames = self._column("usernames", "B", usernames_length)
+        self.folders = json.loads(
+            bytes(self._column("folders", "B", folders_length))
+        )
+
+    def _column(self, name, typecode, length):
+        nbytes = struct.calcsize(typecode) * length
+        if self._offset + nbytes > len(self._mmap):
+            raise ValueError(f"Truncated columnar index, in {name}")
+        self._offsets[name] = self._offset
+        view = memoryview(self._mmap)[self._offset : self._offset + nbytes]
+        column = view.cast(typecode)
+        # Every view must be released before the mapping can be closed.
+        self._views += [column, view]
+        self._offset += _aligned(nbytes)
+        return column
+
+    def close(self):
+        for view in self._views:
+            view.release()
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def is_current(self, source_path):
+        stat = os.stat(source_path)
+        return (stat.st_size, stat.st_mtime_ns) == (
+            self.source_size,
+            self.source_mtime_ns,
+        )
+
+    def username(self, i):
+        start = self.username_offsets[i]
+        end = self.username_offsets[i + 1]
+        return str(self.usernames[start:end], "utf-8", "replace")
+
+    def record(self, i):
+        """Return record ``i`` shaped like ``parse_line`` output."""
+        return {
+            "username": self.username(i),
+            "folder": self.folders[self.folder_codes[i]],
+            "numberMessages": self.messages[i],
+            "size": self.size[i],
+        }
+
+    def _first_index(self, column, value):
+        # Search the mapped bytes directly instead of copying the column.
+        start = self._offsets[column]
+        end = start + self.count * 8
+        needle = struct.pack("=Q", value)
+        position = self._mmap.find(needle, start, end)
+        while (position - start) % 8:
+            position = self._mmap.find(needle, position + 1, end)
+        return (position - start) // 8
+
+    def max_size(self):
+        if not self.count:
+            return []
+        return [self.record(self._first_index("size", max(self.size)))]
+
+    def min_size(self):
+        if not self.count:
+            return []
+        return [self.record(self._first_index("size", min(self.size)))]
+
+    def order_by_username(self, desc=False):
+        return RecordSequence(self, self.order, reverse=desc)
+
+    def _username_bytes(self, i, length=None):
+        start = self.username_offsets[i]
+        end = self.username_offsets[i + 1]
+        if length is not None:
+            end = min(end, start + length)
+        return bytes(self.usernames[start:end])
+
+    def username_positions(self, username, prefix=False):
+        """Return the slice of ``order`` for a username, or a prefix of one.
+
+        ``order`` is sorted by username first, so the matches are contiguous
+        and found with two binary searches, O(log n) in the record count.
+        """
+        username = username.encode()
+        length = len(username) if prefix else None
+
+        def key(i):
+            return self._username_bytes(i, length)
+
+        start = bisect_left(self.order, username, key=key)
+        end = bisect_right(self.order, username, key=key, lo=start)
+        return self.order[start:end]
+
+    def find_username(self, username):
+        return RecordSequence(self, self.username_positions(username))
+
+    def username_prefix(self, prefix, desc=False):
+        return RecordSequence(
+            self, self.username_positions(prefix, prefix=True), reverse=desc
+        )
+
+    def _range_positions(self, column, permutation, low, high):
+        """Return, in file order, the record numbers with low <= value <= high.
+
+        Two binary searches over the sorted permutation find the matching
+        slice, whose length is the count; only the matches themselves are
+        sorted back into file order.
+        """
+        start = bisect_left(permutation, low, key=column.__getitem__)
+        end = bisect_right(permutation, high, key=column.__getitem__)
+        return array.array("Q", sorted(permutation[start:end]))
+
+    def between_msgs_positions(self, min_msgs, max_msgs):
+        return self._range_positions(
+            self.messages, self.by_messages, min_msgs, max_msgs
+        )
+
+    def between_msgs(self, min_msgs, max_msgs):
+        return RecordSequence(
+            self, self.between_msgs_positions(min_msgs, max_msgs)
+        )
+
+    def between_size_positions(self, min_size, max_size):
+        return self._range_positions(
+            self.size, self.by_size, min_size, max_size
+        )
+
+    def between_size(self, min_size, max_size):
+        return RecordSequence(
+            self, self.between_size_positions(min_size, max_size)
+        )
+
+    def top_positions(self, field, k, desc=True):
+        """Return the record numbers of the ``k`` largest (or smallest) values.
+
+        The sorted permutation already holds the answer at either end; ties
+        keep file order, so for the largest values the group of ties at the
+        cut is found by binary search and put back in file order.
+        """
+        column = getattr(self, field)
+        permutation = self.by_messages if field == "messages" else self.by_size
+        k = min(k, self.count)
+        if not desc:
+            return array.array("Q", permutation[:k])
+        if not k:
+            return array.array("Q")
+        start = bisect_left(
+            permutation,
+            column[permutation[self.count - k]],
+            key=column.__getitem__,
+        )
+        positions = sorted(permutation[start:], key=lambda i: (-column[i], i))
+        return array.array("Q", positions[:k])
+
+    def top(self, field, k, desc=True):
+        return RecordSequence(self, self.top_positions(field, k, desc))
+
+
+class RecordSequence(Sequence):
+    """Records of an index in the order given by ``positions``.
+
+    Records are only materialized when accessed, so paginating a result
+    costs the page size rather than the length of the result. The
+    sequence keeps the index mapped for as long as it is referenced.
+    """
+
+    def __init__(self, index, positions, reverse=False):
+        self._index = index
+        self._positions = positions
+        self._reverse = reverse
+
+    def __len__(self):
+        return len(self._positions)
+
+    def _record(self, i):
+        if self._reverse:
+            i = len(self._positions) - 1 - i
+        return self._index.record(self._positions[i])
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self._record(i) for i in range(*item.indices(len(self)))]
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError("record index out of range")
+        return self._record(item)
@@ -0,0 +1,352 @@
+"""Background builds of the derived data of uploaded files.
+
+Uploads only store the file; its columnar index, ingest summary and
+rollups are built by a job on a process pool, so a large upload returns
+as soon as it is written. Until they are ready the derived data of the
+previous version, if any, is stale, and queries fall back to scanning the
+file like they do for files that were never indexed.
+
+A job builds one version (size and mtime) of a file. Submitting a version
+that is already queued or building returns its job. Submitting a new
+version cancels the job of the old one if it hasn't started, removing its
+status; a running job notices that its file was replaced and stops without
+writing anything. Derived data is written to temporary files first; the
+last check happens under the lock uploads and appends change the file
+under, together with the renames that put those files in place.
+Jobs record their state in a status file per version in the file's index
+directory, so any server process can report it.
+
+The pool also recomputes the SHA-256 of files that were appended to.
+
+Nothing here touches the database: jobs run in spawned processes, without
+Django's app registry.
+"""
+
+import fcntl
+import glob
+import hashlib
+import json
+import logging
+import os
+import struct
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from functools import partial
+
+from . import pools
+from .index import ColumnarIndex, IndexBuilder
+from .records import LineSplitter, parse_record
+from .rollups import RollupBuilder
+from .storage import open_upload
+from .summary import SummaryBuilder
+
+INDEX_FILE_NAME = "columns.idx"
+SUMMARY_FILE_NAME = "summary.json"
+ROLLUPS_FILE_NAME = "rollups.json"
+SORTED_RUN_FILE_NAME = "sorted.txt"
+# Held while the file is replaced or appended to and while derived data is
+# written; see ``lock``.
+LOCK_FILE_NAME = "lock"
+
+PENDING = "pending"
+BUILDING = "building"
+READY = "ready"
+FAILED = "failed"
+# A file that was never submitted, such as one copied into the upload
+# directory by hand.
+UNINDEXED = "unindexed"
+
+READ_SIZE = 1024 * 1024
+# Chunks read between two checks that the file wasn't replaced.
+CHECK_EVERY = 64
+
+
+class Superseded(Exception):
+    """The file was replaced while its derived data was being built."""
+
+
+def file_version(stat):
+    return stat.st_size, stat.st_mtime_ns
+
+
+def status_path(index_dir, version):
+    size, mtime_ns = version
+    return os.path.join(index_dir, f"status-{size}-{mtime_ns}.json")
+
+
+def write_status(index_dir, version, state, error=None):
+    os.makedirs(index_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=index_dir, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(
+            {
+                "state": state,
+                "error": error,
+                "updated_at": datetime.now(timezone.utc).isoformat(),
+            },
+            f,
+        )
+    os.replace(tmp_path, status_path(index_dir, version))
+
+
+def remove_status(index_dir, version):
+    try:
+        os.remove(status_path(index_dir, version))
+    except FileNotFoundError:
+        pass
+
+
+def remove_statuses(index_dir, keep):
+    """Remove the status files of every version but ``keep``."""
+    for path in glob.glob(os.path.join(index_dir, "status-*.json")):
+        if path != status_path(index_dir, keep):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+@contextmanager
+def lock(index_dir):
+    """Hold the lock on changes to a file and to its derived data.
+
+    Taken on a file in the index directory rather than on the upload
+    itself, which uploads replace with a new inode.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    with open(os.path.join(index_dir, LOCK_FILE_NAME), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+def get_status(file_path, index_dir):
+    """Return the indexing state of the current version of a file.
+
+    A dict with "state", "error" (for failed builds) and "updated_at",
+    when the job last changed state, if a job recorded them.
+    """
+    version = file_version(os.stat(file_path))
+    try:
+        with open(status_path(index_dir, version)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        pass
+    # Indexed before jobs recorded their state.
+    index_path = os.path.join(index_dir, INDEX_FILE_NAME)
+    if os.path.exists(index_path):
+        try:
+            index = ColumnarIndex(index_path)
+        except (OSError, ValueError, struct.error):
+            # Reported like a missing index; it is rebuilt on the next
+            # upload or ``index_file``.
+            return {"state": UNINDEXED, "error": None, "updated_at": None}
+        try:
+            if index.is_current(file_path):
+                return {"state": READY, "error": None, "updated_at": None}
+        finally:
+            index.close()
+    return {"state": UNINDEXED, "error": None, "updated_at": None}
+
+
+def add_records(builders, lines):
+    for line in lines:
+        record = parse_record(line)
+        if record is not None:
+            for builder in builders:
+                builder.add(record)
+
+
+def check_version(file_path, version):
+    if file_version(os.stat(file_path)) != version:
+        raise Superseded(file_path)
+
+
+def build_derived_data(file_path, index_dir, version, memory_limit):
+    """Build and write the derived data of one version of a file.
+
+    Returns the file's record count, or None if the file was replaced
+    before the build finished.
+    """
+    write_status(index_dir, version, BUILDING)
+    try:
+        count = _build(file_path, index_dir, version, memory_limit)
+    except Superseded:
+        remove_status(index_dir, version)
+        return None
+    except Exception as e:
+        write_status(index_dir, version, FAILED, str(e))
+        raise
+    write_status(index_dir, version, READY)
+    remove_statuses(index_dir, keep=version)
+    return count
+
+
+def _build(file_path, index_dir, version, memory_limit):
+    check_version(file_path, version)
+    lines = LineSplitter()
+    index_builder = IndexBuilder(memory_limit)
+    summary_builder = SummaryBuilder()
+    rollup_builder = RollupBuilder()
+    builders = (index_builder, summary_builder, rollup_builder)
+    with open_upload(file_path) as f:
+        # The open file stays the version that was checked, even if it is
+        # replaced; the checks catch that and end the build early.
+        stat = os.fstat(f.fileno())
+        if file_version(stat) != version:
+            raise Superseded(file_path)
+        for i, chunk in enumerate(iter(lambda: f.read(READ_SIZE), b"")):
+            if i % CHECK_EVERY == CHECK_EVERY - 1:
+                check_version(file_path, version)
+            add_records(builders, lines.feed(chunk))
+        add_records(builders, lines.close())
+
+    # Written, sorts included, to temporary files first: uploads and
+    # appends of the file wait on the lock, so it is only held to move
+    # them into place.
+    staged = {}
+    try:
+        for name, builder in (
+            (INDEX_FILE_NAME, index_builder),
+            (SUMMARY_FILE_NAME, summary_builder),
+            (ROLLUPS_FILE_NAME, rollup_builder),
+        ):
+            check_version(file_path, version)
+            fd, staged[name] = tempfile.mkstemp(
+                dir=index_dir, prefix=f"{name}.", suffix=".tmp"
+            )
+            os.close(fd)
+            builder.write(staged[name], file_path, stat)
+        # Uploads and appends change the file under the lock, so the
+        # version can't change before the files are in place, and a build
+        # of an older version can't replace those of a newer one.
+        with lock(index_dir):
+            check_version(file_path, version)
+            for name, staged_path in staged.items():
+                os.replace(staged_path, os.path.join(index_dir, name))
+            # The index answers the username ordering from now on. Runs
+            # being read stay mapped until they are closed; older runs kept
+            # their offsets in a second file.
+            for name in (
+                SORTED_RUN_FILE_NAME,
+                f"{SORTED_RUN_FILE_NAME}.offsets",
+            ):
+                try:
+                    os.remove(os.path.join(index_dir, name))
+                except FileNotFoundError:
+                    pass
+    finally:
+        for staged_path in staged.values():
+            try:
+                os.remove(staged_path)
+            except FileNotFoundError:
+                pass
+    return summary_builder.count
+
+
+_pool = pools.PoolSlot()
+
+# The queued or running job of each file: ``(version, future)``.
+_jobs = {}
+# Reentrant: cancelling a queued job runs its callback, ``_finished``,
+# in the thread that cancels it, which holds the lock.
+_jobs_lock = threading.RLock()
+
+
+def get_executor(workers):
+    return pools.get_executor(_pool, workers)
+
+
+def submit(file_path, index_dir, memory_limit, workers, on_done=None):
+    """Build the derived data of the current version of ``file_path``.
+
+    With ``workers`` 0 the build runs here; otherwise it is queued on the
+    pool and its future returned. ``on_done(version, record_count)`` is
+    called once the build succeeds, from the pool's result thread.
+    """
+    version = file_version(os.stat(file_path))
+    if not workers:
+        try:
+            count = build_derived_data(
+                file_path, index_dir, version, memory_limit
+            )
+        except Exception as e:
+            logging.error("Error indexing %s: %s", file_path, str(e))
+            return None
+        if count is not None and on_done:
+            on_done(version, count)
+        return None
+
+    with _jobs_lock:
+        job = _jobs.get(file_path)
+        if job is not None:
+            job_version, future = job
+            if job_version == version and not future.done():
+                return future
+            # A running job stops on its own when it sees the new version.
+            if future.cancel():
+                remove_status(index_dir, job_version)
+        write_status(index_dir, version, PENDING)
+        future = get_executor(workers).submit(
+            build_derived_data, file_path, index_dir, version, memory_limit
+        )
+        _jobs[file_path] = (version, future)
+    future.add_done_callback(partial(_finished, file_path, version, on_done))
+    return future
+
+
+def _finished(file_path, version, on_done, future):
+    with _jobs_lock:
+        job = _jobs.get(file_path)
+        if job is not None and job[1] is future:
+            del _jobs[file_path]
+    _report(file_path, version, on_done, future)
+
+
+def _report(file_path, version, on_done, future):
+    if future.cancelled():
+        return
+    try:
+        result = future.result()
+    except Exception as e:
+        logging.error("Error indexing %s: %s", file_path, str(e))
+        return
+    if result is not None and on_done:
+        on_done(version, result)
+
+
+def hash_contents(file_path, version):
+    """Return the SHA-256 of one version of a file's content.
+
+    Returns None if the file was replaced or appended to before the hash
+    was finished.
+    """
+    content_hash = hashlib.sha256()
+    try:
+        with open_upload(file_path) as f:
+            if file_version(os.fstat(f.fileno())) != version:
+                return None
+            for chunk in iter(lambda: f.read(READ_SIZE), b""):
+                content_hash.update(chunk)
+        check_version(file_path, version)
+    except Superseded:
+        return None
+    return content_hash.hexdigest()
+
+
+def submit_hash(file_path, workers, on_done):
+    """Hash the content of the current version of ``file_path``.
+
+    Like ``submit``, in the pool unless ``workers`` is 0, and
+    ``on_done(version, sha256)`` is called with the result.
+    """
+    version = file_version(os.stat(file_path))
+    if not workers:
+        sha256 = hash_contents(file_path, version)
+        if sha256 is not None:
+            on_done(version, sha256)
+        return None
+    future = get_executor(workers).submit(hash_contents, file_path, version)
+    future.add_done_callback(partial(_report, file_path, version, on_done))
+    return future
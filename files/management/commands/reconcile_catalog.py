@@ -0,0 +1,73 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from files.models import UploadedFile
+from files.uploads import delete_expired_sessions
+from files.utils import catalog_fields, scan_file_contents, update_catalog
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the uploaded files catalog from MEDIA_ROOT/uploaded_files: "
+        "add files missing from it, refresh the changed ones and drop "
+        "entries whose file is gone. Also deletes expired resumable "
+        "uploads."
+    )
+
+    def handle(self, *args, **options):
+        upload_dir = os.path.join(settings.MEDIA_ROOT, "uploaded_files")
+        catalog = {
+            entry.name: entry
+            for entry in UploadedFile.objects.only(
+                "name", "stored_size", "mtime_ns"
+            )
+        }
+        added = updated = 0
+
+        if os.path.isdir(upload_dir):
+            with os.scandir(upload_dir) as entries:
+                for dir_entry in entries:
+                    name = dir_entry.name
+                    # Skips in-progress uploads, which start with a dot.
+                    if name.startswith(".") or not dir_entry.is_file():
+                        continue
+                    stat = dir_entry.stat()
+                    entry = catalog.pop(name, None)
+                    # Size and mtime unchanged: skip rehashing the file.
+                    if entry is not None and (
+                        entry.stored_size,
+                        entry.mtime_ns,
+                    ) == (
+                        stat.st_size,
+                        stat.st_mtime_ns,
+                    ):
+                        continue
+                    fields = catalog_fields(
+                        dir_entry.path, *scan_file_contents(dir_entry.path)
+                    )
+                    update_catalog(name, fields)
+                    if entry is None:
+                        added += 1
+                    else:
+                        updated += 1
+
+        # In batches, to stay under SQLite's limit on query parameters.
+        missing = list(catalog)
+        removed = 0
+        for start in range(0, len(missing), BATCH_SIZE):
+            batch = missing[start : start + BATCH_SIZE]
+            removed += UploadedFile.objects.filter(name__in=batch).delete()[0]
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Catalog reconciled: {added} added, {updated} updated, "
+                f"{removed} removed."
+            )
+        )
+        expired = delete_expired_sessions()
+        self.stdout.write(
+            self.style.SUCCESS(f"Expired upload sessions deleted: {expired}.")
+        )
@@ -0,0 +1,451 @@
+"""Request and query-stage metrics, exposed in the Prometheus text format.
+
+Counters and histograms are plain sums, so every process keeps its own
+values and ``/metrics`` adds them up. With ``FILES_METRICS_DIR`` set, each
+process writes its values to ``<pid>.db`` in that directory, a small
+memory-mapped file where an update is a single in-place write, and the
+endpoint reads the files of every process: whichever gunicorn worker
+answers the scrape reports the totals of all of them. The directory
+should be emptied when the server starts (``gunicorn.conf.py`` does).
+Without it, values are kept in memory and only the answering process is
+reported.
+"""
+
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import ContextDecorator
+from math import inf
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from rest_framework.renderers import JSONRenderer
+
+# Upper bounds, in seconds, of the latency histogram buckets.
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    inf,
+)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Bytes in use, at the start of every metrics file.
+USED = struct.Struct("=Q")
+# Key length, then the key padded to 8 bytes and the float64 value.
+KEY_LENGTH = struct.Struct("=I")
+VALUE = struct.Struct("=d")
+INITIAL_FILE_SIZE = 64 * 1024
+
+
+def _padded(length):
+    return (length + 7) & ~7
+
+
+class MemoryValues:
+    """Values of the current process, kept in a list."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = {}
+        self._values = []
+
+    def slot(self, key):
+        with self._lock:
+            if key not in self._keys:
+                self._keys[key] = len(self._values)
+                self._values.append(0.0)
+            return self._keys[key]
+
+    def add(self, slot, amount):
+        with self._lock:
+            self._values[slot] += amount
+
+    def items(self):
+        with self._lock:
+            return [(key, self._values[i]) for key, i in self._keys.items()]
+
+
+class MappedValues:
+    """Values of the current process, kept in a memory-mapped file.
+
+    Entries are only ever appended, and the count of bytes in use is
+    updated after an entry is complete, so other processes can read the
+    file at any time with ``read_values``.
+    """
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._file = os.fdopen(os.open(path, os.O_RDWR | os.O_CREAT), "r+b")
+        if os.fstat(self._file.fileno()).st_size < INITIAL_FILE_SIZE:
+            self._file.truncate(INITIAL_FILE_SIZE)
+        self._mmap = mmap.mmap(self._file.fileno(), 0)
+        self._keys = {}
+        (self._used,) = USED.unpack_from(self._mmap)
+        if self._used == 0:
+            self._used = USED.size
+            USED.pack_into(self._mmap, 0, self._used)
+        # Reopening a file left by an earlier process with the same pid
+        # carries on from its values.
+        for key, offset, _ in _entries(self._mmap, self._used):
+            self._keys[key] = offset
+
+    def _grow(self, needed):
+        size = len(self._mmap)
+        while size < needed:
+            size *= 2
+        self._mmap.close()
+        self._file.truncate(size)
+        self._mmap = mmap.mmap(self._file.fileno(), 0)
+
+    def slot(self, key):
+        with self._lock:
+            if key in self._keys:
+                return self._keys[key]
+            encoded = key.encode()
+            offset = self._used + KEY_LENGTH.size + _padded(len(encoded))
+            end = offset + VALUE.size
+            if end > len(self._mmap):
+                self._grow(end)
+            KEY_LENGTH.pack_into(self._mmap, self._used, len(encoded))
+            start = self._used + KEY_LENGTH.size
+            self._mmap[start : start + len(encoded)] = encoded
+            VALUE.pack_into(self._mmap, offset, 0.0)
+            self._used = end
+            USED.pack_into(self._mmap, 0, self._used)
+            self._keys[key] = offset
+            return offset
+
+    def add(self, slot, amount):
+        with self._lock:
+            (value,) = VALUE.unpack_from(self._mmap, slot)
+            VALUE.pack_into(self._mmap, slot, value + amount)
+
+    def items(self):
+        with self._lock:
+            return [
+                (key, value)
+                for key, _, value in _entries(self._mmap, self._used)
+            ]
+
+
+def _entries(data, used):
+    position = USED.size
+    while position < used:
+        (length,) = KEY_LENGTH.unpack_from(data, position)
+        start = position + KEY_LENGTH.size
+        key = bytes(data[start : start + length]).decode()
+        offset = start + _padded(length)
+        (value,) = VALUE.unpack_from(data, offset)
+        yield key, offset, value
+        position = offset + VALUE.size
+
+
+def read_values(path):
+    """Return the ``(key, value)`` pairs of another process's file."""
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) < USED.size:
+        return []
+    (used,) = USED.unpack_from(data)
+    return [(key, value) for key, _, value in _entries(data, used)]
+
+
+_store = None
+_store_pid = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Return this process's value store, creating it after a fork."""
+    global _store, _store_pid
+    pid = os.getpid()
+    if _store_pid != pid:
+        with _store_lock:
+            if _store_pid != pid:
+                metrics_dir = settings.FILES_METRICS_DIR
+                if metrics_dir:
+                    os.makedirs(metrics_dir, exist_ok=True)
+                    _store = MappedValues(
+                        os.path.join(metrics_dir, f"{pid}.db")
+                    )
+                else:
+                    _store = MemoryValues()
+                _store_pid = pid
+                for metric in REGISTRY.values():
+                    metric.reset_slots()
+    return _store
+
+
+def reset():
+    """Start over with an empty store; used by the tests."""
+    global _store, _store_pid
+    with _store_lock:
+        _store = _store_pid = None
+
+
+REGISTRY = {}
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._slots = {}
+        REGISTRY[name] = self
+
+    def reset_slots(self):
+        self._slots = {}
+
+    def _labels(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        store = get_store()
+        values = self._labels(labels)
+        slot = self._slots.get(values)
+        if slot is None:
+            slot = self._slots[values] = store.slot(
+                json.dumps([self.name, values])
+            )
+        store.add(slot, amount)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=None):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets or DEFAULT_BUCKETS
+
+    def observe(self, value, **labels):
+        store = get_store()
+        values = self._labels(labels)
+        slots = self._slots.get(values)
+        if slots is None:
+            # Per-bucket counts (made cumulative on exposition), sum and
+            # count.
+            slots = self._slots[values] = [
+                store.slot(json.dumps([self.name, values, i]))
+                for i in range(len(self.buckets) + 2)
+            ]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                store.add(slots[i], 1)
+                break
+        store.add(slots[-2], value)
+        store.add(slots[-1], 1)
+
+    def time(self, **labels):
+        return Timer(self, labels)
+
+
+class Timer(ContextDecorator):
+    """Observe the seconds spent in a block or function."""
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def _recreate_cm(self):
+        # A fresh timer per call of a decorated function, so calls can
+        # overlap across threads.
+        return Timer(self.histogram, self.labels)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+REQUEST_DURATION = Histogram(
+    "files_request_duration_seconds",
+    "Time to produce a response, by endpoint.",
+    ("endpoint", "method", "status"),
+)
+STAGE_DURATION = Histogram(
+    "files_stage_duration_seconds",
+    "Time spent in each stage of answering a query.",
+    ("stage",),
+)
+SUBPROCESSES = Counter(
+    "files_subprocesses_total", "Query scripts run.", ("script",)
+)
+BYTES_READ = Counter(
+    "files_bytes_read_total",
+    "Bytes read to answer queries: script output or scanned files.",
+    ("source",),
+)
+RECORDS_PARSED = Counter(
+    "files_records_parsed_total", "Lines parsed into records."
+)
+
+
+def timed(stage):
+    """Time a block or function as ``stage`` of the query pipeline."""
+    return STAGE_DURATION.time(stage=stage)
+
+
+def collect():
+    """Sum the values of every process, by key."""
+    metrics_dir = settings.FILES_METRICS_DIR
+    if metrics_dir:
+        get_store()
+        sources = []
+        for entry in os.scandir(metrics_dir):
+            if entry.name.endswith(".db"):
+                try:
+                    sources.append(read_values(entry.path))
+                except OSError:
+                    # The file of a process that just went away.
+                    continue
+    else:
+        sources = [get_store().items()]
+
+    totals = {}
+    for items in sources:
+        for key, value in items:
+            totals[key] = totals.get(key, 0.0) + value
+    return totals
+
+
+def _format_value(value):
+    if value == inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ""
+    escaped = (
+        (
+            name,
+            value.replace("\\", r"\\")
+            .replace('"', r"\"")
+            .replace("\n", r"\n"),
+        )
+        for name, value in pairs
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def exposition():
+    """Render every metric in the Prometheus text format."""
+    samples = {}
+    for key, value in collect().items():
+        name, labels, *bucket = json.loads(key)
+        samples.setdefault(name, {}).setdefault(tuple(labels), {})[
+            bucket[0] if bucket else None
+        ] = value
+
+    lines = []
+    for name in sorted(REGISTRY):
+        metric = REGISTRY[name]
+        lines.append(f"# HELP {name} {metric.documentation}")
+        lines.append(f"# TYPE {name} {metric.type}")
+        for labels, values in sorted(samples.get(name, {}).items()):
+            if metric.type == "counter":
+                lines.append(
+                    f"{name}{_format_labels(metric.labelnames, labels)} "
+                    f"{_format_value(values[None])}"
+                )
+                continue
+            cumulative = 0.0
+            for i, bound in enumerate(metric.buckets):
+                cumulative += values.get(i, 0.0)
+                le = (("le", _format_value(bound)),)
+                lines.append(
+                    f"{name}_bucket"
+                    f"{_format_labels(metric.labelnames, labels, le)} "
+                    f"{_format_value(cumulative)}"
+                )
+            count = len(metric.buckets)
+            for suffix, i in (("sum", count), ("count", count + 1)):
+                lines.append(
+                    f"{name}_{suffix}"
+                    f"{_format_labels(metric.labelnames, labels)} "
+                    f"{_format_value(values.get(i, 0.0))}"
+                )
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """Observe the latency of every request, by URL name."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _observe(self, request, response, start):
+        match = request.resolver_match
+        REQUEST_DURATION.observe(
+            time.perf_counter() - start,
+            endpoint=match.url_name if match else "unmatched",
+            method=request.method,
+            status=response.status_code,
+        )
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start = time.perf_counter()
+        return self._observe(request, self.get_response(request), start)
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        return self._observe(request, await self.get_response(request), start)
+
+
+class TimedStreamHandler(logging.StreamHandler):
+    """Console handler that times the formatting and writing of records.
+
+    Query views log whole pages of records, so emitting a record can be a
+    stage of its own.
+    """
+
+    def handle(self, record):
+        with timed("log"):
+            return super().handle(record)
+
+
+class TimedJSONRenderer(JSONRenderer):
+    """JSON renderer that times the encoding of API responses."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with timed("render"):
+            return super().render(data, accepted_media_type, renderer_context)
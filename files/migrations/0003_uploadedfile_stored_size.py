@@ -0,0 +1,24 @@
+from django.db import migrations, models
+
+
+def copy_size(apps, schema_editor):
+    # Files cataloged so far were all stored uncompressed.
+    UploadedFile = apps.get_model("files", "UploadedFile")
+    UploadedFile.objects.update(stored_size=models.F("size"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("files", "0002_upload_session"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="uploadedfile",
+            name="stored_size",
+            field=models.BigIntegerField(default=0),
+            preserve_default=False,
+        ),
+        migrations.RunPython(copy_size, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-18 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("files", "0003_uploadedfile_stored_size"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="uploadedfile",
+            name="record_count",
+            field=models.BigIntegerField(null=True),
+        ),
+    ]
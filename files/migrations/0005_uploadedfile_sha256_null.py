@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-18 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("files", "0004_uploadedfile_record_count_null"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="uploadedfile",
+            name="sha256",
+            field=models.CharField(max_length=64, null=True),
+        ),
+    ]
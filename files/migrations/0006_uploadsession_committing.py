@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-18 16:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("files", "0005_uploadedfile_sha256_null"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="uploadsession",
+            name="committing",
+            field=models.BooleanField(default=False),
+        ),
+    ]
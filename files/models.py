@@ -0,0 +1,56 @@
+import uuid
+
+from django.db import models
+
+
+class UploadedFile(models.Model):
+    """Catalog entry for a file in ``MEDIA_ROOT/uploaded_files``.
+
+    Kept up to date by ``save_file`` and rebuilt from disk by the
+    ``reconcile_catalog`` command, so listings never have to scan the
+    upload directory.
+    """
+
+    name = models.CharField(max_length=255, unique=True)
+    size = models.BigIntegerField()
+    # Bytes on disk, which differ from ``size`` for compressed files.
+    stored_size = models.BigIntegerField()
+    mtime_ns = models.BigIntegerField()
+    # Counted by the file's indexing job; null until it is done.
+    record_count = models.BigIntegerField(null=True)
+    # Null while the hash of an appended-to file is recomputed.
+    sha256 = models.CharField(max_length=64, null=True)
+
+    class Meta:
+        ordering = ["name"]
+        indexes = [models.Index(fields=["size", "name"])]
+
+    def __str__(self):
+        return self.name
+
+
+class UploadSession(models.Model):
+    """A chunked upload in progress.
+
+    Chunks are stored as separate files under
+    ``MEDIA_ROOT/upload_sessions/<id>/`` until the session is committed.
+    """
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4)
+    file_name = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    chunk_size = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Set by the commit that claimed the session, so only one runs.
+    committing = models.BooleanField(default=False)
+
+    @property
+    def chunk_count(self):
+        return -(-self.size // self.chunk_size)
+
+    def chunk_length(self, number):
+        """Expected length of chunk ``number`` (0-based)."""
+        return min(self.chunk_size, self.size - number * self.chunk_size)
+
+    def __str__(self):
+        return f"{self.file_name} ({self.id})"
@@ -1,7 +1,179 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from bisect import bisect_left, bisect_right
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .metrics import timed
 
 
 class CustomPagination(PageNumberPagination):
     page_size = 10
     page_size_query_param = "page_size"
     max_page_size = 100
+
+    @timed("paginate")
+    def paginate_queryset(self, queryset, request, view=None):
+        return super().paginate_queryset(queryset, request, view)
+
+
+def username_key(record):
+    """Sort key matching the username order of the listings.
+
+    Fields are compared as UTF-8 bytes, the way `sort` and the columnar
+    index order lines.
+    """
+    return (
+        record["username"].encode(),
+        record["folder"].encode(),
+        record["numberMessages"],
+        record["size"],
+    )
+
+
+class _Reversed:
+    """Ascending view of a sequence sorted in descending order."""
+
+    def __init__(self, records):
+        self._records = records
+
+    def __len__(self):
+        return len(self._records)
+
+    def __getitem__(self, i):
+        return self._records[len(self._records) - 1 - i]
+
+
+class UsernameCursorPagination(BasePagination):
+    """Keyset pagination for the username-ordered listings.
+
+    The opaque cursor holds the key of the last (or, going back, the first)
+    record of the current page and its ordinal among the records with that
+    key, and the adjacent page is found by binary search over the sorted
+    records. Deep pages cost the same as the first
+    one, and a cursor stays valid while other files are uploaded.
+
+    Enabled with ``?pagination=cursor``; the returned links carry the
+    ``cursor`` parameter, which keeps cursor mode on.
+    """
+
+    cursor_query_param = "cursor"
+    mode_query_param = "pagination"
+    page_size = CustomPagination.page_size
+    page_size_query_param = CustomPagination.page_size_query_param
+    max_page_size = CustomPagination.max_page_size
+    invalid_cursor_message = "Invalid cursor"
+
+    def __init__(self, descending=False):
+        self.descending = descending
+
+    @classmethod
+    def is_requested(cls, request):
+        return (
+            cls.cursor_query_param in request.query_params
+            or request.query_params.get(cls.mode_query_param) == "cursor"
+        )
+
+    def get_page_size(self, request):
+        return CustomPagination.get_page_size(self, request)
+
+    def encode_cursor(self, position, reverse):
+        # Records can share a key, so the cursor also holds the record's
+        # ordinal among those with its key.
+        key = username_key(self.ascending[position])
+        ordinal = position - bisect_left(
+            self.ascending, key, hi=position, key=username_key
+        )
+        payload = json.dumps(
+            {
+                "k": [key[0].decode(), key[1].decode(), *key[2:]],
+                "n": ordinal,
+                "r": reverse,
+            }
+        )
+        encoded = urlsafe_b64encode(payload.encode()).decode()
+        url = remove_query_param(self.base_url, self.mode_query_param)
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None, 0, False
+        try:
+            payload = json.loads(urlsafe_b64decode(encoded.encode()))
+            username, folder, messages, size = payload["k"]
+            key = (
+                username.encode(),
+                folder.encode(),
+                int(messages),
+                int(size),
+            )
+            ordinal = int(payload["n"])
+            if ordinal < 0:
+                raise ValueError(ordinal)
+            return key, ordinal, bool(payload["r"])
+        except (TypeError, ValueError, KeyError, AttributeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    @timed("paginate")
+    def paginate_queryset(self, queryset, request, view=None):
+        """Return the page of ``queryset``, which must be in listing order."""
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+        ascending = _Reversed(queryset) if self.descending else queryset
+        total = len(ascending)
+        key, ordinal, reverse = self.decode_cursor(request)
+
+        # Work on ascending positions: "forward" means towards the end of
+        # the listing, which is towards lower keys when descending.
+        if key is None:
+            end = total if self.descending else page_size
+            start = end - page_size
+        else:
+            # The cursor's record, or where it would be if it was removed.
+            lowest = bisect_left(ascending, key, key=username_key)
+            highest = bisect_right(ascending, key, lo=lowest, key=username_key)
+            position = min(lowest + ordinal, highest)
+            if reverse != self.descending:
+                end = position
+                start = end - page_size
+            else:
+                start = min(position + 1, highest)
+                end = start + page_size
+        start = max(start, 0)
+        end = min(end, total)
+
+        page = [ascending[i] for i in range(start, end)]
+        if self.descending:
+            page.reverse()
+        has_lower = start > 0
+        has_higher = end < total
+        self.has_next = has_lower if self.descending else has_higher
+        self.has_previous = has_higher if self.descending else has_lower
+        self.ascending = ascending
+        # Ascending positions of the first and last records of the page.
+        self.bounds = (end - 1, start) if self.descending else (start, end - 1)
+        self.page = page
+        return page
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.bounds[1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.bounds[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(
+            {
+                "next": self.get_next_link(),
+                "previous": self.get_previous_link(),
+                "results": data,
+            }
+        )
@@ -0,0 +1,100 @@
+"""Parallel scans of a single file across a process pool.
+
+The file is split into newline-aligned byte ranges, each worker maps the
+file and scans its own range line by line with the ``files.engine`` line
+functions, and the partial results are reduced in range order. Max/min
+and the range filters need no state shared between lines, so they
+parallelize cleanly.
+"""
+
+import mmap
+import os
+
+from . import engine, pools
+
+OPERATIONS = ("max_size", "min_size", "between_msgs", "between_size")
+
+_pool = pools.PoolSlot()
+
+
+def get_executor(workers):
+    return pools.get_executor(_pool, workers)
+
+
+def split_ranges(file_path, parts):
+    """Split a file into at most ``parts`` ranges ending on line breaks."""
+    size = os.path.getsize(file_path)
+    if size == 0:
+        return []
+    ranges = []
+    with open(file_path, "rb") as f, mmap.mmap(
+        f.fileno(), 0, access=mmap.ACCESS_READ
+    ) as data:
+        start = 0
+        for part in range(1, parts + 1):
+            if start >= size:
+                break
+            end = size if part == parts else max(size * part // parts, start)
+            newline = data.find(b"\n", end)
+            end = size if newline == -1 else newline + 1
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def iter_range_lines(data, start, end):
+    """Yield the lines of ``data[start:end]`` one at a time.
+
+    The range is read through the map line by line, so only the pages
+    being scanned are resident, not a copy of the whole range.
+    """
+    data.seek(start)
+    while data.tell() < end:
+        yield data.readline().rstrip(b"\n").decode("utf-8")
+
+
+def scan_range(file_path, start, end, operation, params):
+    """Scan one byte range; runs in a worker process."""
+    with open(file_path, "rb") as f, mmap.mmap(
+        f.fileno(), 0, access=mmap.ACCESS_READ
+    ) as data:
+        lines = iter_range_lines(data, start, end)
+        if operation in ("max_size", "min_size"):
+            return engine.select_size_line(
+                lines, smallest=operation == "min_size"
+            )
+        pattern = (
+            engine.INBOX_PATTERN
+            if operation == "between_msgs"
+            else engine.SIZE_PATTERN
+        )
+        return engine.filter_lines(lines, pattern, *params)
+
+
+def scan(file_path, operation, params, workers):
+    """Run ``operation`` over ``file_path`` with ``workers`` processes.
+
+    Returns the same lines as the matching ``files.engine`` function.
+    """
+    ranges = split_ranges(file_path, workers)
+    executor = get_executor(workers)
+    futures = [
+        executor.submit(scan_range, file_path, start, end, operation, params)
+        for start, end in ranges
+    ]
+    partials = [future.result() for future in futures]
+
+    if operation in ("max_size", "min_size"):
+        best = None
+        for partial in partials:
+            if partial is None:
+                continue
+            # Ranges are reduced in file order, so ties keep the first line.
+            if best is None or (
+                partial[0] < best[0]
+                if operation == "min_size"
+                else partial[0] > best[0]
+            ):
+                best = partial
+        return [] if best is None else [best[1]]
+    return [line for partial in partials for line in partial]
@@ -0,0 +1,29 @@
+"""Process pools shared by the requests of a server process."""
+
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+
+class PoolSlot:
+    """Holds one shared pool and the worker count it was created with."""
+
+    def __init__(self):
+        self.executor = None
+        self.workers = None
+        self.lock = threading.Lock()
+
+
+def get_executor(slot, workers):
+    """Return the pool of ``slot``, recreating it if ``workers`` changed."""
+    with slot.lock:
+        if slot.executor is None or slot.workers != workers:
+            if slot.executor is not None:
+                slot.executor.shutdown(wait=False)
+            # Spawned workers don't inherit the server's threads and locks.
+            slot.executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            slot.workers = workers
+        return slot.executor
@@ -0,0 +1,235 @@
+"""On-demand profiling of the ``files.views`` endpoints.
+
+With ``FILES_PROFILING`` enabled, a staff user can run a single request
+under a profiler by sending ``X-Profile: <profiler>`` or
+``?profile=<profiler>``:
+
+- ``cprofile`` (or ``1``) records every call with ``cProfile`` and saves
+  a ``.prof`` file, to be read with ``pstats`` or snakeviz.
+- ``sampling`` samples the request thread's stack every millisecond and
+  saves the stacks in the folded ``.folded`` format, to be read with
+  flamegraph.pl or speedscope. It costs much less than ``cprofile`` on
+  requests that parse millions of lines.
+
+Profiles go to ``FILES_PROFILES_DIR``, named after the time, the endpoint,
+its parameters and the size of the queried file, and are listed and
+downloaded from ``/profiles/``. Streamed responses are profiled until
+their last chunk is sent.
+"""
+
+import cProfile
+import os
+import re
+import sys
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.utils.deprecation import MiddlewareMixin
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+PROFILED_MODULE = "files.views"
+
+# Seconds between two stack samples of the sampling profiler.
+SAMPLE_INTERVAL = 0.001
+
+# Longest profile name, well within file system limits.
+MAX_NAME_LENGTH = 200
+
+
+class SamplingProfiler:
+    """Count the stacks of the thread that entered it, sampled at intervals.
+
+    Has the ``with`` and ``dump_stats`` interface of ``cProfile.Profile``.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+
+    def __enter__(self):
+        self._thread_id = threading.get_ident()
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._sampler.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._sampler.join()
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    f"{code.co_name} ({os.path.basename(code.co_filename)}"
+                    f":{code.co_firstlineno})"
+                )
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def dump_stats(self, path):
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+PROFILERS = {
+    "cprofile": (cProfile.Profile, ".prof"),
+    "sampling": (SamplingProfiler, ".folded"),
+}
+ALIASES = {"1": "cprofile", "true": "cprofile"}
+
+
+def get_profile_path(profile_name):
+    """Return the path of a stored profile, or None for an invalid name."""
+    if not profile_name.endswith(
+        tuple(suffix for _, suffix in PROFILERS.values())
+    ) or profile_name != os.path.basename(profile_name):
+        return None
+    return os.path.join(settings.FILES_PROFILES_DIR, profile_name)
+
+
+def list_profiles():
+    """Return the stored profiles, most recent first."""
+    try:
+        entries = list(os.scandir(settings.FILES_PROFILES_DIR))
+    except FileNotFoundError:
+        return []
+    profiles = []
+    for entry in entries:
+        if get_profile_path(entry.name) is None:
+            continue
+        stat = entry.stat()
+        profiles.append(
+            {
+                "name": entry.name,
+                "size": stat.st_size,
+                "created": datetime.fromtimestamp(
+                    stat.st_mtime, timezone.utc
+                ).isoformat(),
+            }
+        )
+    profiles.sort(key=lambda profile: profile["created"], reverse=True)
+    return profiles
+
+
+def profile_name(request, url_name, view_kwargs, suffix):
+    """Name a profile after its endpoint, parameters and file size."""
+    parts = [datetime.now().strftime("%Y%m%dT%H%M%S%f"), url_name]
+    parts.extend(f"{key}={value}" for key, value in view_kwargs.items())
+    parts.extend(
+        f"{key}={value}"
+        for key, values in sorted(request.GET.lists())
+        if key != "profile"
+        for value in values
+    )
+    file_name = view_kwargs.get("file_name")
+    if file_name:
+        try:
+            size = os.path.getsize(
+                os.path.join(settings.MEDIA_ROOT, "uploaded_files", file_name)
+            )
+        except (OSError, ValueError):
+            size = None
+        if size is not None:
+            parts.append(f"{size}B")
+    name = "_".join(re.sub(r"[^A-Za-z0-9_.=@-]+", "-", p) for p in parts)
+    return name[: MAX_NAME_LENGTH - len(suffix)] + suffix
+
+
+def is_staff(request):
+    """Tell if the request comes from a staff user.
+
+    Authenticates like the API views do, so Basic credentials count as
+    well as a session.
+    """
+    if request.user.is_staff:
+        return True
+    authenticators = [
+        authentication()
+        for authentication in api_settings.DEFAULT_AUTHENTICATION_CLASSES
+    ]
+    try:
+        return Request(request, authenticators=authenticators).user.is_staff
+    except APIException:
+        return False
+
+
+def save_profile(profiler, profile_path):
+    os.makedirs(os.path.dirname(profile_path), exist_ok=True)
+    # Listings only show complete profiles.
+    profiler.dump_stats(f"{profile_path}.tmp")
+    os.replace(f"{profile_path}.tmp", profile_path)
+
+
+def profiled_stream(content, profiler, profile_path):
+    try:
+        with profiler:
+            yield from content
+    finally:
+        save_profile(profiler, profile_path)
+
+
+class ProfilingMiddleware(MiddlewareMixin):
+    """Run the requests that ask for it under a profiler.
+
+    Must come after ``AuthenticationMiddleware``, which sets the session's
+    user.
+    """
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not settings.FILES_PROFILING:
+            return None
+        view_class = getattr(view_func, "cls", None)
+        if view_class is None or view_class.__module__ != PROFILED_MODULE:
+            return None
+        requested = request.headers.get(
+            "X-Profile", request.GET.get("profile")
+        )
+        if not requested:
+            return None
+
+        if not is_staff(request):
+            return JsonResponse(
+                {"error": "Profiling is restricted to staff users."},
+                status=status.HTTP_403_FORBIDDEN,
+            )
+        requested = ALIASES.get(requested.lower(), requested.lower())
+        if requested not in PROFILERS:
+            return JsonResponse(
+                {
+                    "error": "Unknown profiler; use one of: "
+                    + ", ".join(PROFILERS)
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        profiler_class, suffix = PROFILERS[requested]
+        name = profile_name(
+            request, request.resolver_match.url_name, view_kwargs, suffix
+        )
+        profile_path = os.path.join(settings.FILES_PROFILES_DIR, name)
+        profiler = profiler_class()
+        with profiler:
+            response = view_func(request, *view_args, **view_kwargs)
+            # DRF responses are rendered later on; include the rendering.
+            if callable(getattr(response, "render", None)):
+                response.render()
+        if response.streaming:
+            response.streaming_content = profiled_stream(
+                response.streaming_content, profiler, profile_path
+            )
+        else:
+            save_profile(profiler, profile_path)
+        response["X-Profile-Name"] = name
+        return response
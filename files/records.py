@@ -0,0 +1,64 @@
+"""Record parsing shared by everything that ingests uploaded files.
+
+A record is a line like ``user@domain inbox 000232478 size 012345671``,
+the same format ``parse_line`` reads for the views.
+"""
+
+
+class LineSplitter:
+    """Split a stream of byte chunks into lines.
+
+    Chunk boundaries can fall anywhere, so the trailing partial line of each
+    chunk is kept until the next chunk (or ``close``) completes it.
+    """
+
+    def __init__(self):
+        self._pending = b""
+
+    def feed(self, chunk):
+        lines = (self._pending + chunk).split(b"\n")
+        self._pending = lines.pop()
+        return lines
+
+    def close(self):
+        pending, self._pending = self._pending, b""
+        return [pending] if pending else []
+
+
+def parse_record(line):
+    """Parse a bytes line into ``(username, folder, messages, size)``.
+
+    Returns None for blank or malformed lines.
+    """
+    parts = line.split()
+    if len(parts) < 5 or not parts[2].isdigit() or not parts[4].isdigit():
+        return None
+    return parts[0], parts[1], int(parts[2]), int(parts[4])
+
+
+def _leading_number(parts, i):
+    field = parts[i] if i < len(parts) else b""
+    end = 0
+    while field[end : end + 1].isdigit():
+        end += 1
+    return int(field[:end]) if end else 0
+
+
+def sort_key(line):
+    """Key of the username order of the listings, for a str or bytes line.
+
+    Orders by username and folder, then by message count and size as
+    numbers, so numbers without zero padding sort like padded ones; ties
+    fall back to the whole line. This is the order of the columnar index
+    and of ``sort -k1,1 -k2,2b -k3,3n -k5,5n`` under the C locale, which
+    ``order-by-username.sh`` runs.
+    """
+    parts = line.split()
+    empty = line[:0]
+    return (
+        parts[0] if parts else empty,
+        parts[1] if len(parts) > 1 else empty,
+        _leading_number(parts, 2),
+        _leading_number(parts, 4),
+        line,
+    )
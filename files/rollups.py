@@ -0,0 +1,139 @@
+"""Per-domain and per-folder totals computed while an upload is ingested.
+
+Records are hash-aggregated by (email domain, folder) into a small table
+stored as JSON next to the file's index; grouping by domain or by folder
+alone is a further aggregation of that table, so group-by queries never
+touch the records.
+"""
+
+import json
+import os
+
+from .records import LineSplitter, parse_record
+from .storage import open_upload
+
+GROUPS = {
+    "domain": ("domain",),
+    "folder": ("folder",),
+    "both": ("domain", "folder"),
+}
+
+
+def get_domain(username):
+    _, at, domain = username.rpartition(b"@")
+    return domain if at else b""
+
+
+class RollupBuilder:
+    """Aggregate count, size and messages per (domain, folder)."""
+
+    def __init__(self):
+        self.totals = {}
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Carry on from stored rows, to add appended records."""
+        builder = cls()
+        for row in rows:
+            builder.totals[row["domain"].encode(), row["folder"].encode()] = [
+                row["count"],
+                row["total_size"],
+                row["total_messages"],
+            ]
+        return builder
+
+    def add(self, record):
+        username, folder, messages, size = record
+        key = (get_domain(username), folder)
+        totals = self.totals.get(key)
+        if totals is None:
+            self.totals[key] = [1, size, messages]
+        else:
+            totals[0] += 1
+            totals[1] += size
+            totals[2] += messages
+
+    def as_list(self):
+        return [
+            {
+                "domain": str(domain, "utf-8", "replace"),
+                "folder": str(folder, "utf-8", "replace"),
+                "count": count,
+                "total_size": total_size,
+                "total_messages": total_messages,
+            }
+            for (domain, folder), (
+                count,
+                total_size,
+                total_messages,
+            ) in sorted(self.totals.items())
+        ]
+
+    def write(self, rollups_path, source_path, stat=None):
+        """Atomically write the rollups for the file at ``source_path``.
+
+        ``stat`` is the ``os.stat`` of the file the rollups was built from,
+        if it may have changed since.
+        """
+        stat = stat or os.stat(source_path)
+        rollups = {
+            "source_size": stat.st_size,
+            "source_mtime_ns": stat.st_mtime_ns,
+            "rows": self.as_list(),
+        }
+        tmp_path = f"{rollups_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(rollups, f)
+        os.replace(tmp_path, rollups_path)
+
+
+def load_rollups(rollups_path, source_path):
+    """Return the stored (domain, folder) rows, or None if missing or stale."""
+    try:
+        with open(rollups_path) as f:
+            rollups = json.load(f)
+        stat = os.stat(source_path)
+    except (OSError, ValueError):
+        return None
+    if (rollups.get("source_size"), rollups.get("source_mtime_ns")) != (
+        stat.st_size,
+        stat.st_mtime_ns,
+    ):
+        return None
+    return rollups["rows"]
+
+
+def build_rollups(file_path):
+    """Compute the (domain, folder) rows by scanning a file."""
+    builder = RollupBuilder()
+    lines = LineSplitter()
+    with open_upload(file_path) as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            for line in lines.feed(chunk):
+                if record := parse_record(line):
+                    builder.add(record)
+    for line in lines.close():
+        if record := parse_record(line):
+            builder.add(record)
+    return builder.as_list()
+
+
+def group_rows(rows, by):
+    """Aggregate the (domain, folder) rows by the fields of ``GROUPS[by]``."""
+    fields = GROUPS[by]
+    groups = {}
+    for row in rows:
+        key = tuple(row[field] for field in fields)
+        group = groups.get(key)
+        if group is None:
+            groups[key] = {
+                **dict(zip(fields, key)),
+                "count": row["count"],
+                "total_size": row["total_size"],
+                "total_messages": row["total_messages"],
+            }
+        else:
+            group["count"] += row["count"]
+            group["total_size"] += row["total_size"]
+            group["total_messages"] += row["total_messages"]
+    return [groups[key] for key in sorted(groups)]
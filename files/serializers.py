@@ -1,10 +1,124 @@
+from django.conf import settings
 from rest_framework import serializers
 
+from .uploads import received_chunks
+from .utils import is_valid_file_name
+
 
 class FileUploadSerializer(serializers.Serializer):
     file = serializers.FileField()
 
 
 class FileListSerializer(serializers.Serializer):
+    file_name = serializers.CharField(source="name", max_length=255)
+    file_size = serializers.IntegerField(source="size")
+    stored_size = serializers.IntegerField()
+    record_count = serializers.IntegerField(allow_null=True)
+    sha256 = serializers.CharField(max_length=64, allow_null=True)
+
+
+class FileListQuerySerializer(serializers.Serializer):
+    ordering = serializers.ChoiceField(
+        choices=["name", "-name", "size", "-size"], default="name"
+    )
+    name = serializers.CharField(required=False, source="name_prefix")
+    min_size = serializers.IntegerField(required=False, min_value=0)
+    max_size = serializers.IntegerField(required=False, min_value=0)
+
+
+class TopQuerySerializer(serializers.Serializer):
+    by = serializers.ChoiceField(choices=["size", "inbox"], default="size")
+    k = serializers.IntegerField(min_value=1, max_value=10_000, default=10)
+    order = serializers.ChoiceField(choices=["desc", "asc"], default="desc")
+
+
+class GroupByQuerySerializer(serializers.Serializer):
+    by = serializers.ChoiceField(
+        choices=["domain", "folder", "both"], default="domain"
+    )
+
+
+class StatsQuerySerializer(serializers.Serializer):
+    bins = serializers.IntegerField(min_value=1, max_value=1000, default=10)
+
+
+class ExportQuerySerializer(serializers.Serializer):
+    format = serializers.ChoiceField(
+        choices=["ndjson", "csv"], default="ndjson"
+    )
+    order = serializers.ChoiceField(choices=["asc", "desc"], default="asc")
+    min_msgs = serializers.IntegerField(required=False, min_value=0)
+    max_msgs = serializers.IntegerField(required=False, min_value=0)
+
+
+class BatchOperationSerializer(serializers.Serializer):
+    op = serializers.ChoiceField(
+        choices=[
+            "max_size",
+            "min_size",
+            "users",
+            "range_messages",
+            "range_size",
+            "top",
+            "stats",
+        ]
+    )
+    # users
+    desc = serializers.BooleanField(default=False)
+    prefix = serializers.CharField(required=False)
+    # users, range_messages and range_size
+    page = serializers.IntegerField(min_value=1, default=1)
+    page_size = serializers.IntegerField(
+        min_value=1, max_value=100, default=10
+    )
+    # range_messages and range_size
+    min = serializers.IntegerField(required=False, min_value=0)
+    max = serializers.IntegerField(required=False, min_value=0)
+    # top
+    by = serializers.ChoiceField(choices=["size", "inbox"], default="size")
+    k = serializers.IntegerField(min_value=1, max_value=10_000, default=10)
+    order = serializers.ChoiceField(choices=["desc", "asc"], default="desc")
+    # stats
+    bins = serializers.IntegerField(min_value=1, max_value=1000, default=10)
+
+    def validate(self, data):
+        if data["op"] in ("range_messages", "range_size"):
+            missing = [name for name in ("min", "max") if name not in data]
+            if missing:
+                raise serializers.ValidationError(
+                    {name: "This field is required." for name in missing}
+                )
+        return data
+
+
+class BatchQuerySerializer(serializers.Serializer):
+    operations = BatchOperationSerializer(
+        many=True, allow_empty=False, max_length=20
+    )
+
+
+class UploadSessionSerializer(serializers.Serializer):
+    id = serializers.UUIDField(read_only=True)
     file_name = serializers.CharField(max_length=255)
-    file_size = serializers.IntegerField()
+    size = serializers.IntegerField(min_value=0)
+    chunk_size = serializers.IntegerField(required=False, min_value=1)
+    chunk_count = serializers.IntegerField(read_only=True)
+    received_chunks = serializers.SerializerMethodField()
+
+    def get_received_chunks(self, session):
+        return received_chunks(session)
+
+    def validate_file_name(self, value):
+        if not is_valid_file_name(value):
+            raise serializers.ValidationError(
+                "File name has invalid characters."
+            )
+        return value
+
+    def validate_chunk_size(self, value):
+        if value > settings.FILES_UPLOAD_MAX_CHUNK_SIZE:
+            raise serializers.ValidationError(
+                "Chunk size must be at most "
+                f"{settings.FILES_UPLOAD_MAX_CHUNK_SIZE} bytes."
+            )
+        return value
@@ -0,0 +1,121 @@
+"""Aggregate statistics over the numeric columns of an uploaded file.
+
+The inbox counts and sizes are loaded as NumPy arrays in bulk, straight
+from the columnar index when the file has one, otherwise by parsing the
+file with ``np.loadtxt`` (or line by line, if it has malformed lines),
+and every statistic is a vectorized reduction over those arrays.
+"""
+
+import array
+import warnings
+
+import numpy as np
+
+from .storage import open_upload
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+def load_columns(file_path, index=None):
+    """Return ``(messages, size)`` arrays for the records of a file.
+
+    ``index`` is the file's up-to-date ``ColumnarIndex``, if any; its
+    columns are used in place, without copying.
+    """
+    if index is not None:
+        return (
+            np.frombuffer(index.messages, dtype=np.uint64),
+            np.frombuffer(index.size, dtype=np.uint64),
+        )
+    try:
+        with open_upload(file_path, "rt", encoding="utf-8") as f, (
+            # An empty file is not an error, just a file without records.
+            warnings.catch_warnings(action="ignore", category=UserWarning)
+        ):
+            # Columns 3 and 5 of "user folder messages size N", as
+            # parse_line reads them.
+            columns = np.loadtxt(
+                f,
+                dtype=np.int64,
+                usecols=(2, 4),
+                comments=None,
+                ndmin=2,
+            )
+    except ValueError:
+        # A malformed line: skip it, like the index and the batch ``stats``
+        # operation do, at the cost of parsing the lines in Python.
+        collector = ColumnCollector()
+        with open_upload(file_path) as f:
+            collector.add_lines(f)
+        return collector.columns()
+    return columns[:, 0], columns[:, 1]
+
+
+def describe(values, bins):
+    """Count, sum, mean, percentiles and histogram of an array."""
+    counts, edges = np.histogram(values, bins=bins)
+    return {
+        "count": int(values.size),
+        "sum": int(values.sum(dtype=np.uint64)),
+        "mean": float(values.mean()),
+        "min": int(values.min()),
+        "max": int(values.max()),
+        "percentiles": {
+            f"p{p}": float(value)
+            for p, value in zip(
+                PERCENTILES, np.percentile(values, PERCENTILES)
+            )
+        },
+        "histogram": {
+            "edges": edges.tolist(),
+            "counts": counts.tolist(),
+        },
+    }
+
+
+class ColumnCollector:
+    """Gather the inbox counts and sizes of lines fed in batches.
+
+    Lets the statistics share a pass over a file with other queries; lines
+    without both numbers are skipped, as ``files.engine.top`` does.
+    """
+
+    def __init__(self):
+        self.messages = array.array("q")
+        self.size = array.array("q")
+
+    def add_lines(self, lines):
+        messages, size = self.messages, self.size
+        for line in lines:
+            parts = line.split()
+            if len(parts) < 5 or not parts[2].isdigit():
+                continue
+            if not parts[4].isdigit():
+                continue
+            messages.append(int(parts[2]))
+            size.append(int(parts[4]))
+
+    def columns(self):
+        return (
+            np.frombuffer(self.messages, dtype=np.int64),
+            np.frombuffer(self.size, dtype=np.int64),
+        )
+
+
+def summarize(messages, size, bins):
+    """Statistics for the given columns, or None if they are empty."""
+    if not size.size:
+        return None
+    return {
+        "count": int(size.size),
+        "numberMessages": describe(messages, bins),
+        "size": describe(size, bins),
+    }
+
+
+def file_stats(file_path, bins, index=None):
+    """Statistics for the inbox counts and sizes of a file.
+
+    Returns None for a file without records.
+    """
+    return summarize(*load_columns(file_path, index), bins)
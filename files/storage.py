@@ -0,0 +1,85 @@
+"""Optional compressed storage of uploaded files.
+
+With ``FILES_STORAGE_CODEC`` set, uploads are compressed as they are
+written. Readers don't need to know how a file was stored: the codec is
+detected from the file's magic bytes, so files written under an earlier
+setting keep working, and ``open_upload`` always returns a stream of the
+original content.
+"""
+
+import gzip
+import lzma
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+MAGIC = {
+    "gzip": b"\x1f\x8b",
+    "lzma": b"\xfd7zXZ\x00",
+}
+OPENERS = {
+    "gzip": gzip.open,
+    "lzma": lzma.open,
+}
+
+
+def _read_umask():
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+# Read once, at import: reading it means briefly changing it, which isn't
+# safe once request threads may be creating files.
+UMASK = _read_umask()
+
+
+def set_default_mode(fd):
+    """Give a file made by ``tempfile.mkstemp`` the mode ``open`` would.
+
+    ``mkstemp`` creates files readable by their owner only; stored files
+    and chunks keep the permissions they had before being written that way.
+    """
+    os.fchmod(fd, 0o666 & ~UMASK)
+
+
+def detect_codec(file_path):
+    """Return the codec ``file_path`` is stored with, or None if plain."""
+    with open(file_path, "rb") as f:
+        head = f.read(max(len(magic) for magic in MAGIC.values()))
+    for codec, magic in MAGIC.items():
+        if head.startswith(magic):
+            return codec
+    return None
+
+
+def is_compressed(file_path):
+    return detect_codec(file_path) is not None
+
+
+def open_upload(file_path, mode="rb", **kwargs):
+    """Open an uploaded file for reading, decompressing it if needed.
+
+    ``mode`` and ``kwargs`` are passed to ``open`` (or the codec's own
+    ``open``), so text mode works the same for every codec.
+    """
+    codec = detect_codec(file_path)
+    opener = open if codec is None else OPENERS[codec]
+    return opener(file_path, mode, **kwargs)
+
+
+def compressing_writer(f, codec):
+    """Wrap the binary file ``f`` so writes are compressed with ``codec``.
+
+    Returns ``f`` itself when ``codec`` is empty.
+    """
+    if not codec:
+        return f
+    if codec == "gzip":
+        # mtime=0 keeps the output identical for identical content.
+        return gzip.GzipFile(fileobj=f, mode="wb", compresslevel=6, mtime=0)
+    if codec == "lzma":
+        return lzma.LZMAFile(f, "wb")
+    raise ImproperlyConfigured(
+        f"Unknown FILES_STORAGE_CODEC {codec!r}; use gzip or lzma."
+    )
@@ -0,0 +1,116 @@
+"""Per-file aggregates computed when an upload is indexed.
+
+The summary is a small JSON document stored next to the columnar index,
+so max/min lookups don't need to touch the records at all.
+"""
+
+import json
+import os
+
+
+def _record_dict(record):
+    username, folder, messages, size = record
+    return {
+        "username": str(username, "utf-8", "replace"),
+        "folder": str(folder, "utf-8", "replace"),
+        "numberMessages": messages,
+        "size": size,
+    }
+
+
+def _record_tuple(record):
+    return (
+        record["username"].encode(),
+        record["folder"].encode(),
+        record["numberMessages"],
+        record["size"],
+    )
+
+
+class SummaryBuilder:
+    """Keep running aggregates over parsed records."""
+
+    def __init__(self):
+        self.count = 0
+        self.total_size = 0
+        self.total_messages = 0
+        self.min_messages = None
+        self.max_messages = None
+        self.max_size = None
+        self.min_size = None
+
+    @classmethod
+    def from_summary(cls, summary):
+        """Carry on from a stored summary, to add appended records."""
+        builder = cls()
+        builder.count = summary["count"]
+        builder.total_size = summary["total_size"]
+        builder.total_messages = summary["total_messages"]
+        builder.min_messages = summary["min_messages"]
+        builder.max_messages = summary["max_messages"]
+        builder.max_size = summary["max_size"] and _record_tuple(
+            summary["max_size"]
+        )
+        builder.min_size = summary["min_size"] and _record_tuple(
+            summary["min_size"]
+        )
+        return builder
+
+    def add(self, record):
+        messages, size = record[2], record[3]
+        self.count += 1
+        self.total_size += size
+        self.total_messages += messages
+        if self.min_messages is None or messages < self.min_messages:
+            self.min_messages = messages
+        if self.max_messages is None or messages > self.max_messages:
+            self.max_messages = messages
+        # Strict comparisons keep the first record on ties, like the scripts.
+        if self.max_size is None or size > self.max_size[3]:
+            self.max_size = record
+        if self.min_size is None or size < self.min_size[3]:
+            self.min_size = record
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "total_size": self.total_size,
+            "total_messages": self.total_messages,
+            "min_messages": self.min_messages,
+            "max_messages": self.max_messages,
+            "max_size": self.max_size and _record_dict(self.max_size),
+            "min_size": self.min_size and _record_dict(self.min_size),
+        }
+
+    def write(self, summary_path, source_path, stat=None):
+        """Atomically write the summary for the file at ``source_path``.
+
+        ``stat`` is the ``os.stat`` of the file the summary was built from,
+        if it may have changed since.
+        """
+        stat = stat or os.stat(source_path)
+        summary = {
+            "source_size": stat.st_size,
+            "source_mtime_ns": stat.st_mtime_ns,
+            **self.as_dict(),
+        }
+        tmp_path = f"{summary_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(summary, f)
+        os.replace(tmp_path, summary_path)
+
+
+def load_summary(summary_path, source_path):
+    """Return the stored summary, or None if it is missing or stale."""
+    try:
+        with open(summary_path) as f:
+            summary = json.load(f)
+        stat = os.stat(source_path)
+    except (OSError, ValueError):
+        return None
+    if (summary.get("source_size"), summary.get("source_mtime_ns")) != (
+        stat.st_size,
+        stat.st_mtime_ns,
+    ):
+        return None
+    return summary
@@ -1,9 +1,18 @@
 import os
+import shutil
 
 import pytest
 from django.conf import settings
 from rest_framework.test import APIClient
 
+from files.cache import result_cache
+
+
+@pytest.fixture(autouse=True)
+def enable_db(db):
+    # Uploads and listings go through the file catalog.
+    pass
+
 
 @pytest.fixture
 def client():
@@ -27,6 +36,12 @@ def upload_dir():
         file_path = os.path.join(upload_dir, file_name)
         os.remove(file_path)
 
+    # ...and the indexes and cached results built for them
+    shutil.rmtree(
+        os.path.join(settings.MEDIA_ROOT, "indexes"), ignore_errors=True
+    )
+    result_cache.clear()
+
 
 @pytest.fixture
 def test_files_dir():
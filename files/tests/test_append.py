@@ -0,0 +1,201 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+import pytest
+from django.core.files import File
+
+from files import indexing
+from files.models import UploadedFile
+from files.storage import detect_codec, open_upload
+from files.tests.test_engine import EDGE_CASES_CONTENT
+from files.tests.utils import create_test_file, upload
+from files.utils import (
+    catalog_fields,
+    file_lock,
+    get_index_dir,
+    store_file,
+    update_catalog,
+)
+
+APPENDED = (
+    "erin@uol.com.br inbox 000000050 size 000000700\n"
+    "alice@uol.com.br inbox 000000001 size 000000002\n"
+    "aaron@bol.com.br inbox 000000300 size 000000900\n"
+)
+APPEND_URL = "/files/append/testfile/"
+QUERY_URLS = [
+    "/files/user_max_size/testfile/",
+    "/files/users/testfile/?page_size=20",
+    "/files/users_desc/testfile/?page_size=20",
+    "/files/users_range_messages/testfile/15/350/",
+    "/files/group_by/testfile/?by=domain",
+]
+
+
+def append(client, data, method="post"):
+    return getattr(client, method)(
+        APPEND_URL, data, content_type="application/octet-stream"
+    )
+
+
+def read_derived_data(index_dir):
+    with open(os.path.join(index_dir, indexing.INDEX_FILE_NAME), "rb") as f:
+        index = f.read()
+    with open(os.path.join(index_dir, indexing.SUMMARY_FILE_NAME)) as f:
+        summary = json.load(f)
+    with open(os.path.join(index_dir, indexing.ROLLUPS_FILE_NAME)) as f:
+        rollups = json.load(f)
+    return index, summary, rollups
+
+
+def rebuilt_derived_data(file_path, index_dir):
+    shutil.rmtree(index_dir)
+    version = indexing.file_version(os.stat(file_path))
+    indexing.build_derived_data(file_path, index_dir, version, 1 << 20)
+    return read_derived_data(index_dir)
+
+
+@pytest.mark.parametrize("codec", [None, "gzip", "lzma"])
+def test_append_updates_derived_data(
+    client, upload_dir, test_files_dir, settings, mocker, codec
+):
+    settings.FILES_STORAGE_CODEC = codec
+    upload(client, test_files_dir, EDGE_CASES_CONTENT)
+    file_path = os.path.join(upload_dir, "testfile")
+    index_dir = get_index_dir("testfile")
+    rebuild = mocker.spy(indexing, "build_derived_data")
+
+    response = append(client, APPENDED.encode())
+    assert response.status_code == 200
+    assert response.json() == {
+        "appended_bytes": len(APPENDED),
+        "appended_records": 3,
+    }
+    rebuild.assert_not_called()
+    assert detect_codec(file_path) == codec
+    with open_upload(file_path) as f:
+        assert f.read() == (EDGE_CASES_CONTENT + "\n" + APPENDED).encode()
+
+    assert indexing.get_status(file_path, index_dir)["state"] == "ready"
+    assert read_derived_data(index_dir) == rebuilt_derived_data(
+        file_path, index_dir
+    )
+
+
+def test_queries_include_appended_records(client, upload_dir, test_files_dir):
+    upload(client, test_files_dir, EDGE_CASES_CONTENT + "\n")
+    client.get("/files/users/testfile/")
+    assert append(client, APPENDED.encode(), method="patch").json() == {
+        "appended_bytes": len(APPENDED),
+        "appended_records": 3,
+    }
+    appended = [client.get(url).json() for url in QUERY_URLS]
+
+    upload(client, test_files_dir, EDGE_CASES_CONTENT + "\n" + APPENDED)
+    assert appended == [client.get(url).json() for url in QUERY_URLS]
+
+
+def test_append_updates_catalog(client, upload_dir, test_files_dir):
+    upload(client, test_files_dir, EDGE_CASES_CONTENT)
+    append(client, APPENDED.encode())
+
+    content = (EDGE_CASES_CONTENT + "\n" + APPENDED).encode()
+    entry = UploadedFile.objects.get(name="testfile")
+    assert entry.size == len(content)
+    assert entry.stored_size == len(content)
+    assert entry.record_count == 9
+    assert entry.sha256 == hashlib.sha256(content).hexdigest()
+
+
+def test_append_to_unindexed_file(client, upload_dir, mocker):
+    file_path = create_test_file(upload_dir, "testfile", EDGE_CASES_CONTENT)
+    UploadedFile.objects.create(
+        name="testfile",
+        size=len(EDGE_CASES_CONTENT),
+        stored_size=len(EDGE_CASES_CONTENT),
+        mtime_ns=os.stat(file_path).st_mtime_ns,
+        sha256="",
+    )
+    rebuild = mocker.spy(indexing, "build_derived_data")
+
+    response = append(client, APPENDED.encode())
+    assert response.json()["appended_records"] == 3
+    rebuild.assert_called_once()
+    assert UploadedFile.objects.get(name="testfile").record_count == 9
+    response = client.get("/files/users_range_messages/testfile/15/350/")
+    assert response.json()["count"] == 5
+
+
+def test_upload_waits_for_append(upload_dir, test_files_dir):
+    file_path = create_test_file(upload_dir, "testfile", EDGE_CASES_CONTENT)
+    upload_path = create_test_file(test_files_dir, "upload", APPENDED)
+
+    def upload():
+        with open(upload_path, "rb") as f:
+            store_file(File(f), "testfile")
+
+    # Held like an append in progress holds it.
+    with file_lock("testfile"):
+        uploader = threading.Thread(target=upload)
+        uploader.start()
+        uploader.join(timeout=0.5)
+        assert uploader.is_alive()
+        with open(file_path) as f:
+            assert f.read() == EDGE_CASES_CONTENT
+    uploader.join(timeout=60)
+    with open(file_path) as f:
+        assert f.read() == APPENDED
+
+
+def test_append_after_unrecorded_upload(client, upload_dir, test_files_dir):
+    upload(client, test_files_dir, EDGE_CASES_CONTENT)
+    file_path = os.path.join(upload_dir, "testfile")
+    stale_fields = catalog_fields(file_path, len(EDGE_CASES_CONTENT), 6, "")
+    # Replaced by an upload that hasn't updated the catalog yet.
+    create_test_file(upload_dir, "testfile", "a@x.com inbox 1 size 2\n")
+    replaced_fields = catalog_fields(file_path, 23, None, "")
+
+    append(client, APPENDED.encode())
+    update_catalog("testfile", replaced_fields)
+
+    content = ("a@x.com inbox 1 size 2\n" + APPENDED).encode()
+    entry = UploadedFile.objects.get(name="testfile")
+    assert (entry.size, entry.record_count) == (len(content), 4)
+    assert entry.sha256 == hashlib.sha256(content).hexdigest()
+    update_catalog("testfile", stale_fields)
+    assert UploadedFile.objects.get(name="testfile").size == len(content)
+
+
+def test_failed_append_is_rolled_back(
+    client, upload_dir, test_files_dir, mocker
+):
+    upload(client, test_files_dir, EDGE_CASES_CONTENT)
+    file_path = os.path.join(upload_dir, "testfile")
+    size = os.path.getsize(file_path)
+    mocker.patch(
+        "files.utils.add_records", side_effect=OSError("No space left")
+    )
+
+    response = append(client, APPENDED.encode())
+    assert response.status_code == 500
+    assert os.path.getsize(file_path) == size
+    entry = UploadedFile.objects.get(name="testfile")
+    assert (entry.size, entry.record_count) == (size, 6)
+
+
+def test_append_errors(client, upload_dir, test_files_dir):
+    assert append(client, APPENDED.encode()).status_code == 404
+    response = client.post(
+        "/files/append/test.file/",
+        APPENDED.encode(),
+        content_type="application/octet-stream",
+    )
+    assert response.status_code == 400
+
+    upload(client, test_files_dir, EDGE_CASES_CONTENT)
+    response = append(client, b"")
+    assert response.status_code == 400
+    assert response.json() == {"error": "Nothing to append."}
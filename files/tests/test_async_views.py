@@ -0,0 +1,99 @@
+import os
+
+import pytest
+from django.core.management import call_command
+
+from files.tests.test_engine import EDGE_CASES_CONTENT
+from files.tests.utils import create_test_file
+
+
+def without_links(data):
+    # Page links point at the async URLs, everything else must match.
+    return {
+        key: value
+        for key, value in data.items()
+        if key not in ("next", "previous")
+    }
+
+
+QUERY_URLS = [
+    "files/user_max_size/testfile/",
+    "files/user_min_size/testfile/",
+    "files/users/testfile/?page_size=4",
+    "files/users_desc/testfile/?page=2&page_size=4",
+    "files/users_range_messages/testfile/15/250/",
+    "files/users_range_size/testfile/100/600/",
+]
+
+
+def test_async_upload(client, upload_dir, test_files_dir):
+    file_path = create_test_file(
+        test_files_dir, "testfile", EDGE_CASES_CONTENT
+    )
+    with open(file_path, "rb") as f:
+        response = client.put(
+            "/async/upload/", {"file": f}, format="multipart"
+        )
+    assert response.status_code == 201
+    assert os.path.exists(os.path.join(upload_dir, "testfile"))
+
+    with open(file_path, "rb") as f:
+        response = client.put(
+            "/async/upload/", {"file": f}, format="multipart"
+        )
+    assert response.status_code == 204
+
+
+def test_async_upload_invalid_file_name(client, test_files_dir):
+    file_path = create_test_file(test_files_dir, "invalid#name.txt", "a")
+    with open(file_path, "rb") as f:
+        response = client.put(
+            "/async/upload/", {"file": f}, format="multipart"
+        )
+    assert response.status_code == 400
+    assert response.json() == {"error": "File name has invalid characters."}
+
+
+def test_async_list_files(client, upload_dir):
+    create_test_file(upload_dir, "testfile1.txt", "This is a test file 1.")
+    call_command("reconcile_catalog")
+
+    response = client.get("/async/files/")
+    assert response.status_code == 200
+    assert response.json() == client.get("/files/").json()
+    assert response.json()["results"][0]["file_name"] == "testfile1.txt"
+
+
+@pytest.mark.parametrize("url", QUERY_URLS)
+@pytest.mark.parametrize("backend", ["script", "python"])
+def test_async_queries_match_sync(client, upload_dir, settings, url, backend):
+    settings.FILES_QUERY_BACKEND = backend
+    create_test_file(upload_dir, "testfile", EDGE_CASES_CONTENT)
+
+    expected = client.get(f"/{url}")
+    response = client.get(f"/async/{url}")
+    assert response.status_code == expected.status_code == 200
+    assert without_links(response.json()) == without_links(expected.json())
+
+
+def test_async_queries_on_indexed_file(client, upload_dir, test_files_dir):
+    file_path = create_test_file(
+        test_files_dir, "testfile", EDGE_CASES_CONTENT
+    )
+    with open(file_path, "rb") as f:
+        client.put("/upload/", {"file": f}, format="multipart")
+
+    for url in QUERY_URLS:
+        expected = client.get(f"/{url}")
+        response = client.get(f"/async/{url}")
+        assert without_links(response.json()) == without_links(expected.json())
+
+
+def test_async_query_errors(client, upload_dir):
+    response = client.get("/async/files/user_max_size/missing/")
+    assert response.status_code == 404
+
+    create_test_file(upload_dir, "empty", "")
+    response = client.get("/async/files/users/empty/")
+    assert response.status_code == 404
+    assert response.json() == {"error": "No data found in file."}
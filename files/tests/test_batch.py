@@ -0,0 +1,137 @@
+import pytest
+
+from files import engine
+from files.tests.test_engine import EDGE_CASES_CONTENT
+from files.tests.utils import create_test_file
+
+OPERATIONS = [
+    {"op": "max_size"},
+    {"op": "min_size"},
+    {"op": "users", "page_size": 2},
+    {"op": "users", "desc": True, "prefix": "a"},
+    {"op": "range_messages", "min": 15, "max": 250},
+    {"op": "range_size", "min": 0, "max": 500, "page": 2, "page_size": 1},
+    {"op": "top", "by": "inbox", "k": 2},
+    {"op": "stats", "bins": 3},
+]
+
+
+def expected_results(client):
+    """The answers of the single-query endpoints, in batch form."""
+
+    def get(url):
+        response = client.get(url)
+        assert response.status_code == 200
+        return response.json()
+
+    def page(url):
+        data = get(url)
+        return {"count": data["count"], "results": data["results"]}
+
+    return [
+        get("/files/user_max_size/testfile/"),
+        get("/files/user_min_size/testfile/"),
+        page("/files/users/testfile/?page_size=2"),
+        page("/files/users_desc/testfile/?prefix=a"),
+        page("/files/users_range_messages/testfile/15/250/"),
+        page("/files/users_range_size/testfile/0/500/?page=2&page_size=1"),
+        get("/files/top/testfile/?by=inbox&k=2")["results"],
+        get("/files/stats/testfile/?bins=3"),
+    ]
+
+
+def post_batch(client, operations, file_name="testfile"):
+    return client.post(
+        f"/files/query/{file_name}/",
+        {"operations": operations},
+        format="json",
+    )
+
+
+def test_batch_matches_single_queries(
+    client, upload_dir, test_files_dir, settings, mocker
+):
+    settings.FILES_QUERY_BACKEND = "python"
+    create_test_file(upload_dir, "testfile", EDGE_CASES_CONTENT)
+    iter_lines = mocker.spy(engine, "iter_lines")
+
+    response = post_batch(client, OPERATIONS)
+    assert response.status_code == 200
+    data = response.json()
+    # Everything but the sorted listings comes from one pass over the file.
+    assert iter_lines.call_count == 1
+    assert [result["op"] for result in data["results"]] == [
+        operation["op"] for operation in OPERATIONS
+    ]
+    assert all(result["time_ms"] >= 0 for result in data["results"])
+    assert data["total_ms"] >= data["scan_ms"] >= 0
+
+    expected = expected_results(client)
+    assert [result["result"] for result in data["results"]] == expected
+
+    # Through the upload's index and summary, without reading the file.
+    file_path = create_test_file(
+        test_files_dir, "testfile", EDGE_CASES_CONTENT
+    )
+    with open(file_path, "rb") as f:
+        client.put("/upload/", {"file": f}, format="multipart")
+    iter_lines.reset_mock()
+    response = post_batch(client, OPERATIONS)
+    assert response.status_code == 200
+    assert iter_lines.call_count == 0
+    assert [
+        result["result"] for result in response.json()["results"]
+    ] == expected
+
+
+def test_batch_reuses_cached_results(client, upload_dir, mocker):
+    create_test_file(upload_dir, "testfile", EDGE_CASES_CONTENT)
+    operations = [
+        {"op": "range_messages", "min": 15, "max": 250},
+        {"op": "stats"},
+    ]
+    first = post_batch(client, operations).json()
+
+    iter_lines = mocker.spy(engine, "iter_lines")
+    second = post_batch(client, operations).json()
+    assert iter_lines.call_count == 0
+    assert second["scan_ms"] == 0
+    assert [result["result"] for result in second["results"]] == [
+        result["result"] for result in first["results"]
+    ]
+
+
+def test_batch_empty_file(client, upload_dir):
+    create_test_file(upload_dir, "empty", "")
+    response = post_batch(
+        client,
+        [{"op": "max_size"}, {"op": "top"}, {"op": "stats"}],
+        file_name="empty",
+    )
+    assert response.status_code == 200
+    assert [result["result"] for result in response.json()["results"]] == [
+        None,
+        [],
+        None,
+    ]
+
+
+@pytest.mark.parametrize(
+    "operations, fields",
+    [
+        ([], {"operations"}),
+        ([{"op": "median"}], {"operations"}),
+        ([{"op": "range_size", "min": 1}], {"operations"}),
+        ([{"op": "max_size"}] * 21, {"operations"}),
+    ],
+)
+def test_batch_validation(client, upload_dir, operations, fields):
+    create_test_file(upload_dir, "testfile", EDGE_CASES_CONTENT)
+    response = post_batch(client, operations)
+    assert response.status_code == 400
+    assert set(response.json()) == fields
+
+
+def test_batch_missing_file(client, upload_dir):
+    response = post_batch(client, [{"op": "max_size"}], file_name="missing")
+    assert response.status_code == 404
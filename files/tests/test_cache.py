@@ -0,0 +1,105 @@
+from files.cache import ResultCache, estimate_size, result_cache
+from files.tests.test_engine import EDGE_CASES_CONTENT
+from files.tests.utils import create_test_file
+
+RECORD = {
+    "username": "juvati_be@uol.com.br",
+    "folder": "inbox",
+    "numberMessages": 232478,
+    "size": 12345671,
+}
+
+
+def test_cache_hit_and_miss():
+    cache = ResultCache(max_bytes=10_000)
+    assert cache.get(("file", 1)) is None
+    cache.set(("file", 1), [RECORD])
+    assert cache.get(("file", 1)) == [RECORD]
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_cache_evicts_least_recently_used():
+    entry_size = estimate_size([RECORD])
+    cache = ResultCache(max_bytes=entry_size * 2)
+    cache.set(("a",), [RECORD])
+    cache.set(("b",), [RECORD])
+    cache.get(("a",))
+    cache.set(("c",), [RECORD])
+
+    assert cache.get(("b",)) is None
+    assert cache.get(("a",)) == [RECORD]
+    assert cache.get(("c",)) == [RECORD]
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["bytes"] <= entry_size * 2
+
+
+def test_cache_skips_values_over_budget():
+    cache = ResultCache(max_bytes=10)
+    cache.set(("a",), [RECORD])
+    assert cache.stats()["entries"] == 0
+
+
+def test_cache_invalidate_file():
+    cache = ResultCache(max_bytes=10_000)
+    cache.set(("a", 1, "order_by_username"), [RECORD])
+    cache.set(("a", 1, "between_msgs"), [RECORD])
+    cache.set(("b", 1, "order_by_username"), [RECORD])
+    cache.invalidate("a")
+    assert cache.stats()["entries"] == 1
+    assert cache.get(("b", 1, "order_by_username")) == [RECORD]
+
+
+def test_paging_computes_once(client, upload_dir, settings, mocker):
+    settings.FILES_QUERY_BACKEND = "python"
+    create_test_file(upload_dir, "testfile", EDGE_CASES_CONTENT)
+    between_msgs = mocker.Mock(return_value=EDGE_CASES_CONTENT.split("\n"))
+    mocker.patch.dict(
+        "files.engine.OPERATIONS", {"between_msgs": between_msgs}
+    )
+
+    for page in (1, 2, 3):
+        response = client.get(
+            f"/files/users_range_messages/testfile/0/1000/"
+            f"?page={page}&page_size=2"
+        )
+        assert response.status_code == 200
+        assert len(response.json()["results"]) == 2
+
+    between_msgs.assert_called_once()
+    assert result_cache.stats()["hits"] == 2
+
+
+def test_upload_invalidates_cache(
+    client, upload_url, upload_dir, test_files_dir, settings
+):
+    settings.FILES_QUERY_BACKEND = "python"
+    create_test_file(upload_dir, "testfile", EDGE_CASES_CONTENT)
+    response = client.get("/files/users_range_messages/testfile/0/1000/")
+    assert response.json()["count"] == 6
+    assert result_cache.stats()["entries"] == 1
+
+    test_file_path = create_test_file(
+        test_files_dir,
+        "testfile",
+        "juvati_be@uol.com.br inbox 000232478 size 012345671",
+    )
+    with open(test_file_path, "rb") as f:
+        client.put(upload_url, {"file": f}, format="multipart")
+    assert result_cache.stats()["entries"] == 0
+
+    response = client.get("/files/users_range_messages/testfile/0/999999999/")
+    assert response.json()["count"] == 1
+
+
+def test_cache_stats_endpoint(client, upload_dir):
+    response = client.get("/files/cache_stats/")
+    assert response.status_code == 200
+    assert set(response.json()) == {
+        "entries",
+        "bytes",
+        "max_bytes",
+        "hits",
+        "misses",
+        "evictions",
+    }
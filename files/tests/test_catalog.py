@@ -0,0 +1,67 @@
+import hashlib
+import os
+
+from django.core.management import call_command
+
+from files.management.commands import reconcile_catalog
+from files.models import UploadedFile
+from files.tests.test_engine import EDGE_CASES_CONTENT
+from files.tests.utils import create_test_file, upload
+
+
+def test_upload_updates_catalog(client, upload_dir, test_files_dir):
+    upload(client, test_files_dir, EDGE_CASES_CONTENT)
+    entry = UploadedFile.objects.get(name="testfile")
+    stat = os.stat(os.path.join(upload_dir, "testfile"))
+    assert (entry.size, entry.mtime_ns) == (stat.st_size, stat.st_mtime_ns)
+    assert entry.record_count == 6
+    assert (
+        entry.sha256 == hashlib.sha256(EDGE_CASES_CONTENT.encode()).hexdigest()
+    )
+
+    upload(client, test_files_dir, "a inbox 1 size 2\n")
+    entry = UploadedFile.objects.get(name="testfile")
+    assert (entry.size, entry.record_count) == (17, 1)
+    assert UploadedFile.objects.count() == 1
+
+
+def test_list_files_ordering_and_filters(client, upload_dir, test_files_dir):
+    for name, size in [("b", 30), ("a", 10), ("c", 20), ("ab", 20)]:
+        upload(client, test_files_dir, "x" * size, name)
+
+    def names(query):
+        response = client.get(f"/files/?{query}")
+        assert response.status_code == 200
+        return [file["file_name"] for file in response.json()["results"]]
+
+    assert names("") == ["a", "ab", "b", "c"]
+    assert names("ordering=-name") == ["c", "b", "ab", "a"]
+    assert names("ordering=size") == ["a", "ab", "c", "b"]
+    assert names("ordering=-size") == ["b", "c", "ab", "a"]
+    assert names("name=a") == ["a", "ab"]
+    assert names("name=A") == []
+    assert names("min_size=15&max_size=25") == ["ab", "c"]
+    assert names("ordering=size&page=2&page_size=3") == ["b"]
+
+    response = client.get("/files/?ordering=mtime")
+    assert response.status_code == 400
+    assert "ordering" in response.json()
+
+
+def test_reconcile_catalog(client, upload_dir, test_files_dir, mocker):
+    upload(client, test_files_dir, "a inbox 1 size 2\n", "kept")
+    upload(client, test_files_dir, "a inbox 1 size 2\n", "changed")
+    upload(client, test_files_dir, "a inbox 1 size 2\n", "removed")
+    os.remove(os.path.join(upload_dir, "removed"))
+    create_test_file(upload_dir, "changed", EDGE_CASES_CONTENT)
+    create_test_file(upload_dir, "added", "a inbox 1 size 2\nbad line\n")
+    scan = mocker.spy(reconcile_catalog, "scan_file_contents")
+
+    call_command("reconcile_catalog")
+
+    assert scan.call_count == 2
+    entries = {entry.name: entry for entry in UploadedFile.objects.all()}
+    assert sorted(entries) == ["added", "changed", "kept"]
+    assert entries["added"].record_count == 1
+    assert entries["changed"].record_count == 6
+    assert entries["changed"].size == len(EDGE_CASES_CONTENT)
@@ -0,0 +1,100 @@
+import os
+
+import pytest
+
+from files.tests.test_engine import EDGE_CASES_CONTENT
+from files.tests.utils import create_test_file
+
+QUERY_URLS = [
+    "/files/user_max_size/testfile/",
+    "/files/user_min_size/testfile/",
+    "/files/users/testfile/?page_size=4",
+    "/files/users_desc/testfile/?prefix=a",
+    "/files/user/testfile/bob@uol.com.br/",
+    "/files/users_range_messages/testfile/15/250/",
+    "/files/users_range_size/testfile/100/600/",
+    "/files/top/testfile/?k=2",
+    "/files/stats/testfile/",
+    "/files/group_by/testfile/?by=folder",
+    "/async/files/user_max_size/testfile/",
+    "/async/files/users/testfile/?page_size=4",
+    "/async/files/users_range_size/testfile/100/600/",
+]
+
+
+@pytest.fixture
+def query_file(upload_dir, settings):
+    settings.FILES_QUERY_BACKEND = "python"
+    return create_test_file(upload_dir, "testfile", EDGE_CASES_CONTENT)
+
+
+@pytest.mark.parametrize("url", QUERY_URLS)
+def test_not_modified_skips_the_query(client, query_file, mocker, url):
+    response = client.get(url)
+    assert response.status_code == 200
+    etag = response["ETag"]
+    assert etag.startswith('"')
+    assert response["Cache-Control"] == "public, max-age=0"
+    assert "Accept" in response["Vary"]
+
+    find_records = mocker.patch(
+        "files.utils.find_records", side_effect=AssertionError
+    )
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+    assert response["ETag"] == etag
+    assert response["Cache-Control"] == "public, max-age=0"
+    find_records.assert_not_called()
+
+
+def test_if_modified_since(client, query_file):
+    url = "/files/user_max_size/testfile/"
+    last_modified = client.get(url)["Last-Modified"]
+
+    response = client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+    assert response.status_code == 304
+
+    stat = os.stat(query_file)
+    os.utime(query_file, (stat.st_atime, stat.st_mtime + 10))
+    response = client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+    assert response.status_code == 200
+    assert response["Last-Modified"] != last_modified
+
+
+def test_etag_changes_with_file_and_parameters(client, query_file):
+    url = "/files/users/testfile/?page_size=4"
+    etag = client.get(url)["ETag"]
+
+    assert client.get(url)["ETag"] == etag
+    # Parameter order doesn't matter, their values do.
+    assert client.get(url + "&page=1")["ETag"] != etag
+    assert (
+        client.get("/files/users/testfile/?page=2&page_size=4")["ETag"]
+        == client.get("/files/users/testfile/?page_size=4&page=2")["ETag"]
+    )
+    desc_url = "/files/users_desc/testfile/?page_size=4"
+    assert client.get(desc_url)["ETag"] != etag
+
+    with open(query_file, "a") as f:
+        f.write("\nerin@uol.com.br inbox 000000001 size 000000001")
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response["ETag"] != etag
+    assert response.json()["count"] == 7
+
+
+def test_cache_max_age_setting(client, query_file, settings):
+    settings.FILES_QUERY_CACHE_MAX_AGE = 60
+    response = client.get("/files/top/testfile/")
+    assert response["Cache-Control"] == "public, max-age=60"
+
+
+def test_errors_are_not_cacheable(client, query_file):
+    response = client.get("/files/user_max_size/missing/")
+    assert response.status_code == 404
+    assert not response.has_header("ETag")
+    assert not response.has_header("Cache-Control")
+
+    response = client.get("/files/top/testfile/?k=0")
+    assert response.status_code == 400
+    assert not response.has_header("ETag")
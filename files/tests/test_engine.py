@@ -0,0 +1,200 @@
+import os
+import subprocess
+
+import pytest
+from django.conf import settings
+
+from files import engine
+from files.cache import result_cache
+from files.tests.utils import create_test_file, upload
+
+SAMPLE_INPUT = os.path.join(settings.BASE_DIR, "scripts", "input")
+
+EDGE_CASES_CONTENT = """bob@uol.com.br inbox 000000010 size 000000500
+alice@uol.com.br inbox 000000300 size 000000900
+alice.b@uol.com.br inbox 000000010 size 000000900
+carol@uol.com.br inbox 000000020 size 000000100
+dave@uol.com.br inbox 000000200 size 000000100
+zed@bol.com.br inbox 000000999 size 000000001"""
+
+# Blank lines and numbers without zero padding, which string comparisons
+# would order differently from numeric ones.
+IRREGULAR_CONTENT = """bob@uol.com.br inbox 9 size 99
+
+alice@uol.com.br inbox 10 size 100
+bob@uol.com.br inbox 10 size 7
+bob@uol.com.br inbox 000000009 size 000000100
+carol@uol.com.br inbox 000000010 size 000000100
+
+"""
+
+
+def run_shell_script(script_name, file_path, *args):
+    script_path = os.path.join(settings.BASE_DIR, "scripts", script_name)
+    result = subprocess.run(
+        [script_path, file_path, *args],
+        capture_output=True,
+        text=True,
+        check=True,
+        env={**os.environ, "LC_ALL": "C"},
+    )
+    return [line for line in result.stdout.split("\n") if line.strip()]
+
+
+def run_engine(script_name, file_path, *args):
+    lines = engine.run_command(script_name, file_path, *args)
+    return [line for line in lines if line.strip()]
+
+
+@pytest.fixture(params=["sample", "edge_cases", "irregular"])
+def input_file(request, test_files_dir):
+    if request.param == "sample":
+        return SAMPLE_INPUT
+    if request.param == "irregular":
+        return create_test_file(test_files_dir, "irregular", IRREGULAR_CONTENT)
+    return create_test_file(test_files_dir, "edge_cases", EDGE_CASES_CONTENT)
+
+
+@pytest.mark.parametrize(
+    "script_name, args",
+    [
+        ("max-min-size.sh", ()),
+        ("max-min-size.sh", ("-min",)),
+        ("order-by-username.sh", ()),
+        ("order-by-username.sh", ("-desc",)),
+        ("between-msgs.sh", ("0", "999999999")),
+        ("between-msgs.sh", ("10", "200")),
+        ("between-msgs.sh", ("1000000", "2000000")),
+        ("between-msgs.sh", ("500", "400")),
+    ],
+)
+def test_engine_matches_script(input_file, script_name, args):
+    assert run_engine(script_name, input_file, *args) == run_shell_script(
+        script_name, input_file, *args
+    )
+
+
+def test_engine_empty_file(test_files_dir):
+    file_path = create_test_file(test_files_dir, "empty", "")
+    assert engine.max_size_line(file_path) == []
+    assert engine.min_size_line(file_path) == []
+    assert engine.order_by_username(file_path) == []
+    assert engine.between_msgs(file_path, 0, 10) == []
+
+
+def test_engine_ties_keep_first_line(test_files_dir):
+    file_path = create_test_file(test_files_dir, "ties", EDGE_CASES_CONTENT)
+    assert engine.max_size_line(file_path) == [
+        "alice@uol.com.br inbox 000000300 size 000000900"
+    ]
+    assert engine.min_size_line(file_path) == [
+        "zed@bol.com.br inbox 000000999 size 000000001"
+    ]
+
+
+@pytest.mark.parametrize(
+    "script_name, args",
+    [
+        ("max-min-size.sh", ("-max",)),
+        ("order-by-username.sh", ("-asc",)),
+        ("between-msgs.sh", ("10",)),
+        ("between-msgs.sh", ("ten", "20")),
+        ("unknown.sh", ()),
+    ],
+)
+def test_engine_invalid_parameters(script_name, args):
+    with pytest.raises(ValueError):
+        engine.run_command(script_name, SAMPLE_INPUT, *args)
+
+
+def test_backends_agree_on_irregular_input(
+    client, upload_dir, test_files_dir, settings
+):
+    urls = [
+        "/files/user_max_size/testfile/",
+        "/files/user_min_size/testfile/",
+        "/files/users/testfile/",
+        "/files/users_desc/testfile/",
+        "/files/users_range_messages/testfile/9/9/",
+    ]
+    create_test_file(upload_dir, "testfile", IRREGULAR_CONTENT)
+    answers = {}
+    for backend in ("script", "python"):
+        settings.FILES_QUERY_BACKEND = backend
+        answers[backend] = [client.get(url).json() for url in urls]
+        result_cache.clear()
+    upload(client, test_files_dir, IRREGULAR_CONTENT)
+    answers["index"] = [client.get(url).json() for url in urls]
+
+    assert answers["script"] == answers["python"] == answers["index"]
+    max_size, min_size, users, users_desc, nine = answers["index"]
+    assert (max_size["username"], max_size["size"]) == (
+        "alice@uol.com.br",
+        100,
+    )
+    assert (min_size["username"], min_size["size"]) == ("bob@uol.com.br", 7)
+    assert [
+        (user["username"], user["numberMessages"], user["size"])
+        for user in users["results"]
+    ] == [
+        ("alice@uol.com.br", 10, 100),
+        ("bob@uol.com.br", 9, 99),
+        ("bob@uol.com.br", 9, 100),
+        ("bob@uol.com.br", 10, 7),
+        ("carol@uol.com.br", 10, 100),
+    ]
+    assert users_desc["results"] == users["results"][::-1]
+    assert nine["count"] == 2
+
+
+def test_user_max_size_python_backend(client, upload_dir, settings):
+    settings.FILES_QUERY_BACKEND = "python"
+    create_test_file(upload_dir, "testfile", EDGE_CASES_CONTENT)
+
+    response = client.get("/files/user_max_size/testfile/")
+    assert response.status_code == 200
+    assert response.json() == {
+        "username": "alice@uol.com.br",
+        "folder": "inbox",
+        "numberMessages": 300,
+        "size": 900,
+    }
+
+
+def test_user_list_desc_python_backend(client, upload_dir, settings):
+    settings.FILES_QUERY_BACKEND = "python"
+    create_test_file(upload_dir, "testfile", EDGE_CASES_CONTENT)
+
+    response = client.get("/files/users_desc/testfile/")
+    assert response.status_code == 200
+    response_json = response.json()
+    assert response_json["count"] == 6
+    assert [user["username"] for user in response_json["results"]] == [
+        "zed@bol.com.br",
+        "dave@uol.com.br",
+        "carol@uol.com.br",
+        "bob@uol.com.br",
+        "alice@uol.com.br",
+        "alice.b@uol.com.br",
+    ]
+
+
+def test_user_range_messages_python_backend(client, upload_dir, settings):
+    settings.FILES_QUERY_BACKEND = "python"
+    create_test_file(upload_dir, "testfile", EDGE_CASES_CONTENT)
+
+    response = client.get("/files/users_range_messages/testfile/15/250/")
+    assert response.status_code == 200
+    assert [user["username"] for user in response.json()["results"]] == [
+        "carol@uol.com.br",
+        "dave@uol.com.br",
+    ]
+
+
+def test_user_list_python_backend_empty_file(client, upload_dir, settings):
+    settings.FILES_QUERY_BACKEND = "python"
+    create_test_file(upload_dir, "testfile", "\n\n")
+
+    response = client.get("/files/users/testfile/")
+    assert response.status_code == 404
+    assert response.json()["error"] == "No data found in file."
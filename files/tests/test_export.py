@@ -0,0 +1,137 @@
+import csv
+import io
+import json
+import shutil
+
+import pytest
+
+from files import engine, export, extsort
+from files.tests.test_engine import EDGE_CASES_CONTENT, SAMPLE_INPUT
+from files.tests.utils import create_test_file, upload
+from files.utils import parse_line
+
+
+def expected_records(file_path, desc=False):
+    return [
+        parse_line(line)
+        for line in engine.order_by_username(file_path, desc)
+        if line.strip()
+    ]
+
+
+def read_ndjson(response):
+    assert response.streaming
+    assert response["Content-Type"] == "application/x-ndjson"
+    content = b"".join(response.streaming_content).decode()
+    return [json.loads(line) for line in content.splitlines()]
+
+
+def read_csv(response):
+    assert response.streaming
+    assert response["Content-Type"] == "text/csv; charset=utf-8"
+    content = b"".join(response.streaming_content).decode()
+    return list(csv.DictReader(io.StringIO(content)))
+
+
+@pytest.fixture
+def small_blocks(monkeypatch):
+    # Exercise the chunk and block boundaries with the sample file.
+    monkeypatch.setattr(export, "CHUNK_RECORDS", 3)
+    monkeypatch.setattr(extsort, "ITER_BLOCK_LINES", 7)
+
+
+@pytest.mark.parametrize("desc", [False, True])
+def test_export_ndjson(client, upload_dir, small_blocks, desc):
+    shutil.copy(SAMPLE_INPUT, f"{upload_dir}/input")
+    order = "desc" if desc else "asc"
+
+    response = client.get(f"/files/export/input/?order={order}")
+    assert response.status_code == 200
+    assert response["Content-Disposition"] == (
+        'attachment; filename="input.ndjson"'
+    )
+    assert read_ndjson(response) == expected_records(SAMPLE_INPUT, desc)
+
+
+def test_export_from_index(client, upload_dir, small_blocks):
+    with open(SAMPLE_INPUT, "rb") as f:
+        client.put("/upload/", {"file": f}, format="multipart")
+
+    response = client.get("/files/export/input/?order=desc&min_msgs=1000000")
+    assert read_ndjson(response) == [
+        record
+        for record in expected_records(SAMPLE_INPUT, desc=True)
+        if record["numberMessages"] >= 1000000
+    ]
+
+
+def test_export_skips_malformed_lines(client, upload_dir, test_files_dir):
+    content = (
+        "short line\n"
+        + EDGE_CASES_CONTENT
+        + "\nerin@uol.com.br inbox many size 10\n"
+    )
+    create_test_file(upload_dir, "testfile", content)
+    from_run = client.get("/files/export/testfile/")
+    assert from_run.status_code == 200
+    from_run = read_ndjson(from_run)
+
+    upload(client, test_files_dir, content)
+    from_index = read_ndjson(client.get("/files/export/testfile/"))
+    assert from_run == from_index
+    assert len(from_index) == 6
+
+
+def test_export_csv(client, upload_dir):
+    create_test_file(upload_dir, "testfile", EDGE_CASES_CONTENT)
+
+    response = client.get(
+        "/files/export/testfile/?format=csv&min_msgs=15&max_msgs=300"
+    )
+    assert response.status_code == 200
+    assert response["Content-Disposition"] == (
+        'attachment; filename="testfile.csv"'
+    )
+    assert read_csv(response) == [
+        {
+            "username": "alice@uol.com.br",
+            "folder": "inbox",
+            "numberMessages": "300",
+            "size": "900",
+        },
+        {
+            "username": "carol@uol.com.br",
+            "folder": "inbox",
+            "numberMessages": "20",
+            "size": "100",
+        },
+        {
+            "username": "dave@uol.com.br",
+            "folder": "inbox",
+            "numberMessages": "200",
+            "size": "100",
+        },
+    ]
+
+
+def test_export_empty(client, upload_dir):
+    create_test_file(upload_dir, "empty", "")
+
+    assert read_ndjson(client.get("/files/export/empty/")) == []
+    response = client.get("/files/export/empty/?format=csv")
+    assert b"".join(response.streaming_content) == (
+        b"username,folder,numberMessages,size\n"
+    )
+
+
+def test_export_errors(client, upload_dir):
+    response = client.get("/files/export/missing/")
+    assert response.status_code == 404
+    assert response.json() == {"error": "File not found."}
+
+    create_test_file(upload_dir, "testfile", EDGE_CASES_CONTENT)
+    response = client.get(
+        "/files/export/testfile/?format=xml&order=up&min_msgs=-1"
+    )
+    assert response.status_code == 400
+    assert set(response.json()) == {"format", "order", "min_msgs"}
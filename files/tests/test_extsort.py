@@ -0,0 +1,137 @@
+import os
+import random
+
+import pytest
+
+from files import engine, extsort, utils
+from files.extsort import SortedRun, external_sort, write_sorted_run
+from files.tests.test_engine import EDGE_CASES_CONTENT, SAMPLE_INPUT
+from files.tests.test_index import build_index
+from files.tests.utils import create_test_file
+
+
+@pytest.mark.parametrize("memory_limit", [1, 500, 10**9])
+def test_external_sort(memory_limit, tmp_path):
+    items = [(random.randbytes(3), random.randrange(5)) for _ in range(200)]
+    assert list(external_sort(items, memory_limit, tmp_path)) == sorted(items)
+    assert os.listdir(tmp_path) == []
+
+
+def test_external_sort_spills_runs(tmp_path, mocker):
+    spill = mocker.spy(extsort, "_spill")
+    items = [str(i).encode() for i in range(100, 0, -1)]
+    assert list(external_sort(items, 400, tmp_path)) == sorted(items)
+    assert spill.call_count > 1
+
+
+@pytest.mark.parametrize("memory_limit", [2_000, 10**9])
+def test_sorted_run_matches_sort(test_files_dir, memory_limit):
+    run_path = os.path.join(test_files_dir, "sorted.txt")
+    write_sorted_run(SAMPLE_INPUT, run_path, memory_limit)
+    expected = engine.order_by_username(SAMPLE_INPUT)
+
+    run = SortedRun(run_path)
+    assert len(run) == len(expected)
+    assert run[0] == expected[0]
+    assert run[-1] == expected[-1]
+    assert run[100:110] == expected[100:110]
+    assert list(run) == expected
+    assert run.is_current(SAMPLE_INPUT)
+
+    descending = run.reversed()
+    expected.reverse()
+    assert descending[0] == expected[0]
+    assert descending[5:9] == expected[5:9]
+    assert descending[::7] == expected[::7]
+
+
+def test_sorted_run_skips_blank_lines(test_files_dir):
+    source_path = create_test_file(test_files_dir, "blank", "b 1\n\n  \na 2\n")
+    run_path = os.path.join(test_files_dir, "sorted.txt")
+    write_sorted_run(source_path, run_path, 10**9)
+    assert list(SortedRun(run_path)) == ["a 2", "b 1"]
+
+
+def test_index_order_with_spilled_runs(test_files_dir, mocker):
+    spill = mocker.spy(extsort, "_spill")
+    with build_index(
+        SAMPLE_INPUT, os.path.join(test_files_dir, "expected.idx")
+    ) as expected:
+        assert spill.call_count == 0
+        with build_index(
+            SAMPLE_INPUT,
+            os.path.join(test_files_dir, "spilled.idx"),
+            sort_memory_limit=100_000,
+        ) as spilled:
+            assert spill.call_count > 3
+            assert list(spilled.order) == list(expected.order)
+            assert list(spilled.by_messages) == list(expected.by_messages)
+            assert list(spilled.by_size) == list(expected.by_size)
+
+
+def test_listing_streams_from_sorted_run(client, upload_dir, settings, mocker):
+    settings.FILES_QUERY_BACKEND = "python"
+    settings.FILES_SORT_MEMORY_LIMIT = 200
+    create_test_file(upload_dir, "testfile", EDGE_CASES_CONTENT)
+    write = mocker.spy(utils, "write_sorted_run")
+
+    response = client.get("/files/users/testfile/?page_size=4")
+    assert response.json()["count"] == 6
+    assert response.json()["results"][0]["username"] == "alice.b@uol.com.br"
+
+    response = client.get("/files/users_desc/testfile/?page=2&page_size=4")
+    assert [user["username"] for user in response.json()["results"]] == [
+        "alice@uol.com.br",
+        "alice.b@uol.com.br",
+    ]
+    assert write.call_count == 1
+
+    create_test_file(
+        upload_dir,
+        "testfile",
+        "juvati_be@uol.com.br inbox 000232478 size 012345671",
+    )
+    response = client.get("/files/users/testfile/")
+    assert response.json()["count"] == 1
+    assert write.call_count == 2
+
+
+def test_large_files_skip_the_sort_script(
+    client, upload_dir, settings, mocker
+):
+    settings.FILES_QUERY_BACKEND = "script"
+    settings.FILES_SCRIPT_SORT_MAX_BYTES = 100
+    create_test_file(upload_dir, "testfile", EDGE_CASES_CONTENT)
+    run = mocker.patch("subprocess.run")
+
+    response = client.get("/files/users/testfile/?page_size=4")
+    assert response.json()["count"] == 6
+    assert response.json()["results"][0]["username"] == "alice.b@uol.com.br"
+    response = client.get("/async/files/users_desc/testfile/?page_size=4")
+    assert response.json()["results"][0]["username"] == "zed@bol.com.br"
+    run.assert_not_called()
+
+
+def test_sorted_run_outlives_its_file(test_files_dir):
+    run_path = os.path.join(test_files_dir, "sorted.txt")
+    write_sorted_run(SAMPLE_INPUT, run_path, 10**9)
+    run = SortedRun(run_path)
+    # Removed by an index build while a listing is being exported.
+    os.remove(run_path)
+    assert list(run) == engine.order_by_username(SAMPLE_INPUT)
+
+
+@pytest.mark.parametrize("length", [0, 10, 100])
+def test_damaged_sorted_run_is_rebuilt(
+    client, upload_dir, settings, mocker, length
+):
+    settings.FILES_QUERY_BACKEND = "python"
+    create_test_file(upload_dir, "testfile", EDGE_CASES_CONTENT)
+    client.get("/files/users/testfile/")
+    run_path = os.path.join(utils.get_index_dir("testfile"), "sorted.txt")
+    os.truncate(run_path, length)
+    write = mocker.spy(utils, "write_sorted_run")
+
+    response = client.get("/files/users/testfile/?page_size=4")
+    assert response.json()["count"] == 6
+    write.assert_called_once()
@@ -0,0 +1,281 @@
+import os
+
+import pytest
+from django.conf import settings
+
+from files import engine
+from files.index import ColumnarIndex, IndexBuilder
+from files.records import LineSplitter, parse_record
+from files.tests.test_engine import EDGE_CASES_CONTENT, SAMPLE_INPUT
+from files.tests.utils import create_test_file
+from files.utils import parse_line
+
+
+def build_index(source_path, index_path, chunk_size=4096, **kwargs):
+    builder = IndexBuilder(**kwargs)
+    lines = LineSplitter()
+    with open(source_path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            for line in lines.feed(chunk):
+                if record := parse_record(line):
+                    builder.add(record)
+    for line in lines.close():
+        if record := parse_record(line):
+            builder.add(record)
+    builder.write(index_path, source_path)
+    return ColumnarIndex(index_path)
+
+
+@pytest.fixture(params=["sample", "edge_cases"])
+def source_path(request, test_files_dir):
+    if request.param == "sample":
+        return SAMPLE_INPUT
+    return create_test_file(test_files_dir, "edge_cases", EDGE_CASES_CONTENT)
+
+
+@pytest.fixture
+def index(source_path, test_files_dir):
+    index = build_index(
+        source_path, os.path.join(test_files_dir, "columns.idx")
+    )
+    yield index
+    index.close()
+
+
+def engine_records(lines):
+    return [parse_line(line) for line in lines]
+
+
+def test_line_splitter_across_chunks():
+    lines = LineSplitter()
+    assert lines.feed(b"a b") == []
+    assert lines.feed(b"c\nde\n\nf") == [b"a bc", b"de", b""]
+    assert lines.close() == [b"f"]
+    assert lines.close() == []
+
+
+@pytest.mark.parametrize(
+    "line, expected",
+    [
+        (
+            b"a@b.com inbox 000000010 size 000000020",
+            (b"a@b.com", b"inbox", 10, 20),
+        ),
+        (b"", None),
+        (b"a@b.com inbox 000000010 size", None),
+        (b"a@b.com inbox ten size 000000020", None),
+    ],
+)
+def test_parse_record(line, expected):
+    assert parse_record(line) == expected
+
+
+def test_index_matches_engine(index, source_path):
+    assert len(index) == len(engine.order_by_username(source_path))
+    assert index.max_size() == engine_records(
+        engine.max_size_line(source_path)
+    )
+    assert index.min_size() == engine_records(
+        engine.min_size_line(source_path)
+    )
+    assert list(index.order_by_username()) == engine_records(
+        engine.order_by_username(source_path)
+    )
+    assert list(index.order_by_username(desc=True)) == engine_records(
+        engine.order_by_username(source_path, desc=True)
+    )
+    for min_msgs, max_msgs in [(0, 999999999), (10, 200), (500, 400)]:
+        assert list(index.between_msgs(min_msgs, max_msgs)) == engine_records(
+            engine.between_msgs(source_path, min_msgs, max_msgs)
+        )
+
+
+def test_index_empty_file(test_files_dir):
+    source_path = create_test_file(test_files_dir, "empty", "")
+    with build_index(
+        source_path, os.path.join(test_files_dir, "columns.idx")
+    ) as index:
+        assert len(index) == 0
+        assert index.max_size() == []
+        assert index.min_size() == []
+        assert len(index.order_by_username()) == 0
+
+
+def test_index_is_current(index, source_path, test_files_dir):
+    assert index.is_current(source_path)
+    other_path = create_test_file(test_files_dir, "other", "changed")
+    assert not index.is_current(other_path)
+
+
+def test_upload_builds_index(client, upload_url, upload_dir, test_files_dir):
+    test_file_path = create_test_file(
+        test_files_dir, "testfile", EDGE_CASES_CONTENT
+    )
+    with open(test_file_path, "rb") as f:
+        response = client.put(upload_url, {"file": f}, format="multipart")
+    assert response.status_code == 201
+
+    index_path = os.path.join(
+        settings.MEDIA_ROOT, "indexes", "testfile", "columns.idx"
+    )
+    with ColumnarIndex(index_path) as index:
+        assert len(index) == 6
+        assert index.is_current(os.path.join(upload_dir, "testfile"))
+
+
+def test_queries_use_index(
+    client, upload_url, upload_dir, test_files_dir, mocker
+):
+    test_file_path = create_test_file(
+        test_files_dir, "testfile", EDGE_CASES_CONTENT
+    )
+    with open(test_file_path, "rb") as f:
+        client.put(upload_url, {"file": f}, format="multipart")
+    run = mocker.patch("subprocess.run")
+
+    response = client.get("/files/user_min_size/testfile/")
+    assert response.status_code == 200
+    assert response.json()["username"] == "zed@bol.com.br"
+
+    response = client.get("/files/users/testfile/?page_size=2")
+    assert response.status_code == 200
+    assert response.json()["count"] == 6
+    assert [user["username"] for user in response.json()["results"]] == [
+        "alice.b@uol.com.br",
+        "alice@uol.com.br",
+    ]
+
+    response = client.get("/files/users_range_messages/testfile/15/250/")
+    assert response.status_code == 200
+    assert response.json()["count"] == 2
+
+    run.assert_not_called()
+
+
+def test_stale_index_falls_back_to_script(
+    client, upload_url, upload_dir, test_files_dir, mocker
+):
+    test_file_path = create_test_file(
+        test_files_dir, "testfile", EDGE_CASES_CONTENT
+    )
+    with open(test_file_path, "rb") as f:
+        client.put(upload_url, {"file": f}, format="multipart")
+    create_test_file(
+        upload_dir,
+        "testfile",
+        "juvati_be@uol.com.br inbox 000232478 size 012345671",
+    )
+    mocker.patch(
+        "subprocess.run",
+        return_value=mocker.Mock(
+            stdout="juvati_be@uol.com.br inbox 000232478 size 012345671\n"
+        ),
+    )
+
+    response = client.get("/files/user_max_size/testfile/")
+    assert response.status_code == 200
+    assert response.json()["username"] == "juvati_be@uol.com.br"
+
+
+def test_record_sequence_slicing(index, source_path):
+    records = engine_records(engine.order_by_username(source_path))
+    sequence = index.order_by_username()
+    assert sequence[0] == records[0]
+    assert sequence[-1] == records[-1]
+    assert sequence[1:4] == records[1:4]
+    with pytest.raises(IndexError):
+        sequence[len(records)]
+
+    reversed_sequence = index.order_by_username(desc=True)
+    assert reversed_sequence[0] == records[-1]
+    assert reversed_sequence[1:3] == records[::-1][1:3]
+
+
+def test_paging_reads_only_page_records(
+    client, upload_url, upload_dir, test_files_dir, mocker
+):
+    with open(SAMPLE_INPUT, "rb") as f:
+        client.put(upload_url, {"file": f}, format="multipart")
+    record = mocker.spy(ColumnarIndex, "record")
+
+    response = client.get("/files/users/input/?page=3&page_size=5")
+    assert response.status_code == 200
+    response_json = response.json()
+    assert response_json["count"] == 20004
+    assert response_json["next"].endswith("page=4&page_size=5")
+    assert response_json["previous"].endswith("page=2&page_size=5")
+    assert response_json["results"] == engine_records(
+        engine.order_by_username(SAMPLE_INPUT)[10:15]
+    )
+    assert record.call_count == 5
+
+
+def test_range_positions_are_cached(
+    client, upload_url, upload_dir, test_files_dir, mocker
+):
+    with open(SAMPLE_INPUT, "rb") as f:
+        client.put(upload_url, {"file": f}, format="multipart")
+    positions = mocker.spy(ColumnarIndex, "between_msgs_positions")
+
+    for page in (1, 2):
+        response = client.get(
+            f"/files/users_range_messages/input/0/1000000/?page={page}"
+        )
+        assert response.status_code == 200
+        assert len(response.json()["results"]) == 10
+
+    assert positions.call_count == 1
+
+
+@pytest.mark.parametrize(
+    "min_value, max_value",
+    [(0, 999999999), (1, 100), (100, 900), (901, 5000), (500, 400)],
+)
+def test_index_ranges_match_engine(index, source_path, min_value, max_value):
+    assert list(index.between_msgs(min_value, max_value)) == engine_records(
+        engine.between_msgs(source_path, min_value, max_value)
+    )
+    assert list(index.between_size(min_value, max_value)) == engine_records(
+        engine.between_size(source_path, min_value, max_value)
+    )
+
+
+def test_user_range_size(client, upload_url, upload_dir, test_files_dir):
+    test_file_path = create_test_file(
+        test_files_dir, "testfile", EDGE_CASES_CONTENT
+    )
+    with open(test_file_path, "rb") as f:
+        client.put(upload_url, {"file": f}, format="multipart")
+
+    response = client.get("/files/users_range_size/testfile/100/500/")
+    assert response.status_code == 200
+    response_json = response.json()
+    assert response_json["count"] == 3
+    assert [user["username"] for user in response_json["results"]] == [
+        "bob@uol.com.br",
+        "carol@uol.com.br",
+        "dave@uol.com.br",
+    ]
+
+    response = client.get("/files/users_range_size/testfile/2000/3000/")
+    assert response.status_code == 404
+
+
+def test_user_range_size_without_index(client, upload_dir, mocker):
+    create_test_file(upload_dir, "testfile", EDGE_CASES_CONTENT)
+    run = mocker.patch("subprocess.run")
+
+    response = client.get("/files/users_range_size/testfile/0/100/")
+    assert response.status_code == 200
+    assert [user["username"] for user in response.json()["results"]] == [
+        "carol@uol.com.br",
+        "dave@uol.com.br",
+        "zed@bol.com.br",
+    ]
+    run.assert_not_called()
+
+
+def test_user_range_size_file_not_found(client, upload_dir):
+    response = client.get("/files/users_range_size/nonexistentfile/0/100/")
+    assert response.status_code == 404
+    assert response.json()["error"] == "File not found."
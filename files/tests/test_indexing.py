@@ -0,0 +1,227 @@
+import fcntl
+import os
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+import pytest
+
+from files import indexing
+from files.models import UploadedFile
+from files.tests.test_engine import EDGE_CASES_CONTENT
+from files.tests.utils import create_test_file, upload
+from files.utils import get_index_dir, index_file, open_index
+
+MORE_RECORDS = "\nerin@uol.com.br inbox 000000007 size 000000070\n"
+
+
+def wait_for(condition, timeout=60):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.05)
+
+
+@pytest.fixture
+def index_workers(settings, transactional_db):
+    # The pool's result thread records counts on its own DB connection,
+    # which only sees committed data.
+    settings.FILES_INDEX_WORKERS = 1
+
+
+def test_index_status(client, upload_dir, test_files_dir):
+    response = client.get("/files/index_status/testfile/")
+    assert response.status_code == 404
+
+    create_test_file(upload_dir, "testfile", EDGE_CASES_CONTENT)
+    response = client.get("/files/index_status/testfile/")
+    assert response.status_code == 200
+    assert response.json() == {
+        "file_name": "testfile",
+        "state": "unindexed",
+        "error": None,
+        "updated_at": None,
+    }
+
+    upload(client, test_files_dir, EDGE_CASES_CONTENT)
+    response = client.get("/files/index_status/testfile/")
+    assert response.json()["state"] == "ready"
+    assert response.json()["updated_at"]
+
+
+@pytest.mark.parametrize("keep", [0, 10, 100, -8])
+def test_damaged_index(client, upload_dir, test_files_dir, keep):
+    upload(client, test_files_dir, EDGE_CASES_CONTENT)
+    index_dir = get_index_dir("testfile")
+    index_path = os.path.join(index_dir, indexing.INDEX_FILE_NAME)
+    os.truncate(index_path, keep % os.path.getsize(index_path))
+    # Without a status file, the state comes from the index itself.
+    indexing.remove_statuses(index_dir, keep=(0, 0))
+
+    response = client.get("/files/index_status/testfile/")
+    assert response.status_code == 200
+    assert response.json()["state"] == "unindexed"
+    assert open_index(os.path.join(upload_dir, "testfile")) is None
+    response = client.get("/files/users/testfile/")
+    assert response.status_code == 200
+    assert response.json()["count"] == 6
+
+
+def test_failed_build(client, upload_dir, test_files_dir, mocker):
+    mocker.patch.object(
+        indexing.IndexBuilder, "write", side_effect=OSError("disk full")
+    )
+    response = upload(client, test_files_dir, EDGE_CASES_CONTENT)
+    assert response.status_code == 201
+
+    status = client.get("/files/index_status/testfile/").json()
+    assert (status["state"], status["error"]) == ("failed", "disk full")
+    assert UploadedFile.objects.get(name="testfile").record_count is None
+    # Queries scan the file instead.
+    response = client.get("/files/users_range_messages/testfile/15/250/")
+    assert response.status_code == 200
+    assert response.json()["count"] == 2
+
+
+def test_build_stops_when_file_is_replaced(upload_dir):
+    file_path = create_test_file(upload_dir, "testfile", EDGE_CASES_CONTENT)
+    index_dir = get_index_dir("testfile")
+    version = indexing.file_version(os.stat(file_path))
+    with open(file_path, "a") as f:
+        f.write(MORE_RECORDS)
+
+    assert (
+        indexing.build_derived_data(file_path, index_dir, version, 1 << 20)
+        is None
+    )
+    assert os.listdir(index_dir) == []
+
+
+def test_build_of_replaced_file_writes_nothing(upload_dir, mocker):
+    file_path = create_test_file(upload_dir, "testfile", EDGE_CASES_CONTENT)
+    index_dir = get_index_dir("testfile")
+    version = indexing.file_version(os.stat(file_path))
+    lock = indexing.lock
+
+    @contextmanager
+    def replaced_before_lock(index_dir):
+        # Replaced, and indexed by a newer build, after the last chunk was
+        # read.
+        with open(file_path, "a") as f:
+            f.write(MORE_RECORDS)
+        with lock(index_dir):
+            yield
+
+    mocker.patch.object(indexing, "lock", replaced_before_lock)
+    assert (
+        indexing.build_derived_data(file_path, index_dir, version, 1 << 20)
+        is None
+    )
+    assert not os.path.exists(
+        os.path.join(index_dir, indexing.INDEX_FILE_NAME)
+    )
+
+
+def test_build_sorts_outside_the_lock(upload_dir, mocker):
+    file_path = create_test_file(upload_dir, "testfile", EDGE_CASES_CONTENT)
+    index_dir = get_index_dir("testfile")
+    version = indexing.file_version(os.stat(file_path))
+    write = indexing.IndexBuilder.write
+
+    def unlocked_write(builder, *args):
+        # An upload can take the lock while the index is sorted.
+        lock_path = os.path.join(index_dir, indexing.LOCK_FILE_NAME)
+        with open(lock_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            fcntl.flock(f, fcntl.LOCK_UN)
+        write(builder, *args)
+
+    mocker.patch.object(indexing.IndexBuilder, "write", unlocked_write)
+    assert indexing.build_derived_data(file_path, index_dir, version, 1) == 6
+    assert sorted(os.listdir(index_dir)) == sorted(
+        [
+            indexing.INDEX_FILE_NAME,
+            indexing.SUMMARY_FILE_NAME,
+            indexing.ROLLUPS_FILE_NAME,
+            indexing.LOCK_FILE_NAME,
+            os.path.basename(indexing.status_path(index_dir, version)),
+        ]
+    )
+
+
+def test_cancelled_job_removes_its_status(upload_dir, mocker):
+    file_path = create_test_file(upload_dir, "testfile", EDGE_CASES_CONTENT)
+    index_dir = get_index_dir("testfile")
+    executor = mocker.patch.object(indexing, "get_executor").return_value
+    executor.submit.side_effect = lambda *args: Future()
+
+    first = indexing.submit(file_path, index_dir, 1 << 20, 1)
+    first_version = indexing.file_version(os.stat(file_path))
+    assert os.path.exists(indexing.status_path(index_dir, first_version))
+    with open(file_path, "a") as f:
+        f.write(MORE_RECORDS)
+    second = indexing.submit(file_path, index_dir, 1 << 20, 1)
+
+    assert first.cancelled() and not second.cancelled()
+    assert not os.path.exists(indexing.status_path(index_dir, first_version))
+    assert indexing.get_status(file_path, index_dir)["state"] == "pending"
+    second.cancel()
+
+
+def test_upload_returns_before_the_build(
+    client, upload_dir, test_files_dir, index_workers
+):
+    response = upload(client, test_files_dir, EDGE_CASES_CONTENT)
+    assert response.status_code == 201
+    assert client.get("/files/index_status/testfile/").json()["state"] in (
+        "pending",
+        "building",
+        "ready",
+    )
+    # Answered with a scan until the index is ready.
+    response = client.get("/files/users_range_messages/testfile/15/250/")
+    assert response.json()["count"] == 2
+
+    def indexed():
+        status = client.get("/files/index_status/testfile/").json()
+        return status["state"] == "ready"
+
+    wait_for(indexed)
+    assert open_index(os.path.join(upload_dir, "testfile")) is not None
+    wait_for(
+        lambda: UploadedFile.objects.get(name="testfile").record_count == 6
+    )
+
+
+def test_jobs_are_deduplicated(client, upload_dir, index_workers):
+    file_path = create_test_file(upload_dir, "testfile", EDGE_CASES_CONTENT)
+    UploadedFile.objects.create(
+        name="testfile",
+        size=0,
+        stored_size=0,
+        mtime_ns=os.stat(file_path).st_mtime_ns,
+        sha256="",
+    )
+    # Keeps the pool's only worker busy, so the jobs below wait.
+    indexing.get_executor(1).submit(time.sleep, 1)
+    first = index_file("testfile")
+    assert index_file("testfile") is first
+    assert client.get("/files/index_status/testfile/").json()["state"] == (
+        "pending"
+    )
+
+    # A new version replaces the job of the old one.
+    with open(file_path, "a") as f:
+        f.write(MORE_RECORDS)
+    second = index_file("testfile")
+    assert second is not first
+    # Cancelled, or stopped on finding the new version.
+    assert first.cancelled() or first.result(timeout=60) is None
+    assert second.result(timeout=60) == 7
+
+    index = open_index(file_path)
+    assert index is not None and len(index) == 7
+    index.close()
+    assert client.get("/files/index_status/testfile/").json()["state"] == (
+        "ready"
+    )
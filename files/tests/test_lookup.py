@@ -0,0 +1,136 @@
+import os
+
+import pytest
+
+from files import engine
+from files.extsort import SortedRun, write_sorted_run
+from files.tests.test_engine import EDGE_CASES_CONTENT, SAMPLE_INPUT
+from files.tests.test_index import build_index
+from files.tests.utils import create_test_file, upload
+from files.utils import parse_bytes_line, parse_line
+
+LOOKUP_CONTENT = (
+    EDGE_CASES_CONTENT + "\nalice@uol.com.br sent 000000001 size 000000002"
+)
+
+
+def sorted_records(file_path):
+    return [
+        parse_line(line)
+        for line in engine.order_by_username(file_path)
+        if line.strip()
+    ]
+
+
+@pytest.mark.parametrize("prefix", ["", "a", "alice", "alice@", "zz", "é"])
+def test_prefix_search(test_files_dir, prefix):
+    file_path = create_test_file(test_files_dir, "testfile", LOOKUP_CONTENT)
+    expected = [
+        record
+        for record in sorted_records(file_path)
+        if record["username"].startswith(prefix)
+    ]
+
+    with build_index(
+        file_path, os.path.join(test_files_dir, "lookup.idx")
+    ) as index:
+        assert list(index.username_prefix(prefix)) == expected
+        assert list(index.username_prefix(prefix, desc=True)) == (
+            expected[::-1]
+        )
+
+    run_path = os.path.join(test_files_dir, "sorted.txt")
+    write_sorted_run(file_path, run_path, 10**9)
+    run = SortedRun(run_path, parse=parse_bytes_line)
+    assert list(run.username_lines(prefix, prefix=True)) == expected
+    assert list(run.reversed().username_lines(prefix, prefix=True)) == (
+        expected[::-1]
+    )
+
+
+def test_find_username_sample(test_files_dir):
+    records = sorted_records(SAMPLE_INPUT)
+    username = records[len(records) // 2]["username"]
+    expected = [r for r in records if r["username"] == username]
+
+    with build_index(
+        SAMPLE_INPUT, os.path.join(test_files_dir, "lookup.idx")
+    ) as index:
+        assert list(index.find_username(username)) == expected
+        assert list(index.find_username(username + "x")) == []
+
+
+@pytest.mark.parametrize("indexed", [True, False])
+def test_user_lookup_view(client, upload_dir, test_files_dir, indexed):
+    if indexed:
+        file_path = create_test_file(
+            test_files_dir, "testfile", LOOKUP_CONTENT
+        )
+        with open(file_path, "rb") as f:
+            client.put("/upload/", {"file": f}, format="multipart")
+    else:
+        create_test_file(upload_dir, "testfile", LOOKUP_CONTENT)
+
+    response = client.get("/files/user/testfile/alice@uol.com.br/")
+    assert response.status_code == 200
+    assert response.json()["results"] == [
+        {
+            "username": "alice@uol.com.br",
+            "folder": "inbox",
+            "numberMessages": 300,
+            "size": 900,
+        },
+        {
+            "username": "alice@uol.com.br",
+            "folder": "sent",
+            "numberMessages": 1,
+            "size": 2,
+        },
+    ]
+
+    response = client.get("/files/user/testfile/alice/")
+    assert response.status_code == 404
+    assert response.json() == {"error": "User not found."}
+
+    def usernames(url):
+        response = client.get(url)
+        assert response.status_code == 200
+        return [user["username"] for user in response.json()["results"]]
+
+    assert usernames("/files/users/testfile/?prefix=alice") == [
+        "alice.b@uol.com.br",
+        "alice@uol.com.br",
+        "alice@uol.com.br",
+    ]
+    assert usernames(
+        "/files/users_desc/testfile/?prefix=alice&page_size=1"
+    ) == ["alice@uol.com.br"]
+    assert usernames(
+        "/files/users/testfile/?prefix=alice&pagination=cursor&page_size=2"
+    ) == ["alice.b@uol.com.br", "alice@uol.com.br"]
+    assert usernames("/async/files/users_desc/testfile/?prefix=d") == [
+        "dave@uol.com.br"
+    ]
+    assert client.get("/files/users/testfile/?prefix=x").status_code == 404
+
+
+@pytest.mark.parametrize("indexed", [True, False])
+def test_user_lookup_ignores_field_whitespace(
+    client, upload_dir, test_files_dir, indexed
+):
+    content = (
+        "alice@x\tinbox 000000001 size 000000002\n"
+        "  bob@x inbox 000000003 size 000000004\n"
+        "alice@xy inbox 000000005 size 000000006\n"
+    )
+    if indexed:
+        upload(client, test_files_dir, content)
+    else:
+        create_test_file(upload_dir, "testfile", content)
+
+    response = client.get("/files/user/testfile/alice@x/")
+    assert [user["size"] for user in response.json()["results"]] == [2]
+    response = client.get("/files/user/testfile/bob@x/")
+    assert [user["size"] for user in response.json()["results"]] == [4]
+    response = client.get("/files/users/testfile/?prefix=alice@x")
+    assert [user["size"] for user in response.json()["results"]] == [2, 6]
@@ -0,0 +1,129 @@
+import os
+import re
+
+import pytest
+
+from files import metrics
+from files.tests.test_engine import EDGE_CASES_CONTENT
+from files.tests.utils import create_test_file
+
+
+def samples(text):
+    """Map each sample line of an exposition to its value."""
+    values = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            sample, value = line.rsplit(" ", 1)
+            values[sample] = float(value)
+    return values
+
+
+@pytest.fixture(autouse=True)
+def fresh_store():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+@pytest.fixture
+def metrics_dir(settings, tmp_path):
+    settings.FILES_METRICS_DIR = str(tmp_path)
+    return tmp_path
+
+
+def test_exposition_format():
+    histogram = metrics.Histogram(
+        "test_seconds", "A test histogram.", ("kind",), buckets=(0.1, 1.0)
+    )
+    counter = metrics.Counter("test_total", "A test counter.", ("kind",))
+    try:
+        histogram.observe(0.05, kind='a"b')
+        histogram.observe(0.5, kind='a"b')
+        histogram.observe(5, kind='a"b')
+        counter.inc(kind="x")
+        counter.inc(2.5, kind="x")
+
+        text = metrics.exposition()
+    finally:
+        del metrics.REGISTRY["test_seconds"], metrics.REGISTRY["test_total"]
+
+    assert "# HELP test_seconds A test histogram.\n" in text
+    assert "# TYPE test_seconds histogram\n" in text
+    assert "# TYPE test_total counter\n" in text
+    values = samples(text)
+    assert values['test_seconds_bucket{kind="a\\"b",le="0.1"}'] == 1
+    assert values['test_seconds_bucket{kind="a\\"b",le="1"}'] == 2
+    assert values['test_seconds_sum{kind="a\\"b"}'] == 5.55
+    assert values['test_seconds_count{kind="a\\"b"}'] == 3
+    assert values['test_total{kind="x"}'] == 3.5
+
+
+def test_query_metrics(client, upload_dir, settings):
+    settings.FILES_QUERY_BACKEND = "python"
+    file_path = create_test_file(upload_dir, "testfile", EDGE_CASES_CONTENT)
+
+    url = "/files/users_range_messages/testfile/0/1000/"
+    assert client.get(url).status_code == 200
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response["Content-Type"] == metrics.CONTENT_TYPE
+    values = samples(response.content.decode())
+    endpoint = 'endpoint="user_range_messages",method="GET",status="200"'
+    assert values[f"files_request_duration_seconds_count{{{endpoint}}}"] == 1
+    for stage in ("setup_file_paths", "parse_lines", "paginate", "render"):
+        assert (
+            values[f'files_stage_duration_seconds_count{{stage="{stage}"}}']
+            >= 1
+        )
+    assert values['files_bytes_read_total{source="scan"}'] == (
+        os.path.getsize(file_path)
+    )
+    assert values["files_records_parsed_total"] == len(
+        EDGE_CASES_CONTENT.strip().splitlines()
+    )
+
+
+def test_script_metrics(client, upload_dir):
+    create_test_file(upload_dir, "testfile", EDGE_CASES_CONTENT)
+
+    url = "/files/users_range_messages/testfile/0/1000/"
+    assert client.get(url).status_code == 200
+    values = samples(client.get("/metrics").content.decode())
+
+    assert values['files_subprocesses_total{script="between-msgs.sh"}'] == 1
+    assert values['files_bytes_read_total{source="script"}'] > 0
+    assert (
+        values['files_stage_duration_seconds_count{stage="run_script"}'] == 1
+    )
+
+
+def test_metrics_are_summed_across_processes(metrics_dir):
+    # Another worker's file, as left by its MappedValues.
+    other = metrics.MappedValues(str(metrics_dir / "1.db"))
+    key = '["files_records_parsed_total", []]'
+    other.add(other.slot(key), 5)
+
+    metrics.RECORDS_PARSED.inc(3)
+
+    assert sorted(os.listdir(metrics_dir)) == sorted(
+        ["1.db", f"{os.getpid()}.db"]
+    )
+    assert metrics.collect()[key] == 8
+    assert re.search(
+        r"^files_records_parsed_total 8$", metrics.exposition(), re.M
+    )
+
+
+def test_mapped_values_grow_and_reopen(metrics_dir):
+    path = str(metrics_dir / "values.db")
+    store = metrics.MappedValues(path)
+    slots = [store.slot(f"key-{i}" * 100) for i in range(200)]
+    for i, slot in enumerate(slots):
+        store.add(slot, i)
+
+    assert os.path.getsize(path) > metrics.INITIAL_FILE_SIZE
+    reopened = metrics.MappedValues(path)
+    reopened.add(reopened.slot("key-3" * 100), 1)
+    assert dict(metrics.read_values(path))["key-3" * 100] == 4
+    assert len(metrics.read_values(path)) == 200
@@ -0,0 +1,126 @@
+import pytest
+
+from files.tests.test_engine import EDGE_CASES_CONTENT
+from files.tests.utils import create_test_file, upload
+
+# Duplicate usernames make sure the cursor breaks ties on the whole line.
+LISTING_CONTENT = "\n".join(
+    f"user{i % 9}@uol.com.br inbox {i:09d} size {i * 7 % 50:09d}"
+    for i in range(40)
+)
+
+DUPLICATES_CONTENT = "\n".join(
+    ["a@x.com inbox 000000001 size 000000002"] * 3
+    + ["b@x.com inbox 000000001 size 000000002"]
+    + ["c@x.com inbox 000000005 size 000000005"] * 2
+)
+
+
+def walk(client, url, link):
+    pages = []
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        response_json = response.json()
+        assert "count" not in response_json
+        pages.append(response_json["results"])
+        url = response_json[link]
+    return pages
+
+
+@pytest.mark.parametrize("endpoint", ["users", "users_desc"])
+def test_cursor_walks_whole_listing(
+    client, upload_dir, test_files_dir, endpoint
+):
+    upload(client, test_files_dir, LISTING_CONTENT)
+    expected = client.get(f"/files/{endpoint}/testfile/?page_size=100")
+    expected = expected.json()["results"]
+
+    pages = walk(
+        client,
+        f"/files/{endpoint}/testfile/?pagination=cursor&page_size=7",
+        "next",
+    )
+    assert [len(page) for page in pages] == [7, 7, 7, 7, 7, 5]
+    assert [record for page in pages for record in page] == expected
+
+    last_page = client.get(
+        f"/files/{endpoint}/testfile/?pagination=cursor&page_size=7"
+    )
+    for _ in range(5):
+        last_page = client.get(last_page.json()["next"])
+    back = walk(client, last_page.json()["previous"], "previous")
+    assert back == pages[-2::-1]
+
+
+@pytest.mark.parametrize("indexed", [True, False])
+@pytest.mark.parametrize("endpoint", ["users", "users_desc"])
+def test_cursor_walks_duplicate_records(
+    client, upload_dir, test_files_dir, endpoint, indexed
+):
+    if indexed:
+        upload(client, test_files_dir, DUPLICATES_CONTENT)
+    else:
+        create_test_file(upload_dir, "testfile", DUPLICATES_CONTENT)
+    expected = client.get(f"/files/{endpoint}/testfile/?page_size=100")
+    expected = [[record] for record in expected.json()["results"]]
+    assert len(expected) == 6
+
+    pages = walk(
+        client,
+        f"/files/{endpoint}/testfile/?pagination=cursor&page_size=1",
+        "next",
+    )
+    assert pages == expected
+
+    last_page = client.get(
+        f"/files/{endpoint}/testfile/?pagination=cursor&page_size=1"
+    )
+    for _ in range(5):
+        last_page = client.get(last_page.json()["next"])
+    back = walk(client, last_page.json()["previous"], "previous")
+    assert back == expected[-2::-1]
+
+
+def test_cursor_first_page_links(client, upload_dir, test_files_dir):
+    upload(client, test_files_dir, EDGE_CASES_CONTENT)
+
+    response = client.get("/files/users/testfile/?pagination=cursor")
+    response_json = response.json()
+    assert response_json["next"] is None
+    assert response_json["previous"] is None
+    assert len(response_json["results"]) == 6
+
+
+def test_cursor_with_script_backend(client, upload_dir, mocker):
+    create_test_file(upload_dir, "testfile", EDGE_CASES_CONTENT)
+    mocker.patch(
+        "subprocess.run",
+        return_value=mocker.Mock(
+            stdout="\n".join(sorted(EDGE_CASES_CONTENT.split("\n")))
+        ),
+    )
+
+    response = client.get(
+        "/files/users/testfile/?pagination=cursor&page_size=4"
+    )
+    response_json = response.json()
+    assert [user["username"] for user in response_json["results"]] == [
+        "alice.b@uol.com.br",
+        "alice@uol.com.br",
+        "bob@uol.com.br",
+        "carol@uol.com.br",
+    ]
+
+    response = client.get(response_json["next"])
+    assert [user["username"] for user in response.json()["results"]] == [
+        "dave@uol.com.br",
+        "zed@bol.com.br",
+    ]
+
+
+def test_invalid_cursor(client, upload_dir, test_files_dir):
+    upload(client, test_files_dir, EDGE_CASES_CONTENT)
+
+    response = client.get("/files/users/testfile/?cursor=not-a-cursor")
+    assert response.status_code == 404
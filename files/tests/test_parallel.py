@@ -0,0 +1,69 @@
+import pytest
+
+from files import engine, parallel
+from files.tests.test_engine import EDGE_CASES_CONTENT, SAMPLE_INPUT
+from files.tests.utils import create_test_file
+
+
+@pytest.mark.parametrize("parts", [1, 2, 5, 16])
+def test_split_ranges_are_line_aligned(parts):
+    ranges = parallel.split_ranges(SAMPLE_INPUT, parts)
+    with open(SAMPLE_INPUT, "rb") as f:
+        data = f.read()
+
+    assert 1 <= len(ranges) <= parts
+    assert ranges[0][0] == 0
+    assert ranges[-1][1] == len(data)
+    for (_, end), (start, _) in zip(ranges, ranges[1:]):
+        assert end == start
+        assert data[end - 1 : end] == b"\n"
+
+
+def test_split_ranges_small_files(test_files_dir):
+    empty = create_test_file(test_files_dir, "empty", "")
+    assert parallel.split_ranges(empty, 4) == []
+
+    one_line = create_test_file(test_files_dir, "one_line", "a b 1 size 2")
+    assert parallel.split_ranges(one_line, 4) == [(0, 12)]
+
+
+@pytest.mark.parametrize(
+    "operation, params",
+    [
+        ("max_size", ()),
+        ("min_size", ()),
+        ("between_msgs", (1000000, 2000000)),
+        ("between_size", (0, 500000)),
+    ],
+)
+def test_parallel_scan_matches_engine(operation, params):
+    assert parallel.scan(
+        SAMPLE_INPUT, operation, params, workers=3
+    ) == engine.OPERATIONS[operation](SAMPLE_INPUT, *params)
+
+
+def test_parallel_scan_keeps_first_tie(test_files_dir):
+    # Every line lands in its own range, so ties cross range boundaries.
+    file_path = create_test_file(test_files_dir, "ties", EDGE_CASES_CONTENT)
+    assert parallel.scan(file_path, "max_size", (), workers=6) == [
+        "alice@uol.com.br inbox 000000300 size 000000900"
+    ]
+    assert parallel.scan(file_path, "min_size", (), workers=6) == [
+        "zed@bol.com.br inbox 000000999 size 000000001"
+    ]
+
+
+def test_range_view_uses_parallel_scan(client, upload_dir, settings, mocker):
+    settings.FILES_QUERY_BACKEND = "python"
+    settings.FILES_SCAN_WORKERS = 2
+    settings.FILES_PARALLEL_SCAN_MIN_BYTES = 0
+    create_test_file(upload_dir, "testfile", EDGE_CASES_CONTENT)
+    scan = mocker.spy(parallel, "scan")
+
+    response = client.get("/files/users_range_messages/testfile/15/250/")
+    assert response.status_code == 200
+    assert [user["username"] for user in response.json()["results"]] == [
+        "carol@uol.com.br",
+        "dave@uol.com.br",
+    ]
+    scan.assert_called_once()
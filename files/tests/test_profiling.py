@@ -0,0 +1,132 @@
+import os
+import pstats
+from base64 import b64encode
+
+import pytest
+
+from files.profiling import SamplingProfiler
+from files.tests.test_engine import EDGE_CASES_CONTENT
+from files.tests.utils import create_test_file
+
+RANGE_URL = "/files/users_range_messages/testfile/0/1000/"
+
+
+@pytest.fixture
+def profiles_dir(settings, tmp_path):
+    settings.FILES_PROFILING = True
+    settings.FILES_PROFILES_DIR = str(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def staff_client(client, django_user_model):
+    user = django_user_model.objects.create_user(
+        "admin", password="secret", is_staff=True
+    )
+    client.force_login(user)
+    return client
+
+
+@pytest.fixture
+def query_file(upload_dir):
+    return create_test_file(upload_dir, "testfile", EDGE_CASES_CONTENT)
+
+
+def test_cprofile(staff_client, profiles_dir, query_file):
+    response = staff_client.get(f"{RANGE_URL}?profile=1")
+    assert response.status_code == 200
+    assert len(response.json()["results"]) == 6
+
+    name = response["X-Profile-Name"]
+    size = os.path.getsize(query_file)
+    assert name.endswith(
+        f"_user_range_messages_file_name=testfile_min_msgs=0"
+        f"_max_msgs=1000_{size}B.prof"
+    )
+    stats = pstats.Stats(str(profiles_dir / name))
+    assert any(function == "find_records" for _, _, function in stats.stats)
+
+
+def test_sampling_profile_of_stream(staff_client, profiles_dir, query_file):
+    response = staff_client.get(
+        "/files/export/testfile/?format=csv", HTTP_X_PROFILE="sampling"
+    )
+    name = response["X-Profile-Name"]
+    assert "_format=csv_" in name
+    assert name.endswith(".folded")
+    # Saved once the last chunk has been sent.
+    assert not os.path.exists(profiles_dir / name)
+    b"".join(response.streaming_content)
+    assert os.path.exists(profiles_dir / name)
+
+
+def test_sampling_profiler():
+    profiler = SamplingProfiler(interval=0.0005)
+    with profiler:
+        total = 0
+        while sum(profiler.stacks.values()) < 5:
+            total += 1
+    assert any(
+        "test_sampling_profiler (test_profiling.py" in stack
+        for stack in profiler.stacks
+    )
+
+
+def test_profiling_is_restricted_to_staff(
+    client, staff_client, profiles_dir, query_file
+):
+    response = staff_client.get(f"{RANGE_URL}?profile=lineprof")
+    assert response.status_code == 400
+
+    staff_client.logout()
+    response = client.get(
+        f"{RANGE_URL}?profile=1",
+        HTTP_AUTHORIZATION="Basic " + b64encode(b"admin:secret").decode(),
+    )
+    assert response.status_code == 200
+    assert "X-Profile-Name" in response
+
+    response = client.get(f"{RANGE_URL}?profile=1")
+    assert response.status_code == 403
+    assert response.json() == {
+        "error": "Profiling is restricted to staff users."
+    }
+
+
+def test_profiling_disabled(staff_client, profiles_dir, settings, query_file):
+    settings.FILES_PROFILING = False
+    response = staff_client.get(f"{RANGE_URL}?profile=1")
+    assert response.status_code == 200
+    assert "X-Profile-Name" not in response
+    assert os.listdir(profiles_dir) == []
+
+
+def test_list_and_download_profiles(
+    client, staff_client, profiles_dir, query_file
+):
+    first = staff_client.get(f"{RANGE_URL}?profile=1")["X-Profile-Name"]
+    second = staff_client.get(
+        "/files/stats/testfile/", HTTP_X_PROFILE="cprofile"
+    )["X-Profile-Name"]
+
+    response = staff_client.get("/profiles/")
+    assert response.status_code == 200
+    assert [profile["name"] for profile in response.json()] == [
+        second,
+        first,
+    ]
+
+    response = staff_client.get(f"/profiles/{first}/")
+    assert response.status_code == 200
+    assert response["Content-Disposition"] == (
+        f'attachment; filename="{first}"'
+    )
+    with open(profiles_dir / first, "rb") as f:
+        assert b"".join(response.streaming_content) == f.read()
+
+    assert staff_client.get("/profiles/missing.prof/").status_code == 404
+    assert staff_client.get("/profiles/..%2Fdb.sqlite3/").status_code == 404
+
+    staff_client.logout()
+    assert client.get("/profiles/").status_code == 403
+    assert client.get(f"/profiles/{first}/").status_code == 403
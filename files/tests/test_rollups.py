@@ -0,0 +1,116 @@
+import os
+
+import pytest
+from django.conf import settings
+
+from files import utils
+from files.records import parse_record
+from files.rollups import RollupBuilder, build_rollups, group_rows
+from files.tests.test_engine import SAMPLE_INPUT
+from files.tests.utils import create_test_file
+
+ROLLUP_CONTENT = """a@uol.com.br inbox 000000010 size 000000500
+b@bol.com.br inbox 000000020 size 000000100
+c@uol.com.br sent 000000003 size 000000007
+d@uol.com.br inbox 000000001 size 000000002
+nodomain inbox 000000005 size 000000005
+bad line"""
+
+
+def test_rollup_builder():
+    builder = RollupBuilder()
+    for line in ROLLUP_CONTENT.encode().split(b"\n"):
+        if record := parse_record(line):
+            builder.add(record)
+    rows = builder.as_list()
+
+    assert group_rows(rows, "domain") == [
+        {"domain": "", "count": 1, "total_size": 5, "total_messages": 5},
+        {
+            "domain": "bol.com.br",
+            "count": 1,
+            "total_size": 100,
+            "total_messages": 20,
+        },
+        {
+            "domain": "uol.com.br",
+            "count": 3,
+            "total_size": 509,
+            "total_messages": 14,
+        },
+    ]
+    assert group_rows(rows, "folder") == [
+        {
+            "folder": "inbox",
+            "count": 4,
+            "total_size": 607,
+            "total_messages": 36,
+        },
+        {"folder": "sent", "count": 1, "total_size": 7, "total_messages": 3},
+    ]
+    assert [
+        (row["domain"], row["folder"], row["count"])
+        for row in group_rows(rows, "both")
+    ] == [
+        ("", "inbox", 1),
+        ("bol.com.br", "inbox", 1),
+        ("uol.com.br", "inbox", 2),
+        ("uol.com.br", "sent", 1),
+    ]
+
+
+def test_build_rollups_sample():
+    (row,) = build_rollups(SAMPLE_INPUT)
+    assert (row["domain"], row["folder"], row["count"]) == (
+        "uol.com.br",
+        "inbox",
+        20004,
+    )
+
+
+@pytest.mark.parametrize("uploaded", [True, False])
+def test_group_by_view(client, upload_dir, test_files_dir, mocker, uploaded):
+    if uploaded:
+        file_path = create_test_file(
+            test_files_dir, "testfile", ROLLUP_CONTENT
+        )
+        with open(file_path, "rb") as f:
+            client.put("/upload/", {"file": f}, format="multipart")
+        assert os.path.exists(
+            os.path.join(
+                settings.MEDIA_ROOT, "indexes", "testfile", "rollups.json"
+            )
+        )
+    else:
+        create_test_file(upload_dir, "testfile", ROLLUP_CONTENT)
+    build = mocker.spy(utils, "build_rollups")
+
+    response = client.get("/files/group_by/testfile/")
+    assert response.status_code == 200
+    assert response.json()["count"] == 3
+    assert response.json()["results"][2]["total_size"] == 509
+
+    response = client.get("/files/group_by/testfile/?by=both&page_size=1")
+    assert response.json()["count"] == 4
+    assert response.json()["results"] == [
+        {
+            "domain": "",
+            "folder": "inbox",
+            "count": 1,
+            "total_size": 5,
+            "total_messages": 5,
+        }
+    ]
+    # Uploaded files are answered from their rollups, others scanned once.
+    assert build.call_count == (0 if uploaded else 1)
+
+
+def test_group_by_view_errors(client, upload_dir):
+    assert client.get("/files/group_by/missing/").status_code == 404
+
+    create_test_file(upload_dir, "empty", "")
+    assert client.get("/files/group_by/empty/").status_code == 404
+
+    response = client.get("/files/group_by/empty/?by=user")
+    assert response.status_code == 400
+    assert "by" in response.json()
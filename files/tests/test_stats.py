@@ -0,0 +1,105 @@
+import os
+import statistics
+
+import pytest
+
+from files import engine, utils
+from files.stats import file_stats
+from files.tests.test_engine import EDGE_CASES_CONTENT, SAMPLE_INPUT
+from files.tests.test_index import build_index
+from files.tests.utils import create_test_file, upload
+
+
+def test_file_stats(test_files_dir):
+    records = [
+        utils.parse_line(line)
+        for line in engine.iter_lines(SAMPLE_INPUT)
+        if line.strip()
+    ]
+    sizes = [record["size"] for record in records]
+
+    stats = file_stats(SAMPLE_INPUT, bins=4)
+    assert stats["count"] == len(records)
+    assert stats["numberMessages"]["sum"] == sum(
+        record["numberMessages"] for record in records
+    )
+    size_stats = stats["size"]
+    assert size_stats["sum"] == sum(sizes)
+    assert size_stats["mean"] == pytest.approx(statistics.mean(sizes))
+    assert (size_stats["min"], size_stats["max"]) == (min(sizes), max(sizes))
+    assert size_stats["percentiles"]["p50"] == pytest.approx(
+        statistics.median(sizes)
+    )
+    assert len(size_stats["histogram"]["edges"]) == 5
+    assert sum(size_stats["histogram"]["counts"]) == len(records)
+
+    with build_index(
+        SAMPLE_INPUT, os.path.join(test_files_dir, "stats.idx")
+    ) as index:
+        assert file_stats(SAMPLE_INPUT, 4, index) == stats
+
+
+def test_file_stats_empty(test_files_dir):
+    assert (
+        file_stats(create_test_file(test_files_dir, "empty", ""), 10) is None
+    )
+
+
+def test_stats_view(client, upload_dir, test_files_dir, mocker):
+    create_test_file(upload_dir, "testfile", EDGE_CASES_CONTENT)
+    compute = mocker.spy(utils, "file_stats")
+
+    response = client.get("/files/stats/testfile/?bins=2")
+    assert response.status_code == 200
+    assert response.json()["count"] == 6
+    assert response.json()["size"]["histogram"] == {
+        "edges": [1.0, 450.5, 900.0],
+        "counts": [3, 3],
+    }
+    assert response.json()["numberMessages"]["max"] == 999
+
+    # Cached until the file changes.
+    assert client.get("/files/stats/testfile/?bins=2").json() == (
+        response.json()
+    )
+    assert compute.call_count == 1
+
+    file_path = create_test_file(
+        test_files_dir, "testfile", "a inbox 5 size 7"
+    )
+    with open(file_path, "rb") as f:
+        client.put("/upload/", {"file": f}, format="multipart")
+    response = client.get("/files/stats/testfile/?bins=2")
+    assert response.json()["size"]["sum"] == 7
+    assert compute.call_count == 2
+
+
+def test_stats_skip_malformed_lines(client, upload_dir, test_files_dir):
+    content = EDGE_CASES_CONTENT + "\nbad line\nerin inbox many size 3\n"
+    create_test_file(upload_dir, "testfile", content)
+    from_file = client.get("/files/stats/testfile/?bins=3")
+    assert from_file.status_code == 200
+    assert from_file.json()["count"] == 6
+    batch = client.post(
+        "/files/query/testfile/",
+        {"operations": [{"op": "stats", "bins": 3}]},
+        format="json",
+    )
+    assert batch.json()["results"][0]["result"] == from_file.json()
+
+    upload(client, test_files_dir, content)
+    assert client.get("/files/stats/testfile/?bins=3").json() == (
+        from_file.json()
+    )
+
+
+def test_stats_view_errors(client, upload_dir):
+    assert client.get("/files/stats/missing/").status_code == 404
+
+    create_test_file(upload_dir, "empty", "")
+    assert client.get("/files/stats/empty/").status_code == 404
+
+    create_test_file(upload_dir, "testfile", EDGE_CASES_CONTENT)
+    response = client.get("/files/stats/testfile/?bins=0")
+    assert response.status_code == 400
+    assert "bins" in response.json()
@@ -0,0 +1,96 @@
+import gzip
+import lzma
+import os
+import shutil
+
+import pytest
+from django.conf import settings as django_settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+
+from files import storage
+from files.models import UploadedFile
+from files.tests.test_engine import EDGE_CASES_CONTENT, SAMPLE_INPUT
+from files.tests.utils import create_test_file
+
+QUERY_URLS = [
+    "/files/user_max_size/testfile/",
+    "/files/user_min_size/testfile/",
+    "/files/users/testfile/?page_size=4",
+    "/files/users_desc/testfile/?page=2&page_size=4",
+    "/files/users_range_messages/testfile/15/250/",
+    "/files/users_range_size/testfile/100/600/",
+]
+
+
+@pytest.mark.parametrize(
+    "codec, compress",
+    [(None, bytes), ("gzip", gzip.compress), ("lzma", lzma.compress)],
+)
+def test_open_upload(test_files_dir, codec, compress):
+    file_path = os.path.join(test_files_dir, "testfile")
+    with open(file_path, "wb") as f:
+        f.write(compress(EDGE_CASES_CONTENT.encode()))
+
+    assert storage.detect_codec(file_path) == codec
+    with storage.open_upload(file_path) as f:
+        assert f.read() == EDGE_CASES_CONTENT.encode()
+    with storage.open_upload(
+        file_path, "rt", encoding="utf-8", newline="\n"
+    ) as f:
+        assert f.read() == EDGE_CASES_CONTENT
+
+
+def test_unknown_codec(client, upload_dir, test_files_dir, settings):
+    settings.FILES_STORAGE_CODEC = "zip"
+    file_path = create_test_file(test_files_dir, "testfile", "a")
+    with pytest.raises(ImproperlyConfigured, match="FILES_STORAGE_CODEC"):
+        with open(file_path, "rb") as f:
+            client.put("/upload/", {"file": f}, format="multipart")
+    assert os.listdir(upload_dir) == []
+
+
+@pytest.mark.parametrize("codec", ["gzip", "lzma"])
+def test_compressed_upload(
+    client, upload_dir, test_files_dir, settings, codec
+):
+    file_path = create_test_file(
+        test_files_dir, "testfile", EDGE_CASES_CONTENT
+    )
+    with open(file_path, "rb") as f:
+        client.put("/upload/", {"file": f}, format="multipart")
+    expected = [client.get(url).json() for url in QUERY_URLS]
+
+    settings.FILES_STORAGE_CODEC = codec
+    with open(file_path, "rb") as f:
+        assert (
+            client.put("/upload/", {"file": f}, format="multipart").status_code
+            == 204
+        )
+    stored_path = os.path.join(upload_dir, "testfile")
+    assert storage.detect_codec(stored_path) == codec
+
+    # Through the index and summary...
+    assert [client.get(url).json() for url in QUERY_URLS] == expected
+    # ...and streaming through the decompressor, with both backends.
+    for backend in ("script", "python"):
+        settings.FILES_QUERY_BACKEND = backend
+        shutil.rmtree(os.path.join(django_settings.MEDIA_ROOT, "indexes"))
+        assert [client.get(url).json() for url in QUERY_URLS] == expected
+
+    entry = client.get("/files/").json()["results"][0]
+    assert entry["file_size"] == len(EDGE_CASES_CONTENT)
+    assert entry["stored_size"] == os.path.getsize(stored_path)
+
+
+def test_reconcile_compressed_file(upload_dir):
+    with open(SAMPLE_INPUT, "rb") as f:
+        data = f.read()
+    with open(os.path.join(upload_dir, "testfile"), "wb") as f:
+        f.write(gzip.compress(data))
+
+    call_command("reconcile_catalog")
+
+    entry = UploadedFile.objects.get(name="testfile")
+    assert entry.size == len(data)
+    assert entry.stored_size < len(data) // 3
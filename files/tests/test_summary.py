@@ -0,0 +1,97 @@
+import json
+import os
+
+from django.conf import settings
+
+from files.records import parse_record
+from files.summary import SummaryBuilder
+from files.tests.test_engine import EDGE_CASES_CONTENT
+from files.tests.utils import upload
+
+
+def read_summary(file_name):
+    summary_path = os.path.join(
+        settings.MEDIA_ROOT, "indexes", file_name, "summary.json"
+    )
+    with open(summary_path) as f:
+        return json.load(f)
+
+
+def test_summary_builder_aggregates():
+    builder = SummaryBuilder()
+    for line in EDGE_CASES_CONTENT.encode().split(b"\n"):
+        builder.add(parse_record(line))
+
+    summary = builder.as_dict()
+    assert summary["count"] == 6
+    assert summary["total_size"] == 2501
+    assert summary["total_messages"] == 1539
+    assert summary["min_messages"] == 10
+    assert summary["max_messages"] == 999
+    assert summary["max_size"]["username"] == "alice@uol.com.br"
+    assert summary["min_size"]["username"] == "zed@bol.com.br"
+
+
+def test_summary_builder_empty():
+    summary = SummaryBuilder().as_dict()
+    assert summary["count"] == 0
+    assert summary["max_size"] is None
+    assert summary["min_size"] is None
+
+
+def test_upload_writes_summary(client, upload_dir, test_files_dir):
+    response = upload(client, test_files_dir, EDGE_CASES_CONTENT)
+    assert response.status_code == 201
+
+    summary = read_summary("testfile")
+    assert summary["count"] == 6
+    assert summary["source_size"] == os.path.getsize(
+        os.path.join(upload_dir, "testfile")
+    )
+
+
+def test_replace_rebuilds_summary(client, upload_dir, test_files_dir):
+    upload(client, test_files_dir, EDGE_CASES_CONTENT)
+    response = upload(
+        client,
+        test_files_dir,
+        "juvati_be@uol.com.br inbox 000232478 size 012345671",
+    )
+    assert response.status_code == 204
+
+    summary = read_summary("testfile")
+    assert summary["count"] == 1
+    assert summary["max_size"]["username"] == "juvati_be@uol.com.br"
+
+    response = client.get("/files/user_min_size/testfile/")
+    assert response.json()["username"] == "juvati_be@uol.com.br"
+
+
+def test_max_min_size_use_summary(client, upload_dir, test_files_dir, mocker):
+    upload(client, test_files_dir, EDGE_CASES_CONTENT)
+    open_index = mocker.patch("files.utils.open_index")
+    run = mocker.patch("subprocess.run")
+
+    response = client.get("/files/user_max_size/testfile/")
+    assert response.status_code == 200
+    assert response.json() == {
+        "username": "alice@uol.com.br",
+        "folder": "inbox",
+        "numberMessages": 300,
+        "size": 900,
+    }
+
+    response = client.get("/files/user_min_size/testfile/")
+    assert response.status_code == 200
+    assert response.json()["username"] == "zed@bol.com.br"
+
+    open_index.assert_not_called()
+    run.assert_not_called()
+
+
+def test_max_size_empty_summary(client, upload_dir, test_files_dir):
+    upload(client, test_files_dir, "not a mailbox line")
+
+    response = client.get("/files/user_max_size/testfile/")
+    assert response.status_code == 404
+    assert response.json()["error"] == "No data found in file."
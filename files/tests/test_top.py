@@ -0,0 +1,87 @@
+import os
+
+import pytest
+
+from files import engine
+from files.tests.test_engine import EDGE_CASES_CONTENT, SAMPLE_INPUT
+from files.tests.test_index import build_index
+from files.tests.utils import create_test_file
+from files.utils import parse_line
+
+
+def reference_top(file_path, field, k, desc):
+    records = [
+        parse_line(line) for line in engine.iter_lines(file_path) if line
+    ]
+    key = "numberMessages" if field == "messages" else "size"
+    # sorted() is stable, so ties stay in file order.
+    return sorted(records, key=lambda r: r[key], reverse=desc)[:k]
+
+
+@pytest.fixture(params=["sample", "edge_cases"])
+def input_file(request, test_files_dir):
+    if request.param == "sample":
+        return SAMPLE_INPUT
+    return create_test_file(test_files_dir, "edge_cases", EDGE_CASES_CONTENT)
+
+
+@pytest.mark.parametrize("field", ["messages", "size"])
+@pytest.mark.parametrize("desc", [True, False])
+@pytest.mark.parametrize("k", [1, 2, 100_000])
+def test_top_matches_sort(input_file, test_files_dir, field, desc, k):
+    expected = reference_top(input_file, field, k, desc)
+    lines = engine.top(input_file, field, k, desc)
+    assert [parse_line(line) for line in lines] == expected
+
+    with build_index(
+        input_file, os.path.join(test_files_dir, "top.idx")
+    ) as index:
+        assert list(index.top(field, k, desc)) == expected
+
+
+def test_top_view(client, upload_dir, test_files_dir):
+    file_path = create_test_file(
+        test_files_dir, "testfile", EDGE_CASES_CONTENT
+    )
+
+    def usernames(query):
+        response = client.get(f"/files/top/testfile/?{query}")
+        assert response.status_code == 200
+        return [user["username"] for user in response.json()["results"]]
+
+    def check_queries():
+        assert usernames("k=3") == [
+            "alice@uol.com.br",
+            "alice.b@uol.com.br",
+            "bob@uol.com.br",
+        ]
+        assert usernames("by=size&k=2&order=asc") == [
+            "zed@bol.com.br",
+            "carol@uol.com.br",
+        ]
+        assert usernames("by=inbox&k=2") == [
+            "zed@bol.com.br",
+            "alice@uol.com.br",
+        ]
+        assert len(usernames("")) == 6
+
+    # Streaming pass over the file, then through the upload's index.
+    create_test_file(upload_dir, "testfile", EDGE_CASES_CONTENT)
+    check_queries()
+    with open(file_path, "rb") as f:
+        client.put("/upload/", {"file": f}, format="multipart")
+    check_queries()
+
+
+def test_top_view_errors(client, upload_dir):
+    response = client.get("/files/top/missing/")
+    assert response.status_code == 404
+
+    create_test_file(upload_dir, "testfile", EDGE_CASES_CONTENT)
+    response = client.get("/files/top/testfile/?by=folder&k=0&order=up")
+    assert response.status_code == 400
+    assert set(response.json()) == {"by", "k", "order"}
+
+    create_test_file(upload_dir, "empty", "")
+    response = client.get("/files/top/empty/")
+    assert response.status_code == 404
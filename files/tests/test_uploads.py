@@ -0,0 +1,233 @@
+import hashlib
+import os
+import stat
+import time
+from datetime import timedelta
+
+import pytest
+from django.core.management import call_command
+from django.utils import timezone
+
+from files import storage, views
+from files.models import UploadedFile, UploadSession
+from files.tests.test_engine import EDGE_CASES_CONTENT, SAMPLE_INPUT
+from files.uploads import get_session_dir
+
+
+def create_session(client, file_name, size, chunk_size=None):
+    data = {"file_name": file_name, "size": size}
+    if chunk_size is not None:
+        data["chunk_size"] = chunk_size
+    response = client.post("/upload/sessions/", data, format="json")
+    assert response.status_code == 201
+    return response.json()
+
+
+def put_chunk(client, session, number, data, sha256=None):
+    return client.put(
+        f"/upload/sessions/{session['id']}/chunks/{number}/",
+        data,
+        content_type="application/octet-stream",
+        HTTP_X_CHUNK_SHA256=sha256 or hashlib.sha256(data).hexdigest(),
+    )
+
+
+def commit(client, session):
+    return client.post(f"/upload/sessions/{session['id']}/commit/")
+
+
+def split(data, chunk_size):
+    return [
+        data[start : start + chunk_size]
+        for start in range(0, len(data), chunk_size)
+    ]
+
+
+def test_chunked_upload(client, upload_dir):
+    with open(SAMPLE_INPUT, "rb") as f:
+        data = f.read()
+    session = create_session(client, "testfile", len(data), 65536)
+    chunks = split(data, 65536)
+    assert session["chunk_count"] == len(chunks)
+    assert session["received_chunks"] == []
+
+    # Chunks may arrive in any order.
+    for number in reversed(range(len(chunks))):
+        response = put_chunk(client, session, number, chunks[number])
+        assert response.status_code == 204
+
+    assert commit(client, session).status_code == 201
+    with open(os.path.join(upload_dir, "testfile"), "rb") as f:
+        assert f.read() == data
+    assert UploadedFile.objects.get(name="testfile").sha256 == (
+        hashlib.sha256(data).hexdigest()
+    )
+    assert not UploadSession.objects.exists()
+    assert not os.path.exists(get_session_dir(UploadSession(id=session["id"])))
+
+    response = client.get("/files/user_max_size/testfile/")
+    assert response.status_code == 200
+
+    # Committing over an existing file keeps the 204 of a replacement.
+    session = create_session(client, "testfile", 0)
+    assert session["chunk_count"] == 0
+    assert commit(client, session).status_code == 204
+    assert os.path.getsize(os.path.join(upload_dir, "testfile")) == 0
+
+
+def test_stored_files_get_the_default_mode(client, upload_dir):
+    # The mode ``open`` gives new files, not mkstemp's 0600.
+    mode = 0o666 & ~storage.UMASK
+    data = EDGE_CASES_CONTENT.encode()
+    session = create_session(client, "testfile", len(data), 64)
+    for number, chunk in enumerate(split(data, 64)):
+        put_chunk(client, session, number, chunk)
+    chunk_path = os.path.join(
+        get_session_dir(UploadSession(id=session["id"])), "0"
+    )
+    assert stat.S_IMODE(os.stat(chunk_path).st_mode) == mode
+
+    assert commit(client, session).status_code == 201
+    file_path = os.path.join(upload_dir, "testfile")
+    assert stat.S_IMODE(os.stat(file_path).st_mode) == mode
+
+
+def test_resume_missing_chunks(client, upload_dir):
+    data = EDGE_CASES_CONTENT.encode()
+    session = create_session(client, "testfile", len(data), 50)
+    chunks = split(data, 50)
+    put_chunk(client, session, 0, chunks[0])
+    put_chunk(client, session, 2, chunks[2])
+
+    response = commit(client, session)
+    assert response.status_code == 409
+    missing = response.json()["missing_chunks"]
+    assert missing == [1] + list(range(3, len(chunks)))
+
+    response = client.get(f"/upload/sessions/{session['id']}/")
+    assert response.json()["received_chunks"] == [0, 2]
+
+    for number in missing:
+        response = put_chunk(client, session, number, chunks[number])
+        assert response.status_code == 204
+    assert commit(client, session).status_code == 201
+    with open(os.path.join(upload_dir, "testfile"), "rb") as f:
+        assert f.read() == data
+
+
+@pytest.mark.parametrize(
+    "number, data, sha256, error",
+    [
+        (0, b"0123", "0" * 64, "Checksum mismatch for chunk 0."),
+        (0, b"012", None, "Chunk 0 must have 4 bytes."),
+        (0, b"01234", None, "Chunk 0 must have 4 bytes."),
+        (1, b"0123", None, "Chunk 1 must have 2 bytes."),
+        (2, b"01", None, "Chunk 2 is out of range."),
+    ],
+)
+def test_rejected_chunks(client, upload_dir, number, data, sha256, error):
+    session = create_session(client, "testfile", 6, 4)
+    response = put_chunk(client, session, number, data, sha256)
+    assert response.status_code == 400
+    assert response.json() == {"error": error}
+    assert (
+        client.get(f"/upload/sessions/{session['id']}/").json()[
+            "received_chunks"
+        ]
+        == []
+    )
+
+
+def test_upload_session_errors(client, upload_dir, settings):
+    settings.FILES_UPLOAD_MAX_CHUNK_SIZE = 10
+    response = client.post(
+        "/upload/sessions/",
+        {"file_name": "bad.name", "size": -1, "chunk_size": 11},
+        format="json",
+    )
+    assert response.status_code == 400
+    assert set(response.json()) == {"file_name", "size", "chunk_size"}
+
+    session = create_session(client, "testfile", 6, 4)
+    response = client.put(
+        f"/upload/sessions/{session['id']}/chunks/0/",
+        b"0123",
+        content_type="application/octet-stream",
+    )
+    assert response.status_code == 400
+
+    missing = "00000000-0000-0000-0000-000000000000"
+    assert client.get(f"/upload/sessions/{missing}/").status_code == 404
+    assert client.post(f"/upload/sessions/{missing}/commit/").status_code == (
+        404
+    )
+
+
+def test_concurrent_commits(client, upload_dir, mocker):
+    data = EDGE_CASES_CONTENT.encode()
+    session = create_session(client, "testfile", len(data))
+    put_chunk(client, session, 0, data)
+    save_file = views.save_file
+    concurrent = []
+
+    def save_file_racing_another_commit(*args):
+        # A second commit and a late chunk arrive while this one streams
+        # the chunks.
+        concurrent.append(commit(client, session))
+        concurrent.append(put_chunk(client, session, 0, data))
+        return save_file(*args)
+
+    mocker.patch.object(
+        views, "save_file", side_effect=save_file_racing_another_commit
+    )
+    assert commit(client, session).status_code == 201
+    assert [response.status_code for response in concurrent] == [409, 409]
+    assert concurrent[0].json() == {
+        "error": "Upload is already being committed."
+    }
+    with open(os.path.join(upload_dir, "testfile"), "rb") as f:
+        assert f.read() == data
+    assert not UploadSession.objects.exists()
+
+
+def test_failed_commit_can_be_retried(client, upload_dir, mocker):
+    data = EDGE_CASES_CONTENT.encode()
+    session = create_session(client, "testfile", len(data))
+    put_chunk(client, session, 0, data)
+    mocker.patch.object(views, "save_file", side_effect=OSError("disk full"))
+    with pytest.raises(OSError):
+        commit(client, session)
+
+    mocker.stopall()
+    assert commit(client, session).status_code == 201
+
+
+def test_reconcile_deletes_expired_sessions(client, upload_dir, settings):
+    settings.FILES_UPLOAD_SESSION_TTL = 3600
+    expired = create_session(client, "expired", 6, 4)
+    put_chunk(client, expired, 0, b"0123")
+    # Never got a chunk.
+    create_session(client, "idle", 6, 4)
+    active = create_session(client, "active", 6, 4)
+    put_chunk(client, active, 0, b"0123")
+    two_hours_ago = timezone.now() - timedelta(hours=2)
+    UploadSession.objects.update(created_at=two_hours_ago)
+    old = time.time() - 2 * 3600
+    expired_dir = get_session_dir(UploadSession(id=expired["id"]))
+    os.utime(expired_dir, (old, old))
+    # Left behind by a session that no longer exists.
+    orphan_dir = get_session_dir(
+        UploadSession(id="00000000-0000-0000-0000-000000000000")
+    )
+    os.makedirs(orphan_dir)
+
+    call_command("reconcile_catalog")
+
+    assert sorted(
+        str(session_id)
+        for session_id in UploadSession.objects.values_list("id", flat=True)
+    ) == [active["id"]]
+    assert not os.path.exists(expired_dir)
+    assert not os.path.exists(orphan_dir)
+    response = client.get(f"/upload/sessions/{active['id']}/")
+    assert response.json()["received_chunks"] == [0]
@@ -2,6 +2,7 @@ import os
 import subprocess
 
 from django.conf import settings
+from django.core.management import call_command
 
 from files.tests.utils import create_test_file
 
@@ -75,6 +76,7 @@ def test_list_files_empty(client):
 def test_list_files_with_files(client, upload_dir):
     create_test_file(upload_dir, "testfile1.txt", "This is a test file 1.")
     create_test_file(upload_dir, "testfile2.txt", "This is a test file 2.")
+    call_command("reconcile_catalog")
 
     response = client.get("/files/")
     assert response.status_code == 200
@@ -87,6 +89,7 @@ def test_list_files_pagination(client, upload_dir):
         create_test_file(
             upload_dir, f"testfile{i}.txt", f"This is test file {i}."
         )
+    call_command("reconcile_catalog")
 
     response = client.get("/files/?page=1&page_size=10")
     assert response.status_code == 200
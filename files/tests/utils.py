@@ -6,3 +6,10 @@ def create_test_file(directory, file_name, content="This is a test file"):
     with open(file_path, "w") as f:
         f.write(content)
     return file_path
+
+
+def upload(client, test_files_dir, content, file_name="testfile"):
+    """Upload ``content`` as ``file_name`` through the upload endpoint."""
+    file_path = create_test_file(test_files_dir, file_name, content)
+    with open(file_path, "rb") as f:
+        return client.put("/upload/", {"file": f}, format="multipart")
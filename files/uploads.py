@@ -0,0 +1,156 @@
+"""Storage for chunked, resumable uploads.
+
+Each chunk of an ``UploadSession`` is written atomically to its own file,
+so chunks can arrive in parallel and in any order, and a client that lost
+its connection only resends the chunks the session doesn't list yet. On
+commit the chunks are streamed, in order, through ``store_file`` like a
+regular upload.
+
+Sessions that get no chunks for ``FILES_UPLOAD_SESSION_TTL`` seconds are
+deleted with their chunks by ``delete_expired_sessions``, which the
+``reconcile_catalog`` command runs.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+
+from .models import UploadSession
+from .storage import set_default_mode
+
+READ_SIZE = 1024 * 1024
+
+
+class ChecksumMismatch(ValueError):
+    pass
+
+
+def get_session_dir(session):
+    return os.path.join(
+        settings.MEDIA_ROOT, "upload_sessions", str(session.id)
+    )
+
+
+def write_chunk(session, number, stream, sha256):
+    """Store chunk ``number`` read from ``stream``.
+
+    Raises ``ValueError`` if the chunk has the wrong length and
+    ``ChecksumMismatch`` if its SHA-256 isn't ``sha256``; nothing is kept
+    in either case.
+    """
+    session_dir = get_session_dir(session)
+    os.makedirs(session_dir, exist_ok=True)
+    expected = session.chunk_length(number)
+    content_hash = hashlib.sha256()
+    length = 0
+    fd, tmp_path = tempfile.mkstemp(dir=session_dir, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            set_default_mode(f.fileno())
+            while length <= expected:
+                data = stream.read(min(READ_SIZE, expected + 1 - length))
+                if not data:
+                    break
+                f.write(data)
+                content_hash.update(data)
+                length += len(data)
+        if length != expected:
+            raise ValueError(f"Chunk {number} must have {expected} bytes.")
+        if content_hash.hexdigest() != sha256.lower():
+            raise ChecksumMismatch(f"Checksum mismatch for chunk {number}.")
+        os.replace(tmp_path, os.path.join(session_dir, str(number)))
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def received_chunks(session):
+    session_dir = get_session_dir(session)
+    if not os.path.isdir(session_dir):
+        return []
+    return sorted(
+        int(name) for name in os.listdir(session_dir) if name.isdigit()
+    )
+
+
+def missing_chunks(session):
+    received = set(received_chunks(session))
+    return [n for n in range(session.chunk_count) if n not in received]
+
+
+def delete_chunks(session):
+    shutil.rmtree(get_session_dir(session), ignore_errors=True)
+
+
+def claim_session(session):
+    """Mark ``session`` as being committed; False if a commit already is."""
+    return bool(
+        UploadSession.objects.filter(id=session.id, committing=False).update(
+            committing=True
+        )
+    )
+
+
+def release_session(session):
+    UploadSession.objects.filter(id=session.id).update(committing=False)
+
+
+def last_activity(session):
+    """When the session was created or last received a chunk."""
+    try:
+        mtime = os.stat(get_session_dir(session)).st_mtime
+    except FileNotFoundError:
+        return session.created_at
+    return max(session.created_at, datetime.fromtimestamp(mtime, timezone.utc))
+
+
+def delete_expired_sessions(ttl=None):
+    """Delete the sessions idle for ``ttl`` seconds, and orphaned chunks.
+
+    Returns the number of sessions deleted.
+    """
+    if ttl is None:
+        ttl = settings.FILES_UPLOAD_SESSION_TTL
+    expiry = datetime.now(timezone.utc) - timedelta(seconds=ttl)
+    deleted = 0
+    # A session's directory only gets newer than its creation time.
+    for session in UploadSession.objects.filter(created_at__lt=expiry):
+        if last_activity(session) < expiry:
+            delete_chunks(session)
+            session.delete()
+            deleted += 1
+
+    sessions_dir = os.path.join(settings.MEDIA_ROOT, "upload_sessions")
+    if os.path.isdir(sessions_dir):
+        known = {
+            str(session_id)
+            for session_id in UploadSession.objects.values_list(
+                "id", flat=True
+            )
+        }
+        for name in os.listdir(sessions_dir):
+            if name not in known:
+                shutil.rmtree(
+                    os.path.join(sessions_dir, name), ignore_errors=True
+                )
+    return deleted
+
+
+class AssembledUpload:
+    """The chunks of a complete session, read like an uploaded file."""
+
+    def __init__(self, session):
+        self.name = session.file_name
+        self.size = session.size
+        self._session_dir = get_session_dir(session)
+        self._chunk_count = session.chunk_count
+
+    def chunks(self, chunk_size=READ_SIZE):
+        for number in range(self._chunk_count):
+            path = os.path.join(self._session_dir, str(number))
+            with open(path, "rb") as f:
+                yield from iter(lambda: f.read(chunk_size), b"")
@@ -1,18 +1,87 @@
 from django.urls import path
 
+from .async_views import (
+    AsyncFileListView,
+    AsyncFileUploadView,
+    AsyncUserListDescView,
+    AsyncUserListView,
+    AsyncUserMaxSizeView,
+    AsyncUserMinSizeView,
+    AsyncUserRangeMessagesView,
+    AsyncUserRangeSizeView,
+)
 from .views import (
+    BatchQueryView,
+    ExportView,
+    FileAppendView,
     FileListView,
+    FileStatsView,
     FileUploadView,
+    GroupByView,
+    IndexStatusView,
+    MetricsView,
+    ProfileDownloadView,
+    ProfileListView,
+    ResultCacheStatsView,
+    TopRecordsView,
+    UploadChunkView,
+    UploadCommitView,
+    UploadSessionDetailView,
+    UploadSessionView,
     UserListDescView,
     UserListView,
+    UserLookupView,
     UserMaxSizeView,
     UserMinSizeView,
     UserRangeMessagesView,
+    UserRangeSizeView,
 )
 
 urlpatterns = [
     path("upload/", FileUploadView.as_view(), name="file_upload"),
+    path(
+        "upload/sessions/",
+        UploadSessionView.as_view(),
+        name="upload_session",
+    ),
+    path(
+        "upload/sessions/<uuid:session_id>/",
+        UploadSessionDetailView.as_view(),
+        name="upload_session_detail",
+    ),
+    path(
+        "upload/sessions/<uuid:session_id>/chunks/<int:number>/",
+        UploadChunkView.as_view(),
+        name="upload_chunk",
+    ),
+    path(
+        "upload/sessions/<uuid:session_id>/commit/",
+        UploadCommitView.as_view(),
+        name="upload_commit",
+    ),
     path("files/", FileListView.as_view(), name="file_list"),
+    path(
+        "files/append/<str:file_name>/",
+        FileAppendView.as_view(),
+        name="file_append",
+    ),
+    path("metrics", MetricsView.as_view(), name="metrics"),
+    path("profiles/", ProfileListView.as_view(), name="profile_list"),
+    path(
+        "profiles/<str:profile_name>/",
+        ProfileDownloadView.as_view(),
+        name="profile_download",
+    ),
+    path(
+        "files/index_status/<str:file_name>/",
+        IndexStatusView.as_view(),
+        name="index_status",
+    ),
+    path(
+        "files/cache_stats/",
+        ResultCacheStatsView.as_view(),
+        name="result_cache_stats",
+    ),
     path(
         "files/user_max_size/<str:file_name>/",
         UserMaxSizeView.as_view(),
@@ -23,6 +92,36 @@ urlpatterns = [
         UserMinSizeView.as_view(),
         name="user_min_size",
     ),
+    path(
+        "files/export/<str:file_name>/",
+        ExportView.as_view(),
+        name="export",
+    ),
+    path(
+        "files/group_by/<str:file_name>/",
+        GroupByView.as_view(),
+        name="group_by",
+    ),
+    path(
+        "files/query/<str:file_name>/",
+        BatchQueryView.as_view(),
+        name="batch_query",
+    ),
+    path(
+        "files/stats/<str:file_name>/",
+        FileStatsView.as_view(),
+        name="file_stats",
+    ),
+    path(
+        "files/top/<str:file_name>/",
+        TopRecordsView.as_view(),
+        name="top_records",
+    ),
+    path(
+        "files/user/<str:file_name>/<str:username>/",
+        UserLookupView.as_view(),
+        name="user_lookup",
+    ),
     path(
         "files/users/<str:file_name>/",
         UserListView.as_view(),
@@ -39,4 +138,45 @@ urlpatterns = [
         UserRangeMessagesView.as_view(),
         name="user_range_messages",
     ),
+    path(
+        "files/users_range_size/<str:file_name>/<int:min_size>/"
+        "<int:max_size>/",
+        UserRangeSizeView.as_view(),
+        name="user_range_size",
+    ),
+    # Async versions of the endpoints above, for ASGI servers.
+    path("async/upload/", AsyncFileUploadView.as_view(), name="async_upload"),
+    path("async/files/", AsyncFileListView.as_view(), name="async_file_list"),
+    path(
+        "async/files/user_max_size/<str:file_name>/",
+        AsyncUserMaxSizeView.as_view(),
+        name="async_user_max_size",
+    ),
+    path(
+        "async/files/user_min_size/<str:file_name>/",
+        AsyncUserMinSizeView.as_view(),
+        name="async_user_min_size",
+    ),
+    path(
+        "async/files/users/<str:file_name>/",
+        AsyncUserListView.as_view(),
+        name="async_user_list",
+    ),
+    path(
+        "async/files/users_desc/<str:file_name>/",
+        AsyncUserListDescView.as_view(),
+        name="async_user_list_desc",
+    ),
+    path(
+        "async/files/users_range_messages/<str:file_name>/<int:min_msgs>/"
+        "<int:max_msgs>/",
+        AsyncUserRangeMessagesView.as_view(),
+        name="async_user_range_messages",
+    ),
+    path(
+        "async/files/users_range_size/<str:file_name>/<int:min_size>/"
+        "<int:max_size>/",
+        AsyncUserRangeSizeView.as_view(),
+        name="async_user_range_size",
+    ),
 ]
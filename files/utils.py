@@ -1,18 +1,64 @@
+import hashlib
+import itertools
 import logging
 import os
 import re
+import struct
 import subprocess
+import tempfile
+from functools import partial
 
 from django.conf import settings
+from django.db import connection, models
 from rest_framework import status
 from rest_framework.response import Response
 
+from . import engine, indexing, parallel
+from .cache import result_cache
+from .extsort import SortedRun, write_sorted_run
+from .index import ColumnarIndex, IndexBuilder, RecordSequence, merge_index
+from .indexing import (
+    INDEX_FILE_NAME,
+    READ_SIZE,
+    ROLLUPS_FILE_NAME,
+    SORTED_RUN_FILE_NAME,
+    SUMMARY_FILE_NAME,
+    add_records,
+)
+from .metrics import BYTES_READ, RECORDS_PARSED, SUBPROCESSES, timed
+from .models import UploadedFile, UploadSession
+from .records import LineSplitter, parse_record
+from .rollups import RollupBuilder, build_rollups, group_rows, load_rollups
+from .stats import file_stats
+from .storage import (
+    compressing_writer,
+    detect_codec,
+    is_compressed,
+    open_upload,
+    set_default_mode,
+)
+from .summary import SummaryBuilder, load_summary
+
 
 def is_valid_file_name(file_name):
     return re.match(r"^[a-zA-Z0-9_-]+$", file_name) is not None
 
 
 def save_file(file, file_name):
+    status_code, catalog_entry = store_file(file, file_name)
+    update_catalog(file_name, catalog_entry)
+    index_file(file_name)
+    return status_code
+
+
+def store_file(file, file_name):
+    """Write an upload to disk.
+
+    Returns the response status and the file's catalog fields; the catalog
+    itself is updated separately so async views can run the disk work off
+    the event loop's database thread. The record count is left empty for
+    ``index_file`` to fill in.
+    """
     upload_dir = os.path.join(settings.MEDIA_ROOT, "uploaded_files")
     os.makedirs(upload_dir, exist_ok=True)
     file_path = os.path.join(upload_dir, file_name)
@@ -22,14 +68,331 @@ def save_file(file, file_name):
     else:
         status_code = status.HTTP_201_CREATED
 
-    with open(file_path, "wb+") as destination:
-        for chunk in file.chunks():
-            destination.write(chunk)
+    content_hash = hashlib.sha256()
+    size = 0
+    codec = settings.FILES_STORAGE_CODEC
+    # Written next to the destination and swapped in, so readers never see
+    # a partial file. The leading dot keeps it out of the catalog.
+    fd, tmp_path = tempfile.mkstemp(prefix=".upload-", dir=upload_dir)
+    try:
+        with os.fdopen(fd, "wb") as destination:
+            set_default_mode(destination.fileno())
+            if not codec:
+                preallocate(destination, file.size)
+            writer = compressing_writer(destination, codec)
+            for chunk in file.chunks():
+                writer.write(chunk)
+                size += len(chunk)
+                content_hash.update(chunk)
+            if writer is not destination:
+                # Ends the compressed stream; ``destination`` stays open.
+                writer.close()
+            # In case the upload came out shorter than announced.
+            destination.truncate()
+        # Appends write to the file in place; an upload swapped in while
+        # one runs would drop its lines.
+        with file_lock(file_name):
+            os.replace(tmp_path, file_path)
+            fields = catalog_fields(
+                file_path, size, None, content_hash.hexdigest()
+            )
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+    result_cache.invalidate(file_name)
+    return status_code, fields
+
+
+def index_file(file_name):
+    """Build the derived data of an uploaded file.
+
+    In the background, unless ``FILES_INDEX_WORKERS`` is 0; see
+    ``files.indexing``. Its catalog entry gets the record count once done.
+    """
+    workers = settings.FILES_INDEX_WORKERS
+    return indexing.submit(
+        os.path.join(settings.MEDIA_ROOT, "uploaded_files", file_name),
+        get_index_dir(file_name),
+        settings.FILES_SORT_MEMORY_LIMIT,
+        workers,
+        on_done=partial(
+            set_catalog_field, file_name, "record_count", workers > 0
+        ),
+    )
+
+
+def get_index_status(file_path):
+    """Return the indexing state of an uploaded file.
+
+    See ``files.indexing``.
+    """
+    return indexing.get_status(
+        file_path, get_index_dir(os.path.basename(file_path))
+    )
+
+
+def set_catalog_field(file_name, field, close_connection, version, value):
+    """Set a field of the catalog entry of one version of a file."""
+    UploadedFile.objects.filter(name=file_name, mtime_ns=version[1]).update(
+        **{field: value}
+    )
+    if close_connection:
+        # Called from the pool's result thread, which keeps no connection.
+        connection.close()
+
+
+def append_file(stream, file_name):
+    """Append the content read from ``stream`` to an uploaded file.
+
+    Only the appended lines are parsed. When the file's index, summary and
+    rollups are up to date they are carried forward with those lines and
+    stay current; otherwise a full build is queued, like for an upload.
+    Runs under the file's ``file_lock``, so appends and uploads of a file
+    don't interleave. Returns the appended byte and record counts, or None
+    if ``stream`` is empty.
+    """
+    file_path = os.path.join(settings.MEDIA_ROOT, "uploaded_files", file_name)
+    index_dir = get_index_dir(file_name)
+    rollups_path = os.path.join(index_dir, ROLLUPS_FILE_NAME)
+    first_chunk = stream.read(READ_SIZE)
+    if not first_chunk:
+        return None
+
+    with file_lock(file_name), open(file_path, "r+b") as f:
+        before = os.fstat(f.fileno())
+        index = open_index(file_path)
+        summary = get_summary(file_path)
+        rows = load_rollups(rollups_path, file_path)
+        incremental = None not in (index, summary, rows)
+        delta = IndexBuilder(settings.FILES_SORT_MEMORY_LIMIT)
+        builders = [delta]
+        if incremental:
+            summary_builder = SummaryBuilder.from_summary(summary)
+            rollup_builder = RollupBuilder.from_rows(rows)
+            builders += [summary_builder, rollup_builder]
+        try:
+            end = f.seek(0, os.SEEK_END)
+            codec = detect_codec(file_path) if end else None
+            # The appended lines must not run into the last one. The end of
+            # a compressed file's content isn't known without reading it
+            # all, so those always get a line break, at worst a blank line.
+            separator = b""
+            if end:
+                f.seek(end - 1)
+                if codec or f.read(1) != b"\n":
+                    separator = b"\n"
+                f.seek(end)
+
+            lines = LineSplitter()
+            appended = 0
+            writer = compressing_writer(f, codec or "")
+            try:
+                chunks = iter(lambda: stream.read(READ_SIZE), b"")
+                for chunk in itertools.chain([separator, first_chunk], chunks):
+                    writer.write(chunk)
+                    appended += len(chunk)
+                    add_records(builders, lines.feed(chunk))
+                add_records(builders, lines.close())
+                if writer is not f:
+                    # Ends the compressed member; ``f`` stays open.
+                    writer.close()
+                f.flush()
+            except BaseException:
+                f.truncate(end)
+                raise
+            stat = os.fstat(f.fileno())
+
+            if incremental:
+                merge_index(
+                    index,
+                    delta,
+                    os.path.join(index_dir, INDEX_FILE_NAME),
+                    file_path,
+                    stat,
+                )
+                summary_builder.write(
+                    os.path.join(index_dir, SUMMARY_FILE_NAME),
+                    file_path,
+                    stat,
+                )
+                rollup_builder.write(rollups_path, file_path, stat)
+                indexing.remove_statuses(
+                    index_dir, keep=indexing.file_version(stat)
+                )
+        finally:
+            if index is not None:
+                index.close()
+
+        result_cache.invalidate(file_name)
+        record_count = models.F("record_count") + len(delta)
+        rehash = UploadedFile.objects.filter(
+            name=file_name,
+            stored_size=before.st_size,
+            mtime_ns=before.st_mtime_ns,
+        ).update(
+            size=models.F("size") + appended,
+            stored_size=stat.st_size,
+            mtime_ns=stat.st_mtime_ns,
+            record_count=record_count if incremental else None,
+            sha256=None,
+        )
+        if not rehash:
+            # The catalog didn't describe the file appended to, such as
+            # one copied in by hand; describe it from its content.
+            UploadedFile.objects.update_or_create(
+                name=file_name,
+                defaults=catalog_fields(
+                    file_path, *scan_file_contents(file_path)
+                ),
+            )
+
+    if not incremental:
+        index_file(file_name)
+    if rehash:
+        workers = settings.FILES_INDEX_WORKERS
+        indexing.submit_hash(
+            file_path,
+            workers,
+            on_done=partial(
+                set_catalog_field, file_name, "sha256", workers > 0
+            ),
+        )
+    return {
+        "appended_bytes": appended - len(separator),
+        "appended_records": len(delta),
+    }
 
-    return status_code
 
+def preallocate(f, size):
+    """Reserve ``size`` bytes for ``f`` so it's written contiguously."""
+    if size and hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(f.fileno(), 0, size)
+        except OSError:
+            # Not supported by every filesystem; it's only an optimization.
+            pass
 
-def setup_file_paths(file_name, script_name):
+
+def catalog_fields(file_path, size, record_count, sha256):
+    """Catalog fields for a stored file with ``size`` bytes of content."""
+    stat = os.stat(file_path)
+    return {
+        "size": size,
+        "stored_size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "record_count": record_count,
+        "sha256": sha256,
+    }
+
+
+def update_catalog(file_name, fields):
+    """Record the catalog ``fields`` of a file read by ``catalog_fields``.
+
+    Skipped if the file was replaced or appended to since: whatever
+    changed it records the new version.
+    """
+    file_path = os.path.join(settings.MEDIA_ROOT, "uploaded_files", file_name)
+    with file_lock(file_name):
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            return
+        if (stat.st_size, stat.st_mtime_ns) == (
+            fields["stored_size"],
+            fields["mtime_ns"],
+        ):
+            UploadedFile.objects.update_or_create(
+                name=file_name, defaults=fields
+            )
+
+
+def scan_file_contents(file_path):
+    """Return the content size, record count and SHA-256 of a stored file."""
+    lines = LineSplitter()
+    content_hash = hashlib.sha256()
+    size = 0
+    record_count = 0
+    with open_upload(file_path) as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            size += len(chunk)
+            content_hash.update(chunk)
+            for line in lines.feed(chunk):
+                record_count += parse_record(line) is not None
+        for line in lines.close():
+            record_count += parse_record(line) is not None
+    return size, record_count, content_hash.hexdigest()
+
+
+def list_uploaded_files(
+    ordering="name", name_prefix=None, min_size=None, max_size=None
+):
+    """Return the catalog entries matching the filters, lazily.
+
+    Filters and orderings are answered by the name and (size, name)
+    indexes, so paginating the result only reads the requested page.
+    """
+    files = UploadedFile.objects.all()
+    if name_prefix:
+        # A range instead of LIKE, which is case-insensitive in SQLite.
+        files = files.filter(
+            name__gte=name_prefix, name__lt=name_prefix + "\U0010ffff"
+        )
+    if min_size is not None:
+        files = files.filter(size__gte=min_size)
+    if max_size is not None:
+        files = files.filter(size__lte=max_size)
+    if ordering.lstrip("-") == "size":
+        return files.order_by(ordering, ordering.replace("size", "name"))
+    return files.order_by(ordering)
+
+
+def get_index_dir(file_name):
+    return os.path.join(settings.MEDIA_ROOT, "indexes", file_name)
+
+
+def file_lock(file_name):
+    """Hold the lock that serializes changes to an uploaded file."""
+    return indexing.lock(get_index_dir(file_name))
+
+
+def open_index(file_path):
+    """Return the columnar index of an uploaded file, if it is up to date.
+
+    Files written without going through ``save_file``, or replaced since
+    their index was built, return None so callers fall back to a scan.
+    """
+    index_path = os.path.join(
+        get_index_dir(os.path.basename(file_path)), INDEX_FILE_NAME
+    )
+    if not os.path.exists(index_path):
+        return None
+    try:
+        index = ColumnarIndex(index_path)
+    except (OSError, ValueError, struct.error) as e:
+        logging.warning("Ignoring unreadable index %s: %s", index_path, e)
+        return None
+    if not index.is_current(file_path):
+        index.close()
+        return None
+    return index
+
+
+def get_summary(file_path):
+    """Return the ingest summary of an uploaded file, if it is up to date."""
+    return load_summary(
+        os.path.join(
+            get_index_dir(os.path.basename(file_path)), SUMMARY_FILE_NAME
+        ),
+        file_path,
+    )
+
+
+@timed("setup_file_paths")
+def setup_file_paths(file_name, script_name=None):
     logging.info(
         "Received request to get max size data for file: %s", file_name
     )
@@ -42,18 +405,69 @@ def setup_file_paths(file_name, script_name):
             {"error": "File not found."}, status=status.HTTP_404_NOT_FOUND
         )
 
+    if script_name is None:
+        return file_path, None
     script_path = os.path.join(settings.BASE_DIR, "scripts", script_name)
     return file_path, script_path
 
 
-def run_script(script_path, file_path, *args):
+def get_upload_session(session_id):
     try:
-        result = subprocess.run(
-            [script_path, file_path, *args],
-            capture_output=True,
-            text=True,
-            check=True,
+        return UploadSession.objects.get(id=session_id), None
+    except UploadSession.DoesNotExist:
+        logging.error("Upload session not found: %s", session_id)
+        return None, Response(
+            {"error": "Upload session not found."},
+            status=status.HTTP_404_NOT_FOUND,
         )
+
+
+def get_sorted_run(file_path, desc=False, parse=None):
+    """Return the username ordering of a file as a lazily read sorted run.
+
+    The run is produced by a bounded-memory external merge sort the first
+    time it is needed and reused until the file changes. Lines are parsed
+    into records with ``parse`` (``parse_bytes_line`` by default).
+    """
+    parse = parse or parse_bytes_line
+    index_dir = get_index_dir(os.path.basename(file_path))
+    run_path = os.path.join(index_dir, SORTED_RUN_FILE_NAME)
+    try:
+        run = SortedRun(run_path, parse=parse)
+    except (OSError, ValueError, struct.error):
+        run = None
+    if run is not None and not run.is_current(file_path):
+        run = None
+    if run is None:
+        os.makedirs(index_dir, exist_ok=True)
+        with timed("sort"):
+            write_sorted_run(
+                file_path, run_path, settings.FILES_SORT_MEMORY_LIMIT
+            )
+        BYTES_READ.inc(os.path.getsize(file_path), source="scan")
+        run = SortedRun(run_path, parse=parse)
+    return run.reversed() if desc else run
+
+
+def use_parallel_scan(operation, file_size):
+    return (
+        operation in parallel.OPERATIONS
+        and settings.FILES_SCAN_WORKERS > 1
+        and file_size >= settings.FILES_PARALLEL_SCAN_MIN_BYTES
+    )
+
+
+def run_script(script_path, file_path, *args):
+    SUBPROCESSES.inc(script=os.path.basename(script_path))
+    try:
+        with timed("run_script"):
+            result = subprocess.run(
+                [script_path, file_path, *args],
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+        BYTES_READ.inc(len(result.stdout), source="script")
         return result.stdout.strip(), None
     except subprocess.CalledProcessError as e:
         logging.error("Error running script: %s", str(e))
@@ -62,6 +476,213 @@ def run_script(script_path, file_path, *args):
         )
 
 
+def run_query(script_path, file_path, *args):
+    """Answer the query of ``script_path`` and return the parsed records.
+
+    Errors are returned as a response, like ``run_script``.
+    """
+    try:
+        operation, params = engine.parse_command(
+            os.path.basename(script_path), *args
+        )
+    except ValueError as e:
+        logging.error("Error running query engine: %s", str(e))
+        return None, Response(
+            {"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+    return run_operation(
+        file_path, operation, params, script_path=script_path, script_args=args
+    )
+
+
+def run_operation(
+    file_path, operation, params, script_path=None, script_args=()
+):
+    """Run an ``files.engine`` operation and return the parsed records.
+
+    See ``find_records``; when it leaves the query to the shell script, the
+    script is run here and its output parsed and cached.
+    """
+    try:
+        records, cache_key = find_records(
+            file_path, operation, params, script_path
+        )
+        if records is None:
+            output, error_response = run_script(
+                script_path, file_path, *script_args
+            )
+            if error_response:
+                return None, error_response
+            records = cache_script_output(cache_key, output)
+    except (OSError, ValueError) as e:
+        logging.error("Error running query engine: %s", str(e))
+        return None, Response(
+            {"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+    return records, None
+
+
+def find_records(file_path, operation, params, script_path=None):
+    """Answer an operation without running its script, if possible.
+
+    Max/min are read from the file's ingest summary and the other queries
+    from its columnar index when those are up to date; index results are
+    lazy sequences that only materialize the records a page needs.
+    Otherwise the query runs with the configured backend:
+    ``FILES_QUERY_BACKEND = "python"`` (or an operation without a script,
+    or a compressed file, which the scripts can't read) answers in-process
+    instead of forking the script: the username ordering and username
+    searches come from an external merge sort run on disk, other
+    operations from ``files.engine`` with the records kept in
+    ``result_cache``. Files larger than ``FILES_SCRIPT_SORT_MAX_BYTES``
+    are ordered by username from the sorted run with either backend.
+
+    Returns ``(records, cache_key)``, with records None when the script has
+    to run; its output then goes to ``cache_script_output(cache_key, ...)``.
+    """
+    if operation in ("max_size", "min_size"):
+        summary = get_summary(file_path)
+        if summary is not None:
+            record = summary[operation]
+            return [record] if record else [], None
+
+    stat = os.stat(file_path)
+    cache_key = (
+        os.path.basename(file_path),
+        stat.st_size,
+        stat.st_mtime_ns,
+        operation,
+        params,
+    )
+
+    index = open_index(file_path)
+    if index is not None:
+        if operation not in ("between_msgs", "between_size"):
+            return getattr(index, operation)(*params), cache_key
+        # Only the matching record numbers are cached; pages are read from
+        # the index on demand.
+        positions_key = (*cache_key[:3], f"{operation}_positions", params)
+        positions = result_cache.get(positions_key)
+        if positions is None:
+            positions = getattr(index, f"{operation}_positions")(*params)
+            result_cache.set(positions_key, positions)
+        return RecordSequence(index, positions), cache_key
+
+    compressed = is_compressed(file_path)
+    in_process = (
+        settings.FILES_QUERY_BACKEND == "python"
+        or not script_path
+        or compressed
+    )
+    # The script's output is loaded whole, so large files are sorted on
+    # disk whatever the backend.
+    if operation == "order_by_username" and (
+        in_process or stat.st_size > settings.FILES_SCRIPT_SORT_MAX_BYTES
+    ):
+        return get_sorted_run(file_path, *params), cache_key
+    # Username searches have no script; the sorted run is binary searched.
+    if operation == "username_prefix":
+        prefix, desc = params
+        return (
+            get_sorted_run(file_path, desc).username_lines(
+                prefix, prefix=True
+            ),
+            cache_key,
+        )
+    if operation == "find_username":
+        (username,) = params
+        return (
+            get_sorted_run(file_path).username_lines(username),
+            cache_key,
+        )
+
+    records = result_cache.get(cache_key)
+    if records is not None or not in_process:
+        return records, cache_key
+
+    # Workers split the file by byte offset, which needs the plain file.
+    if not compressed and use_parallel_scan(operation, stat.st_size):
+        lines = parallel.scan(
+            file_path, operation, params, settings.FILES_SCAN_WORKERS
+        )
+    else:
+        lines = engine.OPERATIONS[operation](file_path, *params)
+    BYTES_READ.inc(stat.st_size, source="scan")
+    with timed("parse_lines"):
+        records = [parse_line(line) for line in lines if line.strip()]
+    RECORDS_PARSED.inc(len(records))
+    result_cache.set(cache_key, records)
+    return records, cache_key
+
+
+def get_rollups(file_path, by):
+    """Return the file's totals grouped by domain, folder or both.
+
+    Read from the rollups stored at upload; files ingested before them are
+    scanned once and the result kept in ``result_cache``.
+    """
+    try:
+        rows = load_rollups(
+            os.path.join(
+                get_index_dir(os.path.basename(file_path)), ROLLUPS_FILE_NAME
+            ),
+            file_path,
+        )
+        if rows is None:
+            stat = os.stat(file_path)
+            cache_key = (
+                os.path.basename(file_path),
+                stat.st_size,
+                stat.st_mtime_ns,
+                "rollups",
+                (),
+            )
+            rows = result_cache.get(cache_key)
+            if rows is None:
+                rows = build_rollups(file_path)
+                result_cache.set(cache_key, rows)
+    except (OSError, ValueError) as e:
+        logging.error("Error computing rollups: %s", str(e))
+        return None, Response(
+            {"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+    return group_rows(rows, by), None
+
+
+def get_file_stats(file_path, bins):
+    """Return the statistics of a file, computed once per file version."""
+    try:
+        stat = os.stat(file_path)
+        cache_key = (
+            os.path.basename(file_path),
+            stat.st_size,
+            stat.st_mtime_ns,
+            "stats",
+            (bins,),
+        )
+        stats = result_cache.get(cache_key)
+        if stats is None:
+            stats = file_stats(file_path, bins, open_index(file_path))
+            if stats is not None:
+                result_cache.set(cache_key, stats)
+    except (OSError, ValueError) as e:
+        logging.error("Error computing file statistics: %s", str(e))
+        return None, Response(
+            {"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+    return stats, None
+
+
+def cache_script_output(cache_key, output):
+    with timed("parse_lines"):
+        records = [
+            parse_line(line) for line in output.split("\n") if line.strip()
+        ]
+    RECORDS_PARSED.inc(len(records))
+    result_cache.set(cache_key, records)
+    return records
+
+
 def parse_line(line):
     parts = line.split()
     return {
@@ -70,3 +691,7 @@ def parse_line(line):
         "numberMessages": int(parts[2]),
         "size": int(parts[4]),
     }
+
+
+def parse_bytes_line(line):
+    return parse_line(line.decode("utf-8", "replace"))
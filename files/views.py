@@ -1,17 +1,48 @@
+import io
 import logging
 import os
 
 from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
 from rest_framework import status
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from .pagination import CustomPagination
-from .serializers import FileListSerializer, FileUploadSerializer
+from . import metrics, uploads
+from .batch import run_batch
+from .cache import result_cache
+from .conditional import conditional_query
+from .export import (
+    CONTENT_TYPES,
+    ENCODERS,
+    IgnoreClientContentNegotiation,
+    iter_records,
+)
+from .models import UploadSession
+from .pagination import CustomPagination, UsernameCursorPagination
+from .profiling import get_profile_path, list_profiles
+from .serializers import (
+    BatchQuerySerializer,
+    ExportQuerySerializer,
+    FileListQuerySerializer,
+    FileListSerializer,
+    FileUploadSerializer,
+    GroupByQuerySerializer,
+    StatsQuerySerializer,
+    TopQuerySerializer,
+    UploadSessionSerializer,
+)
 from .utils import (
+    append_file,
+    get_file_stats,
+    get_index_status,
+    get_rollups,
+    get_upload_session,
     is_valid_file_name,
-    parse_line,
-    run_script,
+    list_uploaded_files,
+    run_operation,
+    run_query,
     save_file,
     setup_file_paths,
 )
@@ -40,21 +71,139 @@ class FileUploadView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class UploadSessionView(APIView):
+    def post(self, request):
+        serializer = UploadSessionSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                serializer.errors, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        fields = serializer.validated_data
+        fields.setdefault("chunk_size", settings.FILES_UPLOAD_CHUNK_SIZE)
+        session = UploadSession.objects.create(**fields)
+        return Response(
+            UploadSessionSerializer(session).data,
+            status=status.HTTP_201_CREATED,
+        )
+
+
+class UploadSessionDetailView(APIView):
+    def get(self, request, session_id):
+        session, error_response = get_upload_session(session_id)
+        if session is None:
+            return error_response
+
+        return Response(
+            UploadSessionSerializer(session).data, status=status.HTTP_200_OK
+        )
+
+
+class UploadChunkView(APIView):
+    def put(self, request, session_id, number):
+        session, error_response = get_upload_session(session_id)
+        if session is None:
+            return error_response
+
+        if session.committing:
+            return Response(
+                {"error": "Upload is already being committed."},
+                status=status.HTTP_409_CONFLICT,
+            )
+        if number >= session.chunk_count:
+            return Response(
+                {"error": f"Chunk {number} is out of range."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        sha256 = request.headers.get("X-Chunk-SHA256")
+        if not sha256:
+            return Response(
+                {"error": "Missing X-Chunk-SHA256 header."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        # The body is read straight from the request, without parsing.
+        stream = request.stream or io.BytesIO()
+        try:
+            uploads.write_chunk(session, number, stream, sha256)
+        except ValueError as e:
+            logging.error("Rejected upload chunk: %s", str(e))
+            return Response(
+                {"error": str(e)}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class UploadCommitView(APIView):
+    def post(self, request, session_id):
+        session, error_response = get_upload_session(session_id)
+        if session is None:
+            return error_response
+
+        missing = uploads.missing_chunks(session)
+        if missing:
+            return Response(
+                {"error": "Upload is incomplete.", "missing_chunks": missing},
+                status=status.HTTP_409_CONFLICT,
+            )
+        if not uploads.claim_session(session):
+            return Response(
+                {"error": "Upload is already being committed."},
+                status=status.HTTP_409_CONFLICT,
+            )
+
+        try:
+            status_code = save_file(
+                uploads.AssembledUpload(session), session.file_name
+            )
+        except BaseException:
+            uploads.release_session(session)
+            raise
+        uploads.delete_chunks(session)
+        session.delete()
+
+        return Response(status=status_code)
+
+
+class FileAppendView(APIView):
+    def post(self, request, file_name):
+        if not is_valid_file_name(file_name):
+            return Response(
+                {"error": "File name has invalid characters."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        file_path, error_response = setup_file_paths(file_name)
+        if file_path is None:
+            return error_response
+
+        # The body is read straight from the request, without parsing.
+        stream = request.stream or io.BytesIO()
+        try:
+            appended = append_file(stream, file_name)
+        except OSError as e:
+            logging.error("Error appending to %s: %s", file_name, str(e))
+            return Response(
+                {"error": "Could not append to the file."},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+        if appended is None:
+            return Response(
+                {"error": "Nothing to append."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        return Response(appended, status=status.HTTP_200_OK)
+
+    patch = post
+
+
 class FileListView(APIView):
     def get(self, request):
-        upload_dir = os.path.join(settings.MEDIA_ROOT, "uploaded_files")
-        files = []
-
-        if os.path.exists(upload_dir):
-            for file_name in os.listdir(upload_dir):
-                file_path = os.path.join(upload_dir, file_name)
-                if os.path.isfile(file_path):
-                    files.append(
-                        {
-                            "file_name": file_name,
-                            "file_size": os.path.getsize(file_path),
-                        }
-                    )
+        query = FileListQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+        files = list_uploaded_files(**query.validated_data)
 
         paginator = CustomPagination()
         paginated_files = paginator.paginate_queryset(files, request)
@@ -63,17 +212,18 @@ class FileListView(APIView):
 
 
 class UserMaxSizeView(APIView):
+    @conditional_query
     def get(self, request, file_name):
         file_path, script_path = setup_file_paths(file_name, "max-min-size.sh")
         if file_path is None:
             return script_path
 
-        line, error_response = run_script(script_path, file_path)
+        records, error_response = run_query(script_path, file_path)
         if error_response:
             return error_response
 
-        if line:
-            data = parse_line(line)
+        if records:
+            data = records[0]
             logging.info("Successfully parsed line: %s", data)
             return Response(data, status=status.HTTP_200_OK)
         else:
@@ -85,17 +235,18 @@ class UserMaxSizeView(APIView):
 
 
 class UserMinSizeView(APIView):
+    @conditional_query
     def get(self, request, file_name):
         file_path, script_path = setup_file_paths(file_name, "max-min-size.sh")
         if file_path is None:
             return script_path
 
-        line, error_response = run_script(script_path, file_path, "-min")
+        records, error_response = run_query(script_path, file_path, "-min")
         if error_response:
             return error_response
 
-        if line:
-            data = parse_line(line)
+        if records:
+            data = records[0]
             logging.info("Successfully parsed line: %s", data)
             return Response(data, status=status.HTTP_200_OK)
         else:
@@ -107,6 +258,7 @@ class UserMinSizeView(APIView):
 
 
 class UserListView(APIView):
+    @conditional_query
     def get(self, request, file_name):
         file_path, script_path = setup_file_paths(
             file_name, "order-by-username.sh"
@@ -114,16 +266,22 @@ class UserListView(APIView):
         if file_path is None:
             return script_path
 
-        lines, error_response = run_script(script_path, file_path)
+        prefix = request.query_params.get("prefix")
+        if prefix:
+            records, error_response = run_operation(
+                file_path, "username_prefix", (prefix, False)
+            )
+        else:
+            records, error_response = run_query(script_path, file_path)
         if error_response:
             return error_response
 
-        if lines:
-            data = [
-                parse_line(line) for line in lines.split("\n") if line.strip()
-            ]
-            paginator = CustomPagination()
-            paginated_data = paginator.paginate_queryset(data, request)
+        if records:
+            if UsernameCursorPagination.is_requested(request):
+                paginator = UsernameCursorPagination()
+            else:
+                paginator = CustomPagination()
+            paginated_data = paginator.paginate_queryset(records, request)
             logging.info("Successfully parsed lines: %s", paginated_data)
             return paginator.get_paginated_response(paginated_data)
         else:
@@ -135,6 +293,7 @@ class UserListView(APIView):
 
 
 class UserListDescView(APIView):
+    @conditional_query
     def get(self, request, file_name):
         file_path, script_path = setup_file_paths(
             file_name, "order-by-username.sh"
@@ -142,16 +301,24 @@ class UserListDescView(APIView):
         if file_path is None:
             return script_path
 
-        lines, error_response = run_script(script_path, file_path, "-desc")
+        prefix = request.query_params.get("prefix")
+        if prefix:
+            records, error_response = run_operation(
+                file_path, "username_prefix", (prefix, True)
+            )
+        else:
+            records, error_response = run_query(
+                script_path, file_path, "-desc"
+            )
         if error_response:
             return error_response
 
-        if lines:
-            data = [
-                parse_line(line) for line in lines.split("\n") if line.strip()
-            ]
-            paginator = CustomPagination()
-            paginated_data = paginator.paginate_queryset(data, request)
+        if records:
+            if UsernameCursorPagination.is_requested(request):
+                paginator = UsernameCursorPagination(descending=True)
+            else:
+                paginator = CustomPagination()
+            paginated_data = paginator.paginate_queryset(records, request)
             logging.info("Successfully parsed lines: %s", paginated_data)
             return paginator.get_paginated_response(paginated_data)
         else:
@@ -162,24 +329,73 @@ class UserListDescView(APIView):
             )
 
 
+class UserLookupView(APIView):
+    @conditional_query
+    def get(self, request, file_name, username):
+        file_path, error_response = setup_file_paths(file_name)
+        if file_path is None:
+            return error_response
+
+        records, error_response = run_operation(
+            file_path, "find_username", (username,)
+        )
+        if error_response:
+            return error_response
+
+        if records:
+            data = records[:]
+            logging.info("Successfully parsed lines: %s", data)
+            return Response({"results": data}, status=status.HTTP_200_OK)
+        else:
+            logging.error("User %s not found in file: %s", username, file_path)
+            return Response(
+                {"error": "User not found."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+
+
 class UserRangeMessagesView(APIView):
+    @conditional_query
     def get(self, request, file_name, min_msgs, max_msgs):
         file_path, script_path = setup_file_paths(file_name, "between-msgs.sh")
         if file_path is None:
             return script_path
 
-        lines, error_response = run_script(
+        records, error_response = run_query(
             script_path, file_path, str(min_msgs), str(max_msgs)
         )
         if error_response:
             return error_response
 
-        if lines:
-            data = [
-                parse_line(line) for line in lines.split("\n") if line.strip()
-            ]
+        if records:
+            paginator = CustomPagination()
+            paginated_data = paginator.paginate_queryset(records, request)
+            logging.info("Successfully parsed lines: %s", paginated_data)
+            return paginator.get_paginated_response(paginated_data)
+        else:
+            logging.error("No data found in file: %s", file_path)
+            return Response(
+                {"error": "No data found in file."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+
+
+class UserRangeSizeView(APIView):
+    @conditional_query
+    def get(self, request, file_name, min_size, max_size):
+        file_path, error_response = setup_file_paths(file_name)
+        if file_path is None:
+            return error_response
+
+        records, error_response = run_operation(
+            file_path, "between_size", (min_size, max_size)
+        )
+        if error_response:
+            return error_response
+
+        if records:
             paginator = CustomPagination()
-            paginated_data = paginator.paginate_queryset(data, request)
+            paginated_data = paginator.paginate_queryset(records, request)
             logging.info("Successfully parsed lines: %s", paginated_data)
             return paginator.get_paginated_response(paginated_data)
         else:
@@ -188,3 +404,209 @@ class UserRangeMessagesView(APIView):
                 {"error": "No data found in file."},
                 status=status.HTTP_404_NOT_FOUND,
             )
+
+
+class TopRecordsView(APIView):
+    @conditional_query
+    def get(self, request, file_name):
+        query = TopQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        file_path, error_response = setup_file_paths(file_name)
+        if file_path is None:
+            return error_response
+
+        field = "messages" if query.validated_data["by"] == "inbox" else "size"
+        records, error_response = run_operation(
+            file_path,
+            "top",
+            (
+                field,
+                query.validated_data["k"],
+                query.validated_data["order"] == "desc",
+            ),
+        )
+        if error_response:
+            return error_response
+
+        if records:
+            data = records[:]
+            logging.info("Successfully parsed lines: %s", data)
+            return Response({"results": data}, status=status.HTTP_200_OK)
+        else:
+            logging.error("No data found in file: %s", file_path)
+            return Response(
+                {"error": "No data found in file."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+
+
+class BatchQueryView(APIView):
+    def post(self, request, file_name):
+        query = BatchQuerySerializer(data=request.data)
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        file_path, error_response = setup_file_paths(file_name)
+        if file_path is None:
+            return error_response
+
+        answers, error_response = run_batch(
+            file_path, query.validated_data["operations"]
+        )
+        if error_response:
+            return error_response
+
+        logging.info(
+            "Batch query timings: %s",
+            [
+                (answer["op"], answer["time_ms"])
+                for answer in answers["results"]
+            ],
+        )
+        return Response(answers, status=status.HTTP_200_OK)
+
+
+class ExportView(APIView):
+    content_negotiation_class = IgnoreClientContentNegotiation
+
+    @conditional_query
+    def get(self, request, file_name):
+        query = ExportQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        file_path, error_response = setup_file_paths(file_name)
+        if file_path is None:
+            return error_response
+
+        export_format = query.validated_data["format"]
+        try:
+            records = iter_records(
+                file_path,
+                desc=query.validated_data["order"] == "desc",
+                min_msgs=query.validated_data.get("min_msgs"),
+                max_msgs=query.validated_data.get("max_msgs"),
+            )
+        except (OSError, ValueError) as e:
+            logging.error("Error exporting file: %s", str(e))
+            return Response(
+                {"error": str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+
+        response = StreamingHttpResponse(
+            ENCODERS[export_format](records),
+            content_type=CONTENT_TYPES[export_format],
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="{file_name}.{export_format}"'
+        )
+        return response
+
+
+class FileStatsView(APIView):
+    @conditional_query
+    def get(self, request, file_name):
+        query = StatsQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        file_path, error_response = setup_file_paths(file_name)
+        if file_path is None:
+            return error_response
+
+        stats, error_response = get_file_stats(
+            file_path, query.validated_data["bins"]
+        )
+        if error_response:
+            return error_response
+
+        if stats:
+            return Response(stats, status=status.HTTP_200_OK)
+        else:
+            logging.error("No data found in file: %s", file_path)
+            return Response(
+                {"error": "No data found in file."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+
+
+class GroupByView(APIView):
+    @conditional_query
+    def get(self, request, file_name):
+        query = GroupByQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        file_path, error_response = setup_file_paths(file_name)
+        if file_path is None:
+            return error_response
+
+        groups, error_response = get_rollups(
+            file_path, query.validated_data["by"]
+        )
+        if error_response:
+            return error_response
+
+        if groups:
+            paginator = CustomPagination()
+            paginated_data = paginator.paginate_queryset(groups, request)
+            return paginator.get_paginated_response(paginated_data)
+        else:
+            logging.error("No data found in file: %s", file_path)
+            return Response(
+                {"error": "No data found in file."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+
+
+class IndexStatusView(APIView):
+    def get(self, request, file_name):
+        file_path, error_response = setup_file_paths(file_name)
+        if file_path is None:
+            return error_response
+
+        return Response(
+            {"file_name": file_name, **get_index_status(file_path)},
+            status=status.HTTP_200_OK,
+        )
+
+
+class ResultCacheStatsView(APIView):
+    def get(self, request):
+        return Response(result_cache.stats(), status=status.HTTP_200_OK)
+
+
+class MetricsView(APIView):
+    # Scrapers ask for text/plain, which no DRF renderer offers.
+    content_negotiation_class = IgnoreClientContentNegotiation
+
+    def get(self, request):
+        return HttpResponse(
+            metrics.exposition(), content_type=metrics.CONTENT_TYPE
+        )
+
+
+class ProfileListView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(list_profiles(), status=status.HTTP_200_OK)
+
+
+class ProfileDownloadView(APIView):
+    permission_classes = [IsAdminUser]
+    content_negotiation_class = IgnoreClientContentNegotiation
+
+    def get(self, request, profile_name):
+        profile_path = get_profile_path(profile_name)
+        if profile_path is None or not os.path.isfile(profile_path):
+            return Response(
+                {"error": "Profile not found."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        return FileResponse(
+            open(profile_path, "rb"), as_attachment=True, filename=profile_name
+        )
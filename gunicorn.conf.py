@@ -0,0 +1,13 @@
+"""Gunicorn settings shared by every way of starting the server."""
+
+import os
+import shutil
+
+
+def on_starting(server):
+    # Each worker writes its metrics to FILES_METRICS_DIR; values left by a
+    # previous run of the server must not be added to the new totals.
+    metrics_dir = os.getenv("FILES_METRICS_DIR")
+    if metrics_dir:
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+        os.makedirs(metrics_dir)
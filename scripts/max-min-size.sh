@@ -5,39 +5,28 @@ find_size_line() {
 	local file="$1"
 	local mode="$2"
 
-	# Initialize variables
-	local size=0
-	local line=""
-	local size_line=""
-
-	# Set initial value based on mode
-	if [ "$mode" == "max" ]; then
-		size=0
-	elif [ "$mode" == "min" ]; then
-		size=999999999
-	fi
-
 	# Use awk to process the file
-	awk -v mode="$mode" -v size="$size" '
+	awk -v mode="$mode" '
   {
-    # Extract the size value from the line
-    match($0, /size [0-9]+/)
-    line_size = substr($0, RSTART + 5, RLENGTH - 5)
-
-    if (mode == "max") {
-      if (line_size > size) {
-        size = line_size
-        size_line = $0
-      }
-    } else if (mode == "min") {
-      if (line_size < size) {
-        size = line_size
-        size_line = $0
-      }
+    # Skip lines without a size, such as blank ones
+    if (!match($0, /size [0-9]+/)) {
+      next
+    }
+    # Adding 0 compares sizes as numbers, with or without zero padding
+    line_size = substr($0, RSTART + 5, RLENGTH - 5) + 0
+
+    # Strict comparisons keep the first line on ties
+    if (!found || (mode == "max" && line_size > size) ||
+        (mode == "min" && line_size < size)) {
+      found = 1
+      size = line_size
+      size_line = $0
     }
   }
   END {
-    print size_line
+    if (found) {
+      print size_line
+    }
   }
   ' "$file"
 }
@@ -12,11 +12,14 @@ if [ ! -f "$1" ]; then
 	exit 1
 fi
 
-# Check if the second parameter is provided and set the sort order accordingly
+# Check if the second parameter is provided and set the sort order accordingly.
+# Sorts by username and folder, then by message count and size as numbers,
+# like the columnar index; ties fall back to the whole line, compared byte
+# by byte.
 if [ -z "$2" ]; then
-	sort "$1"
+	LC_ALL=C sort -k1,1 -k2,2b -k3,3n -k5,5n "$1"
 elif [ "$2" == "-desc" ]; then
-	sort -r "$1"
+	LC_ALL=C sort -r -k1,1r -k2,2br -k3,3nr -k5,5nr "$1"
 else
 	echo "Invalid parameter. Use -desc to get the reverse order or no parameter to get the normal order."
 	exit 1